@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ClrsiteConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'clrSite'
+
+    def ready(self):
+        from libraryApp.jobs import register
+
+        register('site_images', 'clrSite.images.build_stale_images')  # Single job, object_id 0
@@ -0,0 +1,48 @@
+"""Header and footer data for every clrSite page.
+
+Added by SiteChromeMixin (views.py) rather than a global context processor,
+so admin and libraryApp renders do not pay for it. The chrome (contact details, logo, footer services, social links) is loaded
+once per process and kept in memory. Admin saves bump a shared version in the
+cache (see models.py), and each process compares its copy against that
+version at most every VERSION_CHECK_INTERVAL seconds. In steady state a page
+render loads no chrome rows; the version check is one cache read per interval
+(an SQL query with the default database cache, see CACHES in settings).
+"""
+import threading
+import time
+
+from .snapshots import chrome_version
+
+VERSION_CHECK_INTERVAL = 5  # Seconds another worker may keep showing chrome that was just edited
+
+_lock = threading.Lock()
+_chrome = {'version': None, 'checked_at': 0.0, 'context': None}
+
+
+def _load_chrome():
+    from .models import ContactInfo, Services, SocialMediaLink, WebsiteLogo
+
+    return {
+        'contact_info': ContactInfo.objects.first(),
+        'logo': WebsiteLogo.objects.first(),
+        'services_list': list(Services.objects.all()[:5]),  # For Footer
+        'social_links': list(SocialMediaLink.objects.all()),
+    }
+
+
+def forget_chrome():
+    """Drop this process's copy, e.g. right after the admin saved a change here."""
+    _chrome['context'] = None
+
+
+def site_chrome():
+    now = time.monotonic()
+    if _chrome['context'] is not None and now - _chrome['checked_at'] < VERSION_CHECK_INTERVAL:
+        return _chrome['context']
+    with _lock:
+        version = chrome_version()
+        if _chrome['context'] is None or _chrome['version'] != version:
+            _chrome['context'] = _load_chrome()
+            _chrome['version'] = version
+        _chrome['checked_at'] = now
+    return _chrome['context']
@@ -0,0 +1,64 @@
+"""Resized WebP copies and blur placeholders for the CMS images.
+
+Built with the same machinery as book covers (libraryApp/images.py) and
+recorded in each row's ``image_variants``. An upload queues the single
+``site_images`` job, which catches up every row in IMAGE_FIELDS whose
+image has no current derivatives. ``{% responsive_image %}`` (templatetags/
+images.py) emits them as ``srcset``.
+
+An image that cannot be processed (a corrupt or unsupported upload) is
+logged and marked with an ``error`` in its ``image_variants``. It is not
+retried until it is replaced, and it is shown as the original upload.
+"""
+import logging
+
+from libraryApp.images import build_variants
+
+logger = logging.getLogger(__name__)
+
+# Hero images fill the screen; everything else is a card or column at most half as wide
+WIDTHS = (320, 640, 960, 1280)
+HERO_WIDTHS = (640, 1280, 1920, 2560)
+FORMATS = ('WEBP',)
+
+
+def _widths(model):
+    from .models import HeroImages
+
+    return HERO_WIDTHS if model is HeroImages else WIDTHS
+
+
+def stale_images(models=None):
+    """``(model, pk)`` for every row whose image has changed since its derivatives were built."""
+    from .models import IMAGE_FIELDS
+
+    for model in models or IMAGE_FIELDS:
+        field_name = IMAGE_FIELDS[model]
+        for pk, name, variants in model.objects.values_list('pk', field_name, 'image_variants').order_by('pk'):
+            if (name or '') != variants.get('source', ''):
+                yield model, pk
+
+
+def build_image_variants(model, pk, force=False):
+    """Generate derivatives for one row. Returns the number of files written, or None if already current."""
+    from .models import IMAGE_FIELDS
+
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return None  # Deleted since it was listed
+    return build_variants(instance, IMAGE_FIELDS[model], 'image_variants', _widths(model), FORMATS, force=force)
+
+
+def build_stale_images(_):
+    from .models import IMAGE_FIELDS
+
+    for model, pk in list(stale_images()):
+        try:
+            build_image_variants(model, pk)
+        except Exception as e:
+            logger.exception("Building image variants for %s %s failed", model._meta.label_lower, pk)
+            row = model.objects.filter(pk=pk).values(IMAGE_FIELDS[model], 'image_variants').first()
+            if row is not None:
+                # Old derivatives stay listed so a rebuild still deletes them; update() queues no job
+                variants = {**row['image_variants'], 'source': row[IMAGE_FIELDS[model]] or '', 'error': str(e)}
+                model.objects.filter(pk=pk).update(image_variants=variants)
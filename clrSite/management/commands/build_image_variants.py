@@ -0,0 +1,51 @@
+from functools import partial
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from clrSite.images import build_image_variants, stale_images
+from clrSite.models import IMAGE_FIELDS
+from libraryApp.parallel import run_batch
+
+
+def _build(force, item):
+    """Build one row's derivatives. Returns the file count, or None if they were current."""
+    label, pk = item
+    return build_image_variants(apps.get_model(label), pk, force=force)
+
+
+def _name(item):
+    return '{} {}'.format(*item)
+
+
+class Command(BaseCommand):
+    help = 'Generate resized WebP images and blur placeholders for the clrSite CMS images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Number of worker processes')
+        parser.add_argument('--force', action='store_true', help='Rebuild derivatives even if the image is unchanged')
+        parser.add_argument('--model', action='append', choices=sorted(m._meta.label_lower for m in IMAGE_FIELDS),
+                            help='Only this model (repeatable)')
+
+    def handle(self, *args, **options):
+        models = [apps.get_model(label) for label in options['model'] or ()] or list(IMAGE_FIELDS)
+        if options['force']:
+            items = [
+                (model._meta.label_lower, pk)
+                for model in models
+                for pk in model.objects.exclude(**{IMAGE_FIELDS[model]: ''})
+                .exclude(**{f"{IMAGE_FIELDS[model]}__isnull": True}).values_list('pk', flat=True)
+            ]
+        else:
+            items = [(model._meta.label_lower, pk) for model, pk in stale_images(models)]
+        self.stdout.write(f"Found {len(items)} images to build")
+
+        result = run_batch(
+            self, partial(_build, options['force']), items, options['workers'],
+            name=_name, failed='error building images', done='wrote {} images',
+        )
+
+        self.stdout.write(
+            f"\nBuilt {result.done}, skipped {result.skipped}, failed {len(result.failures)} "
+            f"({result.count} images) in {result.elapsed:.1f}s"
+        )
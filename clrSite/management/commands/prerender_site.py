@@ -0,0 +1,92 @@
+import gzip
+import json
+import os
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.test import RequestFactory
+from django.urls import resolve
+
+from clrSite.pagecache import page_fingerprint, tag_versions
+from clrSite.prerender import MANIFEST_NAME, PAGES_DIR, page_file, prerenderable_pages, read_manifest
+from libraryApp.filecache import write_atomic
+
+
+class Command(BaseCommand):
+    help = 'Render the public clrSite pages to static HTML, re-rendering only pages whose content changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Re-render every page')
+        parser.add_argument('--watch', type=float, metavar='SECONDS',
+                            help='Keep running, checking for changed pages every SECONDS')
+
+    def handle(self, *args, **options):
+        self.root = settings.PRERENDER_ROOT
+        if not options['watch']:
+            self.prerender(options['force'])
+            return
+
+        force = options['force']
+        while True:
+            close_old_connections()
+            try:
+                self.prerender(force)
+                force = False
+            except Exception as e:  # The pages fall back to Django meanwhile; try again next round
+                self.stderr.write(self.style.ERROR(f"Pre-rendering failed: {e}"))
+            time.sleep(options['watch'])
+
+    def prerender(self, force=False):
+        previous = read_manifest(self.root)
+        manifest = {}
+        rendered = 0
+        for path, tags in prerenderable_pages().items():
+            # Versions read before rendering, so an edit made meanwhile leaves the page stale rather than wrong
+            versions = tag_versions(tags)
+            fingerprint = page_fingerprint(path, versions)
+            entry = previous.get(path)
+            if not force and entry and entry['fingerprint'] == fingerprint and \
+                    os.path.exists(os.path.join(self.root, entry['file'])):
+                manifest[path] = entry
+                continue
+
+            content = self.render(path)
+            filename = os.path.join(self.root, page_file(fingerprint))
+            write_atomic(filename + '.gz', gzip.compress(content, mtime=0))
+            write_atomic(filename, content)  # Last, so a page never exists without its compressed copy
+            manifest[path] = {
+                'fingerprint': fingerprint,
+                'file': page_file(fingerprint),
+                'last_modified': max(versions) // 1000,
+            }
+            rendered += 1
+            self.stdout.write(f"Rendered {path}")
+
+        if manifest != previous:
+            write_atomic(os.path.join(self.root, MANIFEST_NAME), json.dumps(manifest, indent=2).encode())
+        self._remove_unused(previous, manifest)
+        if rendered:
+            self.stdout.write(self.style.SUCCESS(f"{rendered} of {len(manifest)} pages rendered"))
+
+    def render(self, path):
+        """Render ``path`` as an anonymous visitor would see it."""
+        request = RequestFactory().get(path)
+        request.user = AnonymousUser()
+        match = resolve(path)
+        response = match.func(request, *match.args, **match.kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        if response.status_code != 200:
+            raise CommandError(f"{path} answered {response.status_code}")
+        return response.content
+
+    def _remove_unused(self, previous, manifest):
+        # Files from the previous run stay: other processes serve them until they re-read the manifest
+        keep = {os.path.basename(entry['file']) for entry in (*previous.values(), *manifest.values())}
+        directory = os.path.join(self.root, PAGES_DIR)
+        for name in os.listdir(directory) if os.path.isdir(directory) else ():
+            if not name.endswith('.part') and name.removesuffix('.gz') not in keep:
+                os.remove(os.path.join(directory, name))
@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from cloudinary.models import CloudinaryField
 from django.core.validators import FileExtensionValidator
 from django.forms import ValidationError
@@ -6,6 +8,10 @@ from django.utils import timezone
 from ckeditor_uploader.fields import RichTextUploadingField
 from embed_video.fields import EmbedVideoField
 
+from .chrome import forget_chrome
+from .pagecache import purge_tag
+from .snapshots import bump_chrome_version, bump_home_version
+
 
 # Create your models here.
 class WebsiteLogo(models.Model):
@@ -80,6 +86,7 @@ class HeroImages(models.Model):
     hero_title=models.CharField(max_length=100)
     hero_paragraph = RichTextUploadingField(blank=True, null=True)
     submitted_at = models.DateTimeField(auto_now_add=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)  # Resized copies, see images.py
     
     def __str__(self):
         return f"Hero Image {self.hero_title}"
@@ -114,6 +121,7 @@ class ProjectImage(models.Model):
     caption = models.CharField(max_length=255, blank=True, null=True)
     order = models.PositiveIntegerField(default=0)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)  # Resized copies, see images.py
 
     class Meta:
         ordering = ['order', 'uploaded_at']
@@ -156,6 +164,7 @@ class Our_Mission_Vision_Statement(models.Model):
     slogan=models.TextField(max_length=250, blank=True, null=True)
     year_founded_est = models.DateTimeField(blank=True, null=True, validators=[past_datetime_validator])  # Apply the custom validator
     date = models.DateTimeField(auto_now_add=True)  # Updated for date
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)  # Resized copies, see images.py
     
     def __str__(self):
         return "Mission And Vision Statement"
@@ -167,6 +176,7 @@ class Services(models.Model):
     description = RichTextUploadingField()  # Detailed information about the project
     date = models.DateTimeField(auto_now_add=True)  # Updated for date
     image = models.ImageField(upload_to='services/images/', blank=True) 
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)  # Resized copies, see images.py
     
     def __str__(self):
         return f"{self.group.name if self.group else 'No Group'} - {self.title}"
@@ -189,6 +199,7 @@ class Team(models.Model):
     title = models.CharField(max_length=100, blank=True, null=True)
     bio = RichTextUploadingField(blank=True, null=True)
     created = models.DateTimeField(default=timezone.now)  # Use default=timezone.now() for current date
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)  # Resized copies, see images.py
 
     def __str__(self):
         return self.fullname
@@ -259,6 +270,7 @@ class PartnersAndSponsors(models.Model):
     name = models.CharField(max_length=255)
     link = models.URLField(blank=True, null=True)
     date = models.DateTimeField(auto_now_add=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)  # Resized copies, see images.py
     
     def __str__(self):
         return self.name
@@ -295,6 +307,7 @@ class Gallery(models.Model):
     validators=[FileExtensionValidator(['jpg', 'jpeg', 'png', 'gif'])], 
     unique=True, blank=True, null=True)
     when = models.DateTimeField(blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)  # Resized copies, see images.py
     
     def __str__(self):
         return f"Gallery Image {self.pk}"
@@ -404,3 +417,55 @@ class CompanyHighlight(models.Model):
 
     def __str__(self):
         return self.text
+
+
+# Models whose rows appear in the body of the homepage. Any change to one of them
+# makes the cached homepage snapshot stale (see snapshots.py)
+HOME_MODELS = (
+    HeroImages, Services, Projects, Stat, TestimonyAndSayings, Team, PartnersAndSponsors, BlogNews_Updates,
+    Our_Mission_Vision_Statement, CompanyHighlight,
+)
+# Models shown in the header and footer of every page (see chrome.py)
+CHROME_MODELS = (ContactInfo, WebsiteLogo, Services, SocialMediaLink)
+# Models with resized copies of their image, and which field holds it (see images.py)
+IMAGE_FIELDS = {
+    HeroImages: 'image', Services: 'image', ProjectImage: 'image', Team: 'image', PartnersAndSponsors: 'logo',
+    Gallery: 'image', Our_Mission_Vision_Statement: 'image',
+}
+
+
+def invalidate_home_snapshot(sender, **kwargs):
+    bump_home_version()
+
+
+def invalidate_site_chrome(sender, **kwargs):
+    bump_chrome_version()
+    transaction.on_commit(forget_chrome)  # Other processes follow within VERSION_CHECK_INTERVAL
+
+
+def queue_image_variants(sender, instance, update_fields=None, **kwargs):
+    field_name = IMAGE_FIELDS[sender]
+    if update_fields is not None and field_name not in update_fields:
+        return
+    if (getattr(instance, field_name).name or '') != instance.image_variants.get('source', ''):
+        from libraryApp.jobs import enqueue
+        enqueue('site_images', 0)
+
+
+for _model in HOME_MODELS:
+    post_save.connect(invalidate_home_snapshot, sender=_model)
+    post_delete.connect(invalidate_home_snapshot, sender=_model)
+for _model in CHROME_MODELS:
+    post_save.connect(invalidate_site_chrome, sender=_model)
+    post_delete.connect(invalidate_site_chrome, sender=_model)
+# Build resized copies off the request path when a new image is uploaded
+for _model in IMAGE_FIELDS:
+    post_save.connect(queue_image_variants, sender=_model)
+
+
+# Every cached page showing this model is stale now (see pagecache.py)
+@receiver(post_save)
+@receiver(post_delete)
+def purge_cached_pages(sender, **kwargs):
+    if sender._meta.app_label == 'clrSite':
+        purge_tag(sender)
@@ -0,0 +1,140 @@
+"""Full-page cache for anonymous visitors, purged by surrogate keys.
+
+Each cached page lists the models it shows (its tags). Every tag has a
+version in the cache: the time of the last save or delete of that model,
+in milliseconds. Purging a tag just moves its version forward. Every page
+showing that model then gets a new ETag and cache key, and its old entry is
+never read again.
+
+The ETag and Last-Modified headers are derived from the tag versions and
+the build (see ``build_digest``) alone.
+A browser or Cloudflare revalidating with If-None-Match or
+If-Modified-Since gets a 304 before anything is rendered.
+
+Pages with a form carry a per-visitor CSRF token. The token is stored as a
+placeholder and a fresh one is filled in when the page is served. Views
+with a form set ``cache_private`` so shared caches keep no copy.
+"""
+import hashlib
+import os
+import re
+import time
+from functools import cache as memoize
+
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.contrib.messages.storage.session import SessionStorage
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+PAGE_TIMEOUT = 24 * 60 * 60
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+CSRF_PLACEHOLDER = b'__csrf_token__'
+_CSRF_INPUT = re.compile(rb'(name="csrfmiddlewaretoken" value=")[A-Za-z0-9]+(")')
+
+
+def _tag_key(model):
+    return f"clrSite:pagecache:tag:{model._meta.label_lower}"
+
+
+def tag_versions(models):
+    keys = sorted({_tag_key(model) for model in models})
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, int(time.time() * 1000), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def purge_tag(model):
+    """Mark every cached page showing ``model`` as stale, once the current transaction commits."""
+    key = _tag_key(model)
+
+    def bump():
+        # A timestamp rather than a counter, so it doubles as Last-Modified
+        cache.set(key, max(int(time.time() * 1000), (cache.get(key) or 0) + 1), None)
+
+    transaction.on_commit(bump)
+
+
+@memoize
+def build_digest():
+    """Digest of the deployed build, so a deploy changes every ETag.
+
+    Covers the app's templates, the static manifest (the hashed CSS and JS
+    names the pages link to) and RELEASE_VERSION for anything else.
+    """
+    digest = hashlib.md5(settings.RELEASE_VERSION.encode())
+    for root, dirs, files in sorted(os.walk(TEMPLATE_DIR)):
+        for name in sorted(files):
+            with open(os.path.join(root, name), 'rb') as fh:
+                digest.update(name.encode() + fh.read())
+    try:
+        with open(os.path.join(settings.STATIC_ROOT, 'staticfiles.json'), 'rb') as fh:
+            digest.update(fh.read())
+    except FileNotFoundError:
+        pass  # collectstatic has not run, as in development
+    return digest.hexdigest()
+
+
+def page_fingerprint(path, versions):
+    """Identifies one rendering of the page at ``path``; also its ETag and cache key."""
+    return hashlib.md5(f"{path}:{build_digest()}:{versions}".encode()).hexdigest()
+
+
+def is_cacheable(request):
+    """Anonymous GET/HEAD of a bare URL, with no flash messages waiting to be shown."""
+    if request.method not in ('GET', 'HEAD') or request.GET:
+        return False
+    if request.user.is_authenticated:
+        return False
+    if CookieStorage.cookie_name in request.COOKIES:
+        return False
+    session = getattr(request, 'session', None)
+    return not (session is not None and session.session_key and SessionStorage.session_key in session)
+
+
+def _set_validators(response, etag, last_modified, private):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Stored anywhere allowed, but revalidated on every use; a 304 costs us no rendering
+    patch_cache_control(response, no_cache=True, **({'private': True} if private else {'public': True}))
+    return response
+
+
+def cached_response(request, tags, render, private=False):
+    """Serve ``request`` from the page cache, calling ``render()`` on a miss.
+
+    ``private`` pages (those with a form) may be kept by the browser but not by shared caches.
+    """
+    versions = tag_versions(tags)
+    fingerprint = page_fingerprint(request.path, versions)
+    etag = quote_etag(fingerprint)
+    last_modified = max(versions) // 1000  # Whole seconds, as the header carries
+
+    key = f"clrSite:pagecache:page:{fingerprint}"
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return _set_validators(not_modified, etag, last_modified, private)
+
+    entry = cache.get(key)
+    if entry is not None:
+        content = entry['content']
+        if entry['csrf']:
+            content = content.replace(CSRF_PLACEHOLDER, get_token(request).encode())
+        response = HttpResponse(content, content_type=entry['content_type'])
+        return _set_validators(response, etag, last_modified, private)
+
+    response = render()
+    if hasattr(response, 'render'):
+        response.render()
+    if response.status_code != 200 or response.cookies:
+        return response
+    content, csrf = _CSRF_INPUT.subn(rb'\1' + CSRF_PLACEHOLDER + rb'\2', response.content)
+    cache.set(key, {'content': content, 'content_type': response['Content-Type'], 'csrf': bool(csrf)}, PAGE_TIMEOUT)
+    return _set_validators(response, etag, last_modified, private)
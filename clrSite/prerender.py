@@ -0,0 +1,146 @@
+"""Pre-rendered clrSite pages, served without running a view.
+
+``manage.py prerender_site`` renders every page that looks the same to all
+anonymous visitors into PRERENDER_ROOT, and records in a manifest the page
+cache fingerprint each file was rendered at (path, templates and tag
+versions, see pagecache.py). A later run re-renders only the pages whose
+fingerprint changed, i.e. whose models were edited.
+
+PrerenderedPageMiddleware sits right after WhiteNoise and hands those files
+to it, before sessions, auth or the database are touched. The middleware
+further down never sees these responses, so the headers it would have added
+(X-Frame-Options, Vary: Cookie) are set here. Each process
+re-reads the manifest and the tag versions at most every CHECK_INTERVAL
+seconds. A page edited since it was rendered, and any page that was never
+rendered, goes on to Django (and the page cache) as before.
+
+The web process type (Procfile) runs ``prerender_site`` once, in the
+foreground, before it starts gunicorn. On Heroku each dyno has its own
+filesystem, so the files must be written on the dyno that serves them, and
+neither a process type of its own nor a run_jobs job could do that. Nothing
+keeps running in the background. Pages edited after boot are served by
+Django and the page cache until the dyno restarts, and Heroku restarts
+dynos daily. ``--watch`` keeps re-rendering changed pages, for hosts where
+PRERENDER_ROOT is shared and a supervisor can run it as its own service.
+"""
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from whitenoise.middleware import WhiteNoiseMiddleware
+from whitenoise.responders import MissingFileError, StaticFile
+
+from .pagecache import page_fingerprint, tag_versions
+
+CHECK_INTERVAL = 5  # Seconds a process may keep serving a page that was just edited
+MANIFEST_NAME = 'manifest.json'
+PAGES_DIR = 'pages'
+
+
+def prerenderable_pages():
+    """``{path: tags}`` for the clrSite URLs every anonymous visitor sees the same way."""
+    from .urls import app_name, urlpatterns
+    from .views import PageCacheMixin
+
+    pages = {}
+    for pattern in urlpatterns:
+        view_class = getattr(pattern.callback, 'view_class', None)
+        if pattern.pattern.converters or view_class is None or not issubclass(view_class, PageCacheMixin):
+            continue
+        if view_class.cache_private:
+            continue  # Carries a per-visitor CSRF token
+        pages[reverse(f"{app_name}:{pattern.name}")] = view_class.page_tags()
+    return pages
+
+
+def page_file(fingerprint):
+    """Path of a rendered page, relative to PRERENDER_ROOT; named by content so it is never rewritten."""
+    return os.path.join(PAGES_DIR, f"{fingerprint}.html")
+
+
+def read_manifest(root=None):
+    try:
+        with open(os.path.join(root or settings.PRERENDER_ROOT, MANIFEST_NAME)) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+class PrerenderedPageMiddleware:
+    """Serve anonymous GETs of pre-rendered pages through WhiteNoise, while they are current."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.root = settings.PRERENDER_ROOT
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self._manifest_mtime = None
+        self._manifest = {}
+        self._tags = {}
+        self._files = {}  # path -> StaticFile, only for pages that are current
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and not request.META.get('QUERY_STRING') and self._anonymous(request):
+            static_file = self._current_files().get(request.path_info)
+            if static_file is not None:
+                response = WhiteNoiseMiddleware.serve(static_file, request)
+                # As Django's own render of the page would say; WhiteNoise sets Vary itself, so it is patched here
+                patch_vary_headers(response, ('Cookie',))
+                return response
+        return self.get_response(request)
+
+    @staticmethod
+    def _anonymous(request):
+        # Runs before sessions and auth, so any session (a signed-in admin, pending flash messages) goes to Django
+        return settings.SESSION_COOKIE_NAME not in request.COOKIES and CookieStorage.cookie_name not in request.COOKIES
+
+    def _current_files(self):
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= CHECK_INTERVAL:
+            with self._lock:
+                if self._checked_at is None or now - self._checked_at >= CHECK_INTERVAL:
+                    self._refresh()
+                    self._checked_at = now
+        return self._files
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(os.path.join(self.root, MANIFEST_NAME)).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self._manifest_mtime:
+            self._manifest = read_manifest(self.root) if mtime else {}
+            self._manifest_mtime = mtime
+            self._tags = prerenderable_pages()
+
+        files = {}
+        for path, entry in self._manifest.items():
+            if path not in self._tags or page_fingerprint(path, tag_versions(self._tags[path])) != entry['fingerprint']:
+                continue
+            static_file = self._files.get(path)
+            if static_file is None or static_file.etag != quote_etag(entry['fingerprint']):
+                static_file = self._static_file(entry)
+            if static_file is not None:
+                files[path] = static_file
+        self._files = files
+
+    def _static_file(self, entry):
+        # The same validators the page cache sends, so a browser revalidates across both
+        headers = [
+            ('Content-Type', 'text/html; charset=utf-8'),
+            ('X-Frame-Options', getattr(settings, 'X_FRAME_OPTIONS', 'DENY').upper()),  # As XFrameOptionsMiddleware
+            ('Cache-Control', 'no-cache, public'),
+            ('ETag', quote_etag(entry['fingerprint'])),
+            ('Last-Modified', http_date(entry['last_modified'])),
+        ]
+        path = os.path.join(self.root, entry['file'])
+        try:
+            return StaticFile(path, headers, encodings={'gzip': path + '.gz'})
+        except MissingFileError:
+            return None
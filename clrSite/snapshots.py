@@ -0,0 +1,79 @@
+"""Cached snapshot of the homepage context, and the site chrome version.
+
+The homepage shows a dozen kinds of content that change a few times a month.
+Its whole context is built once, stored in the cache with the content version
+it was built from, and reused until a post_save or post_delete on one of the
+models it shows bumps the version (HOME_MODELS in models.py).
+
+A stale snapshot is rebuilt by one worker at a time, under a cache lock. The
+others keep serving the previous snapshot in the meantime, so a rebuild never
+hits the database more than once.
+
+The header and footer ("chrome") are cached per process by
+chrome.site_chrome, under their own version.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+SNAPSHOT_KEY = 'clrSite:home:snapshot'
+VERSION_KEY = 'clrSite:home:version'
+LOCK_KEY = 'clrSite:home:lock'
+CHROME_VERSION_KEY = 'clrSite:chrome:version'
+LOCK_TIMEOUT = 30  # A crashed rebuild frees the lock after this long
+SNAPSHOT_TIMEOUT = 24 * 60 * 60  # Backstop for changes that bypass signals (e.g. queryset.update)
+
+
+def _version(key):
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock so a lost counter never matches an old snapshot
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), None)
+
+
+def home_version():
+    return _version(VERSION_KEY)
+
+
+def bump_home_version():
+    # After commit, so a rebuild cannot read the old rows under the new version
+    transaction.on_commit(lambda: _bump(VERSION_KEY))
+
+
+def chrome_version():
+    return _version(CHROME_VERSION_KEY)
+
+
+def bump_chrome_version():
+    transaction.on_commit(lambda: _bump(CHROME_VERSION_KEY))
+
+
+def home_snapshot(build):
+    """Return the cached homepage context, calling ``build()`` when it is stale."""
+    version = home_version()
+    snapshot = cache.get(SNAPSHOT_KEY)
+    if snapshot is not None and snapshot['version'] == version:
+        return snapshot['context']
+
+    if cache.add(LOCK_KEY, True, LOCK_TIMEOUT):
+        try:
+            context = build()
+            # Stored under the version read before building, so an edit made meanwhile still triggers a rebuild
+            cache.set(SNAPSHOT_KEY, {'version': version, 'context': context}, SNAPSHOT_TIMEOUT)
+        finally:
+            cache.delete(LOCK_KEY)
+        return context
+
+    if snapshot is not None:
+        return snapshot['context']  # Another worker is rebuilding; the previous one is close enough
+    return build()  # Nothing cached yet: build for this request without storing it
@@ -0,0 +1,48 @@
+from django import template
+from django.utils.html import format_html
+
+register = template.Library()
+
+
+def _current(image, variants):
+    if not image or variants.get('source') != image.name or 'error' in variants:
+        return False
+    return bool(variants.get('formats', {}).get('webp'))
+
+
+@register.simple_tag
+def responsive_image(image, variants, alt='', sizes='100vw', css_class='', loading='lazy'):
+    """An ``<img>`` with a WebP ``srcset`` and a blurred placeholder behind it.
+
+    ``image`` is the ImageField and ``variants`` its ``image_variants`` (see clrSite/images.py).
+    Falls back to the original upload until derivatives have been built.
+    Usage: ``{% responsive_image service.image service.image_variants alt=service.title sizes="33vw" %}``
+    """
+    if not image:
+        return ''
+    if not _current(image, variants):
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}" decoding="async">', image.url, alt, css_class, loading,
+        )
+
+    storage = image.storage
+    names = variants['formats']['webp']
+    srcset = ', '.join(f"{storage.url(name)} {width}w" for width, name in names)
+    style = f"background: url({variants['placeholder']}) center / cover no-repeat" if variants['placeholder'] else ''
+    return format_html(
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" width="{}" height="{}" loading="{}" '
+        'decoding="async" style="{}">',
+        storage.url(names[-1][1]), srcset, sizes, alt, css_class, variants['width'], variants['height'], loading, style,
+    )
+
+
+@register.simple_tag
+def image_variant_url(image, variants, width):
+    """URL of the smallest derivative at least ``width`` pixels wide (or the largest), else of the original."""
+    if not image:
+        return ''
+    if not _current(image, variants):
+        return image.url
+    names = variants['formats']['webp']
+    name = next((name for w, name in names if w >= width), names[-1][1])
+    return image.storage.url(name)
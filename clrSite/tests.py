@@ -1,3 +1,174 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.http import FileResponse
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from libraryApp.jobs import run_pending
+
+from . import chrome, pagecache, snapshots
+from .images import build_stale_images, stale_images
+from .models import ContactInfo, Services, SocialMediaLink, Stat
+from .templatetags.images import responsive_image
+
+# The manifest storage needs collectstatic, which the tests do not run
+PLAIN_STATIC = override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+
+
+class PageFingerprintTests(SimpleTestCase):
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root)
+        settings = override_settings(STATIC_ROOT=self.static_root, RELEASE_VERSION='')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(pagecache.build_digest.cache_clear)
+
+    def fingerprint(self):
+        pagecache.build_digest.cache_clear()  # As a fresh process after a deploy
+        return pagecache.page_fingerprint('/', [1])
+
+    def test_changes_with_the_static_manifest(self):
+        before = self.fingerprint()
+        with open(os.path.join(self.static_root, 'staticfiles.json'), 'w') as fh:
+            fh.write('{"paths": {"css/site.css": "css/site.0123abcd.css"}}')
+        self.assertNotEqual(self.fingerprint(), before)
+
+    def test_changes_with_the_release_version(self):
+        before = self.fingerprint()
+        with override_settings(RELEASE_VERSION='abc123'):
+            self.assertNotEqual(self.fingerprint(), before)
+
+
+@PLAIN_STATIC
+class PrerenderedPageTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        settings = override_settings(PRERENDER_ROOT=root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        call_command('prerender_site', stdout=StringIO())
+
+    def test_served_with_the_headers_django_would_add(self):
+        response = self.client.get('/')
+        rendered = self.client.get('/', HTTP_COOKIE='sessionid=x')  # A session skips the static copy
+        self.assertIsInstance(response, FileResponse)
+        self.assertNotIsInstance(rendered, FileResponse)
+        self.assertEqual(response['X-Frame-Options'], rendered['X-Frame-Options'])
+        self.assertEqual(response['X-Frame-Options'], 'DENY')
+        self.assertIn('Cookie', response['Vary'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(response['ETag'], rendered['ETag'])
+
+
+class StaleImageTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        patcher = mock.patch.object(Services._meta.get_field('image'), 'storage', FileSystemStorage(root))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def service(self, title, data):
+        service = Services(title=title, description='')
+        service.image.save(f"{title}.png", ContentFile(data), save=False)
+        service.save()
+        return service
+
+    def test_a_bad_image_does_not_stop_the_others(self):
+        png = BytesIO()
+        Image.new('RGB', (800, 600), 'white').save(png, 'PNG')
+        broken = self.service('broken', b'not an image')
+        good = self.service('good', png.getvalue())
+
+        with self.assertLogs('clrSite.images', 'ERROR'):
+            build_stale_images(0)
+        broken.refresh_from_db()
+        good.refresh_from_db()
+        self.assertEqual(broken.image_variants['source'], broken.image.name)
+        self.assertIn('error', broken.image_variants)
+        self.assertEqual(good.image_variants['width'], 800)
+        self.assertEqual(list(stale_images([Services])), [])  # Not retried until replaced
+
+        self.assertNotIn('srcset', responsive_image(broken.image, broken.image_variants))
+        self.assertIn('srcset', responsive_image(good.image, good.image_variants))
+
+    def test_new_images_are_built_by_the_registered_job(self):
+        png = BytesIO()
+        Image.new('RGB', (800, 600), 'white').save(png, 'PNG')
+        service = self.service('good', png.getvalue())
+        self.assertEqual(run_pending(['site_images']), (1, 0))
+        service.refresh_from_db()
+        self.assertEqual(service.image_variants['width'], 800)
+
+    def test_backfill_reports_failures_and_carries_on(self):
+        self.service('broken', b'not an image')
+        out = StringIO()
+        call_command('build_image_variants', '--force', '--model', 'clrSite.services', stdout=out)
+        self.assertIn('error building images', out.getvalue())
+        self.assertIn('Built 0, skipped 0, failed 1', out.getvalue())
+
+
+@PLAIN_STATIC
+class SiteChromeTests(TestCase):
+    def setUp(self):
+        chrome.forget_chrome()
+        self.addCleanup(chrome.forget_chrome)
+        ContactInfo.objects.create(address='1 Duport Road', phone='123', email='info@example.com', maplink='')
+
+    def test_clrsite_pages_carry_the_chrome(self):
+        response = self.client.get(reverse('clrSite:about'))
+        self.assertEqual(response.context['contact_info'].address, '1 Duport Road')
+        self.assertContains(response, '1 Duport Road')
+
+    def test_other_apps_do_not_load_it(self):
+        with mock.patch.object(chrome, '_load_chrome') as load:
+            response = self.client.get(reverse('library_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('contact_info', response.context)
+        load.assert_not_called()
+
+
+@PLAIN_STATIC
+class HomeSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_saving_a_homepage_model_rebuilds_the_snapshot(self):
+        build = mock.Mock(side_effect=lambda: {'built': build.call_count})
+        self.assertEqual(snapshots.home_snapshot(build), {'built': 1})
+        self.assertEqual(snapshots.home_snapshot(build), {'built': 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SocialMediaLink.objects.create(name='x', icon_class='fa-x', link='https://example.com')  # Chrome only
+        self.assertEqual(snapshots.home_snapshot(build), {'built': 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Stat.objects.create(title='Clients', value=40)
+        self.assertEqual(snapshots.home_snapshot(build), {'built': 2})
+
+    def test_others_serve_the_previous_snapshot_while_one_rebuilds(self):
+        snapshots.home_snapshot(lambda: {'built': 'old'})
+        with self.captureOnCommitCallbacks(execute=True):
+            Stat.objects.create(title='Clients', value=40)
+        cache.add(snapshots.LOCK_KEY, True)  # Another worker is rebuilding
+        build = mock.Mock()
+        self.assertEqual(snapshots.home_snapshot(build), {'built': 'old'})
+        build.assert_not_called()
+
+    def test_homepage_shows_new_content(self):
+        self.client.get('/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Stat.objects.create(title='Courts visited', value=12)
+        self.assertContains(self.client.get('/'), 'Courts visited')
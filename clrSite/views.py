@@ -1,31 +1,57 @@
+from functools import partial
+
 from django.shortcuts import render
 from django.views.generic import TemplateView, ListView, FormView
 from django.urls import reverse_lazy
 from django.contrib import messages
+from django.db.models import QuerySet
 from .models import (
     HeroImages, Services, Projects, Stat, TestimonyAndSayings, 
     Team, PartnersAndSponsors, BackgroundImg, Our_Mission_Vision_Statement,
     BlogNews_Updates, ContactInfo, ContactFormEntry, Group,
-    CompanyHighlight, SocialMediaLink, WebsiteLogo
+    CompanyHighlight, SocialMediaLink, WebsiteLogo, ProjectImage,
+    CHROME_MODELS, HOME_MODELS,
 )
+from .chrome import site_chrome
+from .pagecache import cached_response, is_cacheable
+from .snapshots import home_snapshot
 from .forms import ContactForm # Assuming a ContactForm exists or I will create one
 
 
-class ContextMixin:
-    """Mixin to add common context like branding and contact info to all views"""
+class SiteChromeMixin:
+    """Header and footer data for clrSite pages, from the per-process copy in chrome.py"""
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['contact_info'] = ContactInfo.objects.first()
-        context['logo'] = WebsiteLogo.objects.first() if 'WebsiteLogo' in globals() else None
-        context['services_list'] = Services.objects.all()[:5] # For Footer
-        context['social_links'] = SocialMediaLink.objects.all()
+        context.update(site_chrome())
         return context
 
-class HomeView(ContextMixin, TemplateView):
+class PageCacheMixin:
+    """Serve anonymous visitors from the full-page cache (see pagecache.py)"""
+    cache_tags = ()  # Models shown on the page besides the header and footer
+    cache_private = False  # True for pages with a form, which carry a per-visitor CSRF token
+
+    @classmethod
+    def page_tags(cls):
+        return cls.cache_tags + CHROME_MODELS
+
+    def dispatch(self, request, *args, **kwargs):
+        if not is_cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+        render = partial(super().dispatch, request, *args, **kwargs)
+        return cached_response(request, self.page_tags(), render, private=self.cache_private)
+
+class HomeView(SiteChromeMixin, PageCacheMixin, TemplateView):
     template_name = "clrSite/home.html"
+    cache_tags = HOME_MODELS
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        # The homepage rarely changes: serve its content from the cached snapshot
+        context.update(home_snapshot(self.build_home_context))
+        return context
+
+    def build_home_context(self):
+        context = {}
         # Fetch data for the landing page
         context['hero_images'] = HeroImages.objects.order_by('-submitted_at')
         context['services'] = Services.objects.all()[:6]
@@ -37,11 +63,13 @@ class HomeView(ContextMixin, TemplateView):
         context['latest_news'] = BlogNews_Updates.objects.order_by('-published_date')[:3]
         context['about_info'] = Our_Mission_Vision_Statement.objects.first()
         context['highlights'] = CompanyHighlight.objects.all() # "Who We Are" bullets
-        return context
+        # Evaluate everything now so the snapshot holds rows, not queries
+        return {key: list(value) if isinstance(value, QuerySet) else value for key, value in context.items()}
 
 
-class AboutView(ContextMixin, TemplateView):
+class AboutView(SiteChromeMixin, PageCacheMixin, TemplateView):
     template_name = "clrSite/about.html"
+    cache_tags = (Our_Mission_Vision_Statement, Team, PartnersAndSponsors, CompanyHighlight)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -51,9 +79,10 @@ class AboutView(ContextMixin, TemplateView):
         context['highlights'] = CompanyHighlight.objects.all()
         return context
 
-class ServicesView(ContextMixin, ListView):
+class ServicesView(SiteChromeMixin, PageCacheMixin, ListView):
     model = Services
     template_name = "clrSite/services.html"
+    cache_tags = (Services, Group)
     context_object_name = 'services'
 
     def get_context_data(self, **kwargs):
@@ -61,25 +90,22 @@ class ServicesView(ContextMixin, ListView):
         context['groups'] = Group.objects.all() 
         return context
 
-class ProjectsView(ContextMixin, ListView):
+class ProjectsView(SiteChromeMixin, PageCacheMixin, ListView):
     model = Projects
     template_name = "clrSite/projects.html"
+    cache_tags = (Projects, ProjectImage, Group)
     context_object_name = 'projects'
     ordering = ['-created_at']
 
     def get_queryset(self):
         return Projects.objects.prefetch_related('gallery_images').order_by('-created_at')
 
-class ContactView(ContextMixin, FormView):
+class ContactView(SiteChromeMixin, PageCacheMixin, FormView):
     template_name = "clrSite/contact.html"
+    cache_private = True
     form_class = ContactForm # I need to ensure this form exists in forms.py
     success_url = reverse_lazy('clrSite:contact')
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['contact_info'] = ContactInfo.objects.first()
-        return context
-
     def form_valid(self, form):
         # Save the contact message using the model form
         form.save()
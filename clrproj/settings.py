@@ -105,6 +105,7 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
 
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'clrSite.prerender.PrerenderedPageMiddleware',  # Static copies of the public clrSite pages
 
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -156,6 +157,23 @@ DATABASES = {
 
 
 
+# The cache must be shared by all processes: the entitlement, catalog, homepage and page caches
+# are invalidated by bumping version keys, which per-process memory (LocMemCache) would not see.
+# Which shared backend is a deployment choice:
+#   - DatabaseCache (the default) needs no extra service; its table is created by
+#     `manage.py createcachetable` on release. Every cache read is still an SQL query, just a
+#     cheap one, so cached pages save queries and rendering but do not avoid the database.
+#   - RedisCache keeps cache hits off the database entirely. Set
+#     CACHE_BACKEND=django.core.cache.backends.redis.RedisCache and CACHE_LOCATION=redis://...
+#     and install the `redis` package.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': config('CACHE_LOCATION', default='django_cache'),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -228,6 +246,55 @@ DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Prebuilt set archives served by download_set, evicted oldest-first past the size cap
+SET_ARCHIVE_ROOT = config('SET_ARCHIVE_ROOT', default=os.path.join(BASE_DIR, 'archive_cache'))
+SET_ARCHIVE_MAX_BYTES = config('SET_ARCHIVE_MAX_BYTES', default=2 * 1024 ** 3, cast=int)
+
+# Rendered WebP preview pages served by preview_page_image, evicted the same way. Needs the optional
+# PyMuPDF extra (requirements-render.txt); without it readers get the preview PDF
+PAGE_IMAGE_ROOT = config('PAGE_IMAGE_ROOT', default=os.path.join(BASE_DIR, 'page_cache'))
+PAGE_IMAGE_MAX_BYTES = config('PAGE_IMAGE_MAX_BYTES', default=512 * 1024 ** 2, cast=int)
+
+# Static copies of the public clrSite pages, written by prerender_site (clrSite.prerender). Each web
+# dyno renders them once at boot, before gunicorn starts (see Procfile). Files written by another dyno
+# or in the release phase never reach it
+PRERENDER_ROOT = config('PRERENDER_ROOT', default=os.path.join(BASE_DIR, 'prerendered'))
+
+# Identifies the deployed code in cached page fingerprints (clrSite.pagecache.build_digest). Heroku sets
+# HEROKU_SLUG_COMMIT when dyno metadata is enabled (heroku labs:enable runtime-dyno-metadata)
+RELEASE_VERSION = config('RELEASE_VERSION', default=config('HEROKU_SLUG_COMMIT', default=''))
+
+# Budget for building one preview PDF (libraryApp.previews): pages stop being copied once they
+# reference more than PREVIEW_MAX_BYTES, and a build running past PREVIEW_TIME_BUDGET seconds fails
+PREVIEW_MAX_BYTES = config('PREVIEW_MAX_BYTES', default=64 * 1024 ** 2, cast=int)
+PREVIEW_TIME_BUDGET = config('PREVIEW_TIME_BUDGET', default=60, cast=int)
+
+# Protected media delivery (libraryApp.delivery). Leave the backend empty to stream from Django,
+# or offload local files to the front server: 'nginx' (X-Accel-Redirect) or 'xsendfile'.
+# For nginx, MEDIA_SENDFILE_URL must be an internal location aliased to "/", e.g.
+#   location /protected/ { internal; alias /; }
+MEDIA_SENDFILE_BACKEND = config('MEDIA_SENDFILE_BACKEND', default='')
+MEDIA_SENDFILE_URL = config('MEDIA_SENDFILE_URL', default='/protected/')
+
+# Chunked admin uploads (libraryApp.uploads). Chunks are staged in UPLOAD_CHUNK_ROOT unless
+# UPLOAD_CHUNK_STORAGE names a shared storage class. The run_jobs worker assembles them, so on
+# Heroku (one filesystem per dyno) a shared storage is needed
+UPLOAD_CHUNK_ROOT = config('UPLOAD_CHUNK_ROOT', default=os.path.join(BASE_DIR, 'upload_chunks'))
+UPLOAD_CHUNK_STORAGE = config('UPLOAD_CHUNK_STORAGE', default='')
+
+# Stripe. The webhook signing secret comes from the endpoint's page in the Stripe dashboard
+STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY', default='')
+STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY', default='')
+STRIPE_WEBHOOK_SECRET = config('STRIPE_WEBHOOK_SECRET', default='')
+STRIPE_WEBHOOK_TOLERANCE = config('STRIPE_WEBHOOK_TOLERANCE', default=300, cast=int)  # Max signature age, seconds
+# Outbound API calls (libraryApp.payments). Point STRIPE_API_BASE at stripe-mock for local testing
+STRIPE_API_BASE = config('STRIPE_API_BASE', default='https://api.stripe.com')
+STRIPE_CONNECT_TIMEOUT = config('STRIPE_CONNECT_TIMEOUT', default=3, cast=float)
+STRIPE_READ_TIMEOUT = config('STRIPE_READ_TIMEOUT', default=10, cast=float)
+STRIPE_MAX_RETRIES = config('STRIPE_MAX_RETRIES', default=1, cast=int)
+STRIPE_BREAKER_THRESHOLD = config('STRIPE_BREAKER_THRESHOLD', default=5, cast=int)  # Failures per minute
+STRIPE_BREAKER_COOLDOWN = config('STRIPE_BREAKER_COOLDOWN', default=30, cast=int)  # Seconds to fail fast
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -1,10 +1,21 @@
 from django.contrib import admin
-from .models import UserProfile, Category, BookSet, Volume, Purchase
+from .forms import VolumeAdminForm
+from .models import UserProfile, Category, BookSet, Volume, Purchase, BackgroundJob, StripeEvent
 
 class VolumeInline(admin.TabularInline):
     model = Volume
+    form = VolumeAdminForm  # Adds the resumable upload for large PDFs
     extra = 1  # Easy adding volumes inline
 
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+
+        class VolumeFormSet(formset):
+            def get_form_kwargs(self, index):
+                return {**super().get_form_kwargs(index), 'user': request.user}
+
+        return VolumeFormSet
+
 @admin.register(BookSet)
 class BookSetAdmin(admin.ModelAdmin):
     inlines = [VolumeInline]
@@ -12,6 +23,19 @@ class BookSetAdmin(admin.ModelAdmin):
     search_fields = ('title', 'description')
     filter_horizontal = ('categories',)  # Nice UI for ManyToMany
 
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'object_id', 'status', 'attempts', 'run_after', 'updated_at')
+    list_filter = ('kind', 'status')
+    readonly_fields = ('created_at', 'updated_at')
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'type', 'received_at', 'processed_at', 'error')
+    list_filter = ('type',)
+    search_fields = ('event_id',)
+    readonly_fields = ('event_id', 'type', 'payload', 'received_at', 'processed_at', 'error')
+
 admin.site.register([UserProfile, Category, Purchase])
 
 
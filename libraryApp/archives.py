@@ -0,0 +1,82 @@
+import glob
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+
+from .filecache import count_added, evict_lru, touch
+from .streaming import stream_zip
+
+
+def set_entries(book):
+    """(arcname, field_file) pairs for every volume in the set that has a PDF."""
+    return [
+        (f"{book.title}_Vol{volume.volume_number}.pdf", volume.pdf_file)
+        for volume in book.volumes.all()
+        if volume.pdf_file
+    ]
+
+
+def set_digest(book):
+    """Content key for a set's archive.
+
+    Built from the recorded SHA-256 of each volume's PDF, so identical content
+    maps to the same archive. Volumes uploaded before hashes were recorded
+    fall back to their storage name, which changes on every re-upload.
+    """
+    digest = hashlib.sha256(book.title.encode())
+    for number, name, sha256 in book.volumes.exclude(pdf_file='').values_list(
+        'volume_number', 'pdf_file', 'pdf_sha256'
+    ):
+        digest.update(f"{number}:{sha256 or name}\n".encode())
+    return digest.hexdigest()
+
+
+def archive_path(book_id, digest):
+    return os.path.join(settings.SET_ARCHIVE_ROOT, f"{book_id}-{digest}.zip")
+
+
+def cached_archive(book):
+    """Return the path of the prebuilt archive for ``book``, or None."""
+    path = archive_path(book.pk, set_digest(book))
+    if not os.path.exists(path) or not touch(path):
+        return None
+    return path
+
+
+def stream_and_cache(book):
+    """Stream the set's ZIP to the client while writing it into the cache.
+
+    The archive only lands in the cache once it is complete, so an aborted
+    download never leaves a truncated file behind.
+    """
+    os.makedirs(settings.SET_ARCHIVE_ROOT, exist_ok=True)
+    final_path = archive_path(book.pk, set_digest(book))
+    entries = set_entries(book)
+    fd, tmp_path = tempfile.mkstemp(dir=settings.SET_ARCHIVE_ROOT, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            for data in stream_zip(entries):
+                tmp.write(data)
+                yield data
+        os.replace(tmp_path, final_path)
+        count_added(settings.SET_ARCHIVE_ROOT, '*.zip', os.path.getsize(final_path), settings.SET_ARCHIVE_MAX_BYTES)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def invalidate_set_archives(book_id):
+    for path in glob.glob(os.path.join(settings.SET_ARCHIVE_ROOT, f"{book_id}-*.zip")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def evict_archives(max_bytes=None):
+    """Drop least recently used archives until the cache fits ``max_bytes``."""
+    if max_bytes is None:
+        max_bytes = settings.SET_ARCHIVE_MAX_BYTES
+    evict_lru(settings.SET_ARCHIVE_ROOT, '*.zip', max_bytes)
@@ -0,0 +1,114 @@
+"""Content-addressed storage for volume PDFs and their previews.
+
+Uploads are stored under their SHA-256 (``volumes/ab/abcd....pdf``), and a
+new upload whose digest is already stored just points at the existing
+file. A preview is keyed by what it was built from (``<sha>:<pages>``), so
+volumes sharing a PDF and page count share one preview as well.
+
+The reference count of a stored file is the number of Volume rows naming
+it. A file is deleted only once that count drops to zero, after the
+transaction that released it commits.
+"""
+import posixpath
+
+from django.db import transaction
+
+
+def content_pdf_name(pdf_sha256):
+    return f"volumes/{pdf_sha256[:2]}/{pdf_sha256}.pdf"
+
+
+def volume_pdf_path(instance, filename):
+    """``upload_to`` for Volume.pdf_file: the content hash when known."""
+    if instance.pdf_sha256:
+        return content_pdf_name(instance.pdf_sha256)
+    return f"volumes/{filename}"
+
+
+def preview_pdf_name(source_key):
+    """Name to save a preview under, relative to Volume.preview_pdf's ``upload_to``."""
+    pdf_sha256, pages = source_key.split(':')
+    return f"{pdf_sha256[:2]}/{pdf_sha256}-{pages}.pdf"
+
+
+def find_shared_pdf(pdf_sha256, exclude_pk=None):
+    """Stored name and page count of another volume with the same PDF, or None."""
+    from .models import Volume
+
+    return Volume.objects.filter(pdf_sha256=pdf_sha256).exclude(pdf_file='').exclude(
+        pk=exclude_pk).values_list('pdf_file', 'pdf_page_count').first()
+
+
+def find_shared_preview(source_key, exclude_pk=None):
+    """Stored name, page count and source page count of a preview built from the same source, or None."""
+    from .models import Volume
+
+    return Volume.objects.filter(preview_source=source_key).exclude(preview_pdf='').exclude(
+        pk=exclude_pk).values_list('preview_pdf', 'preview_page_count', 'pdf_page_count').first()
+
+
+def reference_count(field_name, name):
+    from .models import Volume
+
+    return Volume.objects.filter(**{field_name: name}).count()
+
+
+def release(field_file, field_name, name):
+    """Delete stored file ``name`` once no volume references it any more.
+
+    ``field_file`` is anything with the right ``storage``: a FieldFile or the field itself.
+    """
+    if not name:
+        return
+    storage = field_file.storage
+
+    def delete_if_unreferenced():
+        if reference_count(field_name, name) == 0:
+            storage.delete(name)
+
+    transaction.on_commit(delete_if_unreferenced)
+
+
+def _list_cloudinary(storage, prefix):
+    import cloudinary.api
+
+    files = {}
+    # Stored names carry the storage's own prefix (MEDIA_URL by default), as the listing does
+    prefix = storage._prepend_prefix(prefix)
+    options = {'type': 'upload', 'prefix': prefix, 'resource_type': storage.RESOURCE_TYPE, 'max_results': 500, 'tags': True}
+    while True:
+        response = cloudinary.api.resources(**options)
+        for resource in response['resources']:
+            if storage.TAG in resource['tags']:
+                files[resource['public_id']] = resource['bytes']
+        if not response.get('next_cursor'):
+            return files
+        options['next_cursor'] = response['next_cursor']
+
+
+def _walk(storage, path):
+    try:
+        directories, files = storage.listdir(path)
+    except FileNotFoundError:
+        return  # Nothing stored under this prefix yet
+    for name in files:
+        yield posixpath.join(path, name)
+    for directory in directories:
+        yield from _walk(storage, posixpath.join(path, directory))
+
+
+def list_stored_files(storage, prefix):
+    """``{name: size}`` of every file stored under ``prefix``, or None if ``storage`` cannot list.
+
+    Cloudinary returns names and sizes for a whole prefix in a few paged API
+    calls. Other storages are walked with ``listdir`` and report sizes as
+    None, to be looked up only for the files that need them.
+    """
+    from cloudinary_storage.storage import MediaCloudinaryStorage
+
+    if isinstance(storage, MediaCloudinaryStorage):
+        return _list_cloudinary(storage, prefix)
+    try:
+        return dict.fromkeys(_walk(storage, prefix.rstrip('/')))
+    except NotImplementedError:
+        return None
@@ -0,0 +1,130 @@
+"""Catalog filtering, facet counts and their versioned cache.
+
+Every cache key embeds the current catalog version. Any BookSet or Category
+change bumps the version, so old entries are never read again and expire on
+their own. There is nothing to purge key by key. Each book also has its own
+version, bumped when the set or one of its volumes changes, for fragments of
+its detail page.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db.models import Count, Exists, OuterRef, Value
+from django.db import transaction
+
+VERSION_KEY = 'libraryApp:catalog:version'
+CACHE_TIMEOUT = 60 * 60
+
+
+def _version(key):
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock so a lost counter never reuses an old version
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), None)
+
+
+def catalog_version():
+    return _version(VERSION_KEY)
+
+
+def bump_catalog_version():
+    # After commit, so a concurrent request cannot cache the old rows under the new version
+    transaction.on_commit(lambda: _bump(VERSION_KEY))
+
+
+def _book_version_key(book_id):
+    return f"libraryApp:book:{book_id}:version"
+
+
+def book_version(book_id):
+    return _version(_book_version_key(book_id))
+
+
+def bump_book_version(book_id):
+    transaction.on_commit(lambda: _bump(_book_version_key(book_id)))
+
+
+def catalog_cache_key(name, *parts):
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f"libraryApp:catalog:{catalog_version()}:{name}:{digest}"
+
+
+def normalize_filters(params, access_choices):
+    """Canonical ``(q, category, access)`` so equivalent requests share a cache entry."""
+    query = ' '.join(params.get('q', '').split()).lower()
+    category = params.get('category', '').strip()
+    access = params.get('access', '').strip()
+    if access not in dict(access_choices):
+        access = ''
+    return query, category, access
+
+
+def cached_categories():
+    """All categories for the filter bar."""
+    from .models import Category
+
+    key = catalog_cache_key('categories')
+    categories = cache.get(key)
+    if categories is None:
+        categories = list(Category.objects.all())
+        cache.set(key, categories, CACHE_TIMEOUT)
+    return categories
+
+
+def filter_book_sets(queryset, query='', category='', access_type=''):
+    """Apply the catalog filters; a search also annotates ``rank``."""
+    from .models import BookSet
+    from .search import search_book_sets
+
+    if query:
+        queryset = search_book_sets(queryset, query)  # Ranked full-text match
+    if category:
+        # EXISTS instead of a join, so sets in several categories are not duplicated
+        queryset = queryset.filter(Exists(BookSet.categories.through.objects.filter(
+            bookset_id=OuterRef('pk'), category__slug=category,
+        )))
+    if access_type:
+        queryset = queryset.filter(access_type=access_type)
+    return queryset
+
+
+def facet_counts(filters):
+    """Matching set counts per category and per access type, in one query.
+
+    Each facet counts against the other active filters but not its own, so
+    choosing a category still shows what the other categories would return.
+    Returns ``{'category': {slug: n}, 'access': {value: n}}``.
+    """
+    from .models import BookSet
+
+    key = catalog_cache_key('facets', filters)
+    counts = cache.get(key)
+    if counts is not None:
+        return counts
+
+    query, category, access_type = filters
+    books = BookSet.objects.order_by()
+    by_category = BookSet.categories.through.objects.filter(
+        bookset_id__in=filter_book_sets(books, query, '', access_type).values('pk'),
+    ).values('category__slug').annotate(
+        facet=Value('category'), n=Count('bookset_id'),
+    ).values_list('facet', 'category__slug', 'n')
+    by_access = filter_book_sets(books, query, category, '').values('access_type').annotate(
+        facet=Value('access'), n=Count('pk'),
+    ).values_list('facet', 'access_type', 'n')
+
+    counts = {'category': {}, 'access': {}}
+    for facet, value, n in by_category.union(by_access, all=True):
+        counts[facet][value] = n
+    cache.set(key, counts, CACHE_TIMEOUT)
+    return counts
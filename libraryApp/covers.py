@@ -0,0 +1,20 @@
+"""Resized WebP (and, where Pillow can write it, AVIF) copies of book covers.
+
+Derivatives are built once per uploaded cover by the ``cover`` background job
+and stored next to the original under ``covers/derived/`` (see images.py).
+Their names and the original's dimensions are recorded in
+``BookSet.cover_variants``, so templates can emit ``srcset`` without touching
+storage.
+"""
+from .images import build_variants
+
+# Cards are ~400px wide at most; 2x covers high-density screens
+WIDTHS = (240, 480, 960)
+
+
+def build_cover_variants(book, force=False):
+    """Generate derivatives for ``book.cover_image``.
+
+    Returns the number of files written, or None if they were already current.
+    """
+    return build_variants(book, 'cover_image', 'cover_variants', WIDTHS, force=force)
@@ -0,0 +1,120 @@
+"""Sending stored files to the client once a view has checked access.
+
+Local files can be handed off to the front server (nginx X-Accel-Redirect or
+Apache/lighttpd X-Sendfile) when MEDIA_SENDFILE_BACKEND is set. Otherwise
+Django streams them itself with single-range ``Range``/``If-Range`` support,
+so pdf.js and download managers can fetch just the bytes they need.
+"""
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe, content_disposition_header
+
+from .streaming import iter_file_chunks, local_path
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """Return ``(start, length)`` for a single satisfiable byte range.
+
+    Returns None when the header is absent or not something we serve as a
+    partial response (e.g. multiple ranges), and raises ValueError when the
+    range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.replace(' ', '')) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:  # Suffix range: the last N bytes
+        length = min(int(last), size)
+        if length == 0:
+            raise ValueError(header)
+        return size - length, length
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end - start + 1
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return etag is not None and if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and last_modified is not None and int(last_modified) <= since
+
+
+def _sendfile_response(path):
+    backend = settings.MEDIA_SENDFILE_BACKEND
+    if backend == 'nginx':
+        response = HttpResponse()
+        response['X-Accel-Redirect'] = settings.MEDIA_SENDFILE_URL + quote(path.lstrip('/'))
+        return response
+    if backend == 'xsendfile':
+        response = HttpResponse()
+        response['X-Sendfile'] = path
+        return response
+    return None
+
+
+def serve_file(request, field_file, content_type, filename=None, as_attachment=False,
+               etag=None, size=None, cache_control='private, max-age=0'):
+    """Build the response for a stored file (a FieldFile or anything with .path/.url)."""
+    path = local_path(field_file)
+    last_modified = None
+    if path:
+        stat = os.stat(path)
+        size, last_modified = stat.st_size, stat.st_mtime
+    elif size is None:
+        size = field_file.size
+    if etag is None:
+        etag = f'"{size:x}-{int(last_modified or 0):x}"'
+
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponse(status=304)
+    elif path and settings.MEDIA_SENDFILE_BACKEND:
+        response = _sendfile_response(path)  # Front server handles ranges itself
+        response['Content-Type'] = content_type
+    else:
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if byte_range and not _if_range_matches(request, etag, last_modified):
+            byte_range = None  # File changed since the client's copy: send it all
+
+        start, length = byte_range or (0, size)
+        response = StreamingHttpResponse(
+            iter_file_chunks(field_file, start=start, length=length), content_type=content_type,
+        )
+        response['Content-Length'] = str(length)
+        if byte_range:
+            response.status_code = 206
+            response['Content-Range'] = f'bytes {start}-{start + length - 1}/{size}'
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    if filename:
+        response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    return response
+
+
+class LocalFile:
+    """Adapter so plain paths (e.g. cached archives) can go through ``serve_file``."""
+
+    def __init__(self, path):
+        self.path = path
@@ -0,0 +1,71 @@
+"""Who can read which book sets.
+
+A user's purchases and student flag are loaded once, cached per user, and
+dropped whenever a Purchase or UserProfile of theirs is saved or deleted.
+Expiry dates are kept in the cache and checked at read time, so a lapsed
+purchase stops granting access without any invalidation.
+
+Rules:
+    free      everyone, including anonymous visitors
+    paid      an unexpired Purchase
+    students  a student profile (UserProfile.is_student), or a Purchase
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+CACHE_TIMEOUT = 60 * 60
+
+
+def _cache_key(user_id):
+    return f"libraryApp:entitlements:{user_id}"
+
+
+def invalidate_entitlements(user_id):
+    # After commit, so a concurrent request cannot re-cache the old rows
+    transaction.on_commit(lambda: cache.delete(_cache_key(user_id)))
+
+
+class Entitlements:
+    def __init__(self, purchases=None, is_student=False):
+        self.purchases = purchases or {}  # book_set_id -> access_expires (or None for lifetime)
+        self.is_student = is_student
+
+    def has_purchase(self, book_id):
+        if book_id not in self.purchases:
+            return False
+        expires = self.purchases[book_id]
+        return expires is None or expires >= timezone.now()
+
+    def can_read(self, book):
+        if book.access_type == 'free':
+            return True
+        if book.access_type == 'students' and self.is_student:
+            return True
+        return self.has_purchase(book.pk)
+
+    def readable_ids(self, books):
+        """Ids of the sets in ``books`` this user can read (no queries)."""
+        return {book.pk for book in books if self.can_read(book)}
+
+
+def get_entitlements(user):
+    """Entitlements for ``user``, memoised on the user object and cached across requests."""
+    if not user.is_authenticated:
+        return Entitlements()
+    if hasattr(user, '_entitlements'):
+        return user._entitlements
+
+    key = _cache_key(user.pk)
+    data = cache.get(key)
+    if data is None:
+        from .models import Purchase, UserProfile
+
+        data = {
+            'purchases': dict(Purchase.objects.filter(user=user).values_list('book_set_id', 'access_expires')),
+            'is_student': UserProfile.objects.filter(user=user, is_student=True).exists(),
+        }
+        cache.set(key, data, CACHE_TIMEOUT)
+
+    user._entitlements = Entitlements(**data)
+    return user._entitlements
@@ -0,0 +1,89 @@
+"""Helpers for the size-bounded on-disk caches (set archives, page images)."""
+import fcntl
+import glob
+import hashlib
+import os
+import tempfile
+from contextlib import contextmanager
+
+LOCK_STRIPES = 64
+
+# (root, pattern) -> bytes this process believes are cached there. Seeded by a directory scan,
+# then grown by each write; other processes' writes are only seen at the next scan, so the cap
+# can be overshot by what they wrote in between.
+_usage = {}
+
+
+def touch(path):
+    """Mark ``path`` as recently used. Returns False if it has gone away."""
+    try:
+        os.utime(path)
+    except OSError:
+        return False
+    return True
+
+
+def write_atomic(path, data):
+    """Write ``data`` next to ``path`` and rename it into place."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@contextmanager
+def locked(root, key):
+    """Hold an exclusive lock on ``key`` across the processes and threads on this machine.
+
+    Keys share LOCK_STRIPES lock files under ``root/.locks``, so the number of
+    files stays bounded. The cost is that unrelated keys occasionally wait on each other.
+    """
+    directory = os.path.join(root, '.locks')
+    os.makedirs(directory, exist_ok=True)
+    stripe = int(hashlib.md5(key.encode()).hexdigest(), 16) % LOCK_STRIPES
+    with open(os.path.join(directory, f"{stripe}.lock"), 'a') as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def evict_lru(root, pattern, max_bytes):
+    """Drop least recently used files matching ``pattern`` until ``root`` fits ``max_bytes``.
+
+    Returns the bytes left. Scans the whole directory; see ``count_added`` for the cheap path.
+    """
+    entries = []
+    for path in glob.glob(os.path.join(root, pattern)):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+    return total
+
+
+def count_added(root, pattern, size, max_bytes):
+    """Record ``size`` new bytes under ``root``, evicting only once the running total passes ``max_bytes``."""
+    key = (root, pattern)
+    if key in _usage and _usage[key] + size <= max_bytes:
+        _usage[key] += size
+    else:
+        _usage[key] = evict_lru(root, pattern, max_bytes)
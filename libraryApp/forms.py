@@ -1,9 +1,66 @@
 from django import forms
-from .models import BookSet
+from django.urls import reverse
+from django.utils.html import format_html
+from .models import BookSet, UploadSession, Volume
+from .uploads import attach_upload
 
 class SearchForm(forms.Form):
     query = forms.CharField(max_length=100, required=False, label='Search books')
 
 class CheckoutForm(forms.Form):
     # Stripe handles card; this is for any extras like quantity (but single set for now)
-    pass  # Expand if bundles
\ No newline at end of file
+    pass  # Expand if bundles
+
+class ChunkedUploadWidget(forms.HiddenInput):
+    """File picker that uploads in resumable chunks and submits only the upload id."""
+    is_hidden = False  # Render as a visible column in tabular inlines
+
+
+    class Media:
+        js = ('js/chunked_upload.js',)
+
+    def render(self, name, value, attrs=None, renderer=None):
+        hidden = super().render(name, value, attrs, renderer)
+        return format_html(
+            '<div class="chunked-upload" data-url="{}">{}<input type="file" accept="application/pdf"> '
+            '<span class="chunked-upload-status"></span></div>',
+            reverse('upload_start'), hidden,
+        )
+
+class VolumeAdminForm(forms.ModelForm):
+    # For large PDFs; a plain pdf_file upload still works for small ones
+    pdf_upload = forms.UUIDField(
+        required=False, widget=ChunkedUploadWidget, label='Large PDF',
+        help_text='Resumable upload for large files. Replaces the PDF when saved.',
+    )
+
+    class Meta:
+        model = Volume
+        fields = '__all__'
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = user  # Passed by VolumeInline's formset; only their own uploads attach
+        self.fields['pdf_file'].required = False
+        self.upload_session = None
+
+    def clean(self):
+        cleaned_data = super().clean()
+        upload_id = cleaned_data.get('pdf_upload')
+        if upload_id:
+            self.upload_session = UploadSession.objects.filter(
+                pk=upload_id, user=self.user, status=UploadSession.COMPLETE,
+            ).first()
+            if self.upload_session is None:
+                self.add_error('pdf_upload', 'This upload has not finished yet.')
+        elif not cleaned_data.get('pdf_file'):
+            self.add_error('pdf_file', 'Upload a PDF.')
+        return cleaned_data
+
+    def save(self, commit=True):
+        volume = super().save(commit=False)
+        if self.upload_session:
+            attach_upload(volume, self.upload_session)
+        if commit:
+            volume.save()
+        return volume
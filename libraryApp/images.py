@@ -0,0 +1,115 @@
+"""Resized WebP (and, where Pillow can write it, AVIF) copies of uploaded images.
+
+Shared by book covers (covers.py) and the clrSite CMS images. Derivatives are
+built off the request path by a background job and stored next to the
+original under ``derived/``. Their names, the original's dimensions and a
+tiny blurred placeholder are recorded in a JSONField on the row, so
+templates can emit ``srcset`` without touching storage.
+"""
+import base64
+import hashlib
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageFilter, ImageOps
+
+from .streaming import iter_file_chunks
+
+try:
+    import pillow_avif  # noqa: F401  Registers the AVIF plugin on Pillow < 11.2
+except ImportError:
+    pass
+
+# format -> (extension, save options), best first
+FORMATS = {
+    'AVIF': ('avif', {'quality': 50}),
+    'WEBP': ('webp', {'quality': 75, 'method': 4}),
+}
+PLACEHOLDER_WIDTH = 24  # Stretched and smoothed by the browser until the real image arrives
+
+
+def available_formats(formats=None):
+    Image.init()  # Load every plugin so Image.SAVE is complete
+    return [fmt for fmt in formats or FORMATS if fmt in Image.SAVE]
+
+
+def variant_widths(width, widths):
+    """Which of ``widths`` to build for an original ``width`` pixels wide; never upscales."""
+    targets = [w for w in widths if w < width]
+    if width <= widths[-1]:
+        targets.append(width)
+    return targets
+
+
+def blur_placeholder(image):
+    """A few hundred bytes of blurred WebP as a ``data:`` URI, or '' for images with transparency."""
+    if 'A' in image.getbands():
+        return ''  # Would show through the transparent parts of the real image
+    width, height = image.size
+    small = image.resize((PLACEHOLDER_WIDTH, max(1, round(height * PLACEHOLDER_WIDTH / width))), Image.BILINEAR)
+    buffer = BytesIO()
+    small.filter(ImageFilter.GaussianBlur(1)).save(buffer, 'WEBP', quality=40)
+    return 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+
+def render_variants(data, widths, formats=None):
+    """Return ``((width, height), placeholder, variants)`` for an encoded image.
+
+    ``variants`` lazily yields ``(format, width, bytes)`` for each derivative.
+    """
+    with Image.open(BytesIO(data)) as image:
+        full_width = image.size[0]
+        # JPEGs decode straight to a fraction of their size, still at least as large as any variant
+        image.draft('RGB', (widths[-1], widths[-1]))
+        scale = full_width / image.size[0]
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    width, height = image.size
+    original = (round(width * scale), round(height * scale))
+
+    def variants():
+        for target in variant_widths(original[0], widths):
+            target_height = max(1, round(height * target / width))
+            resized = image if (target, target_height) == image.size else \
+                image.resize((target, target_height), Image.LANCZOS, reducing_gap=3.0)
+            for fmt in available_formats(formats):
+                buffer = BytesIO()
+                resized.save(buffer, fmt, **FORMATS[fmt][1])
+                yield fmt, target, buffer.getvalue()
+
+    return original, blur_placeholder(image), variants()
+
+
+def build_variants(instance, field_name, variants_field, widths, formats=None, force=False):
+    """Generate derivatives of ``instance.<field_name>`` and record them in ``instance.<variants_field>``.
+
+    Returns the number of files written, or None if they were already current.
+    """
+    field_file = getattr(instance, field_name)
+    current = getattr(instance, variants_field)
+    source = field_file.name or ''
+    old_names = [name for names in current.get('formats', {}).values() for _, name in names]
+    if not force and current.get('source', '') == source:
+        return None
+
+    variants = {}
+    if source:
+        storage = field_file.storage
+        digest = hashlib.sha256(source.encode()).hexdigest()[:8]
+        directory = posixpath.join(posixpath.dirname(source), 'derived')
+        (width, height), placeholder, rendered = render_variants(b''.join(iter_file_chunks(field_file)), widths, formats)
+        names = {}
+        for fmt, target, data in rendered:
+            ext = FORMATS[fmt][0]
+            name = storage.save(posixpath.join(directory, f"{instance.pk}-{digest}-{target}.{ext}"), ContentFile(data))
+            names.setdefault(ext, []).append([target, name])
+        variants = {'source': source, 'width': width, 'height': height, 'placeholder': placeholder, 'formats': names}
+
+    setattr(instance, variants_field, variants)
+    instance.save(update_fields=[variants_field])
+    new_names = {name for names in variants.get('formats', {}).values() for _, name in names}
+    for name in old_names:
+        if name not in new_names:
+            field_file.storage.delete(name)
+    return len(new_names)
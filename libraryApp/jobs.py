@@ -0,0 +1,124 @@
+"""Database-backed background jobs, run by ``manage.py run_jobs``.
+
+Jobs are unique per ``(kind, object_id)``, so enqueueing the same work twice
+is a no-op while it is still pending. Workers claim a job with a conditional
+UPDATE, which is safe across processes on both Postgres and SQLite.
+
+HANDLERS holds libraryApp's own job kinds. Other apps add theirs with
+``register()`` from their ``AppConfig.ready()``.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+# kind -> dotted path of a callable taking the job's object_id
+HANDLERS = {
+    'preview': 'libraryApp.tasks.build_preview',
+    'page_text': 'libraryApp.tasks.index_page_text',
+    'cover': 'libraryApp.tasks.build_covers',
+    'stripe_events': 'libraryApp.tasks.apply_stripe_events',  # Single job, object_id 0
+    'uploads': 'libraryApp.tasks.assemble_uploads',  # Single job, object_id 0
+}
+
+RETRY_BASE_DELAY = 30  # seconds, doubled on every failed attempt
+STALE_AFTER = timedelta(minutes=15)  # Running jobs older than this are assumed dead
+
+
+def register(kind, path):
+    """Add job kind ``kind``, run by the callable at dotted ``path``."""
+    if HANDLERS.setdefault(kind, path) != path:
+        raise ValueError(f"Job kind {kind} is already handled by {HANDLERS[kind]}")
+
+
+def enqueue(kind, object_id):
+    """Queue ``kind`` work for ``object_id`` unless it is already waiting."""
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            job, created = BackgroundJob.objects.get_or_create(kind=kind, object_id=object_id)
+    except IntegrityError:
+        job, created = BackgroundJob.objects.get(kind=kind, object_id=object_id), False
+    if created or job.status == BackgroundJob.PENDING:
+        return job
+
+    # Finished, failed or mid-run: queue a fresh run. A running worker sees the
+    # status change and leaves the job pending when it finishes.
+    BackgroundJob.objects.filter(pk=job.pk).update(
+        status=BackgroundJob.PENDING, attempts=0, run_after=now, last_error='', updated_at=now,
+    )
+    job.refresh_from_db()
+    return job
+
+
+def job_status(kind, object_id):
+    return (
+        BackgroundJob.objects.filter(kind=kind, object_id=object_id)
+        .values_list('status', flat=True)
+        .first()
+    )
+
+
+def claim_next(kinds=None):
+    """Claim the next due job for this worker, or return None."""
+    now = timezone.now()
+    due = BackgroundJob.objects.filter(
+        status=BackgroundJob.PENDING, run_after__lte=now,
+    ) | BackgroundJob.objects.filter(
+        status=BackgroundJob.RUNNING, locked_at__lt=now - STALE_AFTER,
+    )
+    if kinds:
+        due = due.filter(kind__in=kinds)
+
+    for job in due.order_by('run_after', 'id')[:10]:
+        claimed = BackgroundJob.objects.filter(
+            pk=job.pk, status=job.status, locked_at=job.locked_at,
+        ).update(status=BackgroundJob.RUNNING, locked_at=now, attempts=job.attempts + 1, updated_at=now)
+        if claimed:
+            job.status, job.locked_at, job.attempts = BackgroundJob.RUNNING, now, job.attempts + 1
+            return job
+    return None
+
+
+def run_job(job):
+    """Run a claimed job and record the outcome. Returns True on success."""
+    running = BackgroundJob.objects.filter(pk=job.pk, status=BackgroundJob.RUNNING, locked_at=job.locked_at)
+    try:
+        import_string(HANDLERS[job.kind])(job.object_id)
+    except Exception as e:
+        logger.exception("Job %s:%s failed", job.kind, job.object_id)
+        now = timezone.now()
+        if job.attempts >= job.max_attempts:
+            running.update(status=BackgroundJob.FAILED, last_error=traceback.format_exc(), updated_at=now)
+        else:
+            delay = timedelta(seconds=RETRY_BASE_DELAY * 2 ** (job.attempts - 1))
+            running.update(
+                status=BackgroundJob.PENDING, run_after=now + delay, last_error=str(e), updated_at=now,
+            )
+        return False
+
+    running.update(status=BackgroundJob.DONE, last_error='', updated_at=timezone.now())
+    return True
+
+
+def run_pending(kinds=None, limit=None):
+    """Work through due jobs until none are left. Returns ``(succeeded, failed)``."""
+    succeeded = failed = 0
+    while limit is None or succeeded + failed < limit:
+        job = claim_next(kinds)
+        if job is None:
+            break
+        if run_job(job):
+            succeeded += 1
+        else:
+            failed += 1
+    return succeeded, failed
@@ -0,0 +1,125 @@
+import hashlib
+import os
+import resource
+import tempfile
+import textwrap
+import time
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from PIL import Image
+from PyPDF2 import PdfWriter
+from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+from libraryApp.previews import PreviewBudgetExceeded, render_preview
+
+
+def _text_pdf(path, pages):
+    writer = PdfWriter()
+    # PyPDF2 3.0 has no public way to add an indirect object, which page contents must be
+    font = writer._add_object(DictionaryObject({
+        NameObject('/Type'): NameObject('/Font'),
+        NameObject('/Subtype'): NameObject('/Type1'),
+        NameObject('/BaseFont'): NameObject('/Helvetica'),
+    }))
+    resources = DictionaryObject({NameObject('/Font'): DictionaryObject({NameObject('/F1'): font})})
+    lines = textwrap.wrap('Lorem ipsum dolor sit amet. ' * 80, 90)
+    for number in range(pages):
+        text = ' T* '.join(f"({line})Tj" for line in [f"Page {number + 1}", *lines])
+        content = DecodedStreamObject()
+        content.set_data(f"BT /F1 10 Tf 12 TL 72 720 Td {text} ET".encode())
+        page = writer.add_blank_page(612, 792)
+        page[NameObject('/Resources')] = resources
+        page[NameObject('/Contents')] = writer._add_object(content.flate_encode())
+    with open(path, 'wb') as fh:
+        writer.write(fh)
+
+
+def _scanned_pdf(path, pages):
+    scan = Image.effect_noise((1275, 1650), 48).convert('RGB')  # Letter at 150 dpi
+    # Pillow stores each page as its own JPEG stream, as a scanner would
+    scan.save(path, 'PDF', save_all=True, append_images=[scan] * (pages - 1), resolution=150, quality=75)
+
+
+SAMPLES = (
+    ('small', _text_pdf, 20),
+    ('large', _text_pdf, 2000),
+    ('scanned', _scanned_pdf, 40),
+)
+
+
+def _measure(source_path, preview_pages, max_bytes, time_budget):
+    """Build one preview in this (fresh) process and report time, peak memory growth and output."""
+    import PyPDF2  # noqa: F401 - imported up front so its own footprint is not counted
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    fd, target_path = tempfile.mkstemp(suffix='.pdf')
+    os.close(fd)
+    started = time.perf_counter()
+    try:
+        num_pages, total_pages = render_preview(source_path, preview_pages, target_path, max_bytes, time_budget)
+        elapsed = time.perf_counter() - started
+        digest = hashlib.sha256()
+        with open(target_path, 'rb') as preview:
+            for chunk in iter(lambda: preview.read(64 * 1024), b''):
+                digest.update(chunk)
+        size = os.path.getsize(target_path)
+    except PreviewBudgetExceeded as e:
+        return {'error': str(e)}
+    finally:
+        os.remove(target_path)
+    return {
+        'seconds': elapsed,
+        'peak_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline,
+        'pages': num_pages,
+        'total_pages': total_pages,
+        'size': size,
+        'sha256': digest.hexdigest(),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Measure preview PDF building on small, large and scanned sample PDFs (or the given files)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('pdfs', nargs='*', help='PDF files to measure instead of the generated samples')
+        parser.add_argument('--pages', type=int, default=10, help='Preview pages to extract')
+        parser.add_argument('--runs', type=int, default=3, help='Builds per PDF; outputs must be identical')
+        parser.add_argument('--max-bytes', type=int, default=settings.PREVIEW_MAX_BYTES)
+        parser.add_argument('--time-budget', type=int, default=settings.PREVIEW_TIME_BUDGET)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as workdir:
+            sources = [(os.path.basename(path), path) for path in options['pdfs']]
+            if not sources:
+                for name, generate, pages in SAMPLES:
+                    path = os.path.join(workdir, f"{name}.pdf")
+                    generate(path, pages)
+                    sources.append((name, path))
+
+            self.stdout.write(f"{'PDF':<16}{'size':>10}{'pages':>8}{'preview':>9}{'median s':>10}"
+                              f"{'peak MB':>9}{'output KB':>11}  identical")
+            context = get_context('spawn')
+            for name, path in sources:
+                results = []
+                for _ in range(options['runs']):
+                    # A fresh interpreter per build, so peak memory is not inherited from this one or earlier runs
+                    with context.Pool(1) as pool:
+                        results.append(pool.apply(_measure, (
+                            path, options['pages'], options['max_bytes'], options['time_budget'],
+                        )))
+                self._report(name, os.path.getsize(path), results)
+
+    def _report(self, name, source_size, results):
+        failed = next((result['error'] for result in results if 'error' in result), None)
+        if failed:
+            self.stdout.write(self.style.ERROR(f"{name:<16}{source_size // 1024 ** 2:>8}MB  {failed}"))
+            return
+        first = results[0]
+        seconds = sorted(result['seconds'] for result in results)[len(results) // 2]
+        peak_mb = max(result['peak_kb'] for result in results) / 1024
+        identical = len({result['sha256'] for result in results}) == 1
+        line = (f"{name:<16}{source_size / 1024 ** 2:>8.1f}MB{first['total_pages']:>8}{first['pages']:>9}"
+                f"{seconds:>10.3f}{peak_mb:>9.1f}{first['size'] / 1024:>11.0f}  {'yes' if identical else 'NO'}")
+        self.stdout.write(self.style.SUCCESS(line) if identical else self.style.ERROR(line))
@@ -0,0 +1,34 @@
+from functools import partial
+
+from django.core.management.base import BaseCommand
+
+from libraryApp.covers import build_cover_variants
+from libraryApp.models import BookSet
+from libraryApp.parallel import run_batch
+
+
+def _build(force, book_id):
+    """Build one set's cover derivatives. Returns the file count, or None if they were current."""
+    return build_cover_variants(BookSet.objects.get(pk=book_id), force=force)
+
+
+class Command(BaseCommand):
+    help = 'Generate resized WebP/AVIF cover images for book sets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Number of worker processes')
+        parser.add_argument('--force', action='store_true', help='Rebuild derivatives even if the cover is unchanged')
+
+    def handle(self, *args, **options):
+        book_ids = list(BookSet.objects.exclude(cover_image='').exclude(cover_image__isnull=True).values_list('id', flat=True))
+        self.stdout.write(f"Found {len(book_ids)} book sets with covers")
+
+        result = run_batch(
+            self, partial(_build, options['force']), book_ids, options['workers'],
+            name='Book set {}'.format, failed='error building covers', done='wrote {} images',
+        )
+
+        self.stdout.write(
+            f"\nBuilt {result.done}, skipped {result.skipped}, failed {len(result.failures)} "
+            f"({result.count} images) in {result.elapsed:.1f}s"
+        )
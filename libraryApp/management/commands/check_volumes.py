@@ -1,34 +1,101 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
 from django.core.management.base import BaseCommand
+
+from libraryApp.blobs import list_stored_files
+from libraryApp.jobs import enqueue
 from libraryApp.models import Volume
-import os
-from django.conf import settings
+from libraryApp.previews import preview_source_key
+
+# Where Volume files are stored (see blobs.volume_pdf_path and Volume.preview_pdf)
+FIELD_PREFIXES = {'pdf_file': 'volumes/', 'preview_pdf': 'previews/'}
+
 
 class Command(BaseCommand):
-    help = 'Check Volume records and their associated files'
+    help = 'Diff Volume records against the files in storage and report problems as JSON'
 
-    def handle(self, *args, **kwargs):
-        volumes = Volume.objects.all()
-        self.stdout.write(f"Found {volumes.count()} volumes")
-        
-        for volume in volumes:
-            self.stdout.write(f"\nVolume {volume.id}: {volume}")
-            
-            # Check PDF file
-            if volume.pdf_file:
-                pdf_path = os.path.join(settings.MEDIA_ROOT, str(volume.pdf_file))
-                if os.path.exists(pdf_path):
-                    self.stdout.write(self.style.SUCCESS(f"PDF exists at {pdf_path}"))
-                else:
-                    self.stdout.write(self.style.ERROR(f"PDF missing at {pdf_path}"))
-            else:
-                self.stdout.write(self.style.WARNING("No PDF file assigned"))
-            
-            # Check preview PDF
-            if volume.preview_pdf:
-                preview_path = os.path.join(settings.MEDIA_ROOT, str(volume.preview_pdf))
-                if os.path.exists(preview_path):
-                    self.stdout.write(self.style.SUCCESS(f"Preview exists at {preview_path}"))
-                else:
-                    self.stdout.write(self.style.ERROR(f"Preview missing at {preview_path}"))
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=16, help='Threads for per-file storage lookups')
+        parser.add_argument('--fix', action='store_true', help='Queue preview rebuilds for missing or outdated previews')
+
+    def handle(self, *args, **options):
+        self.workers = options['workers']
+        volumes = list(Volume.objects.select_related('book_set').order_by('pk'))
+        report = {
+            'volumes': len(volumes),
+            'listing': {},
+            'missing': [],
+            'size_mismatches': [],
+            'orphans': [],
+            'no_pdf': [volume.pk for volume in volumes if not volume.pdf_file],
+            'stale_previews': [],
+        }
+
+        for field_name, prefix in FIELD_PREFIXES.items():
+            storage = Volume._meta.get_field(field_name).storage
+            referenced = {}  # name -> volumes using it
+            for volume in volumes:
+                name = getattr(volume, field_name).name
+                if name:
+                    referenced.setdefault(name, []).append(volume)
+
+            listing = list_stored_files(storage, prefix)
+            report['listing'][field_name] = 'per-file' if listing is None else 'bulk'
+            if listing is None:
+                listing = self._existing(storage, referenced)
             else:
-                self.stdout.write(self.style.WARNING("No preview PDF assigned"))
\ No newline at end of file
+                outside = [name for name in referenced if name not in listing]  # Legacy names from before the prefix
+                listing.update(self._existing(storage, outside))
+                report['orphans'].extend(sorted(name for name in listing if name not in referenced))
+
+            if field_name == 'pdf_file':
+                # Sizes only matter where one was recorded, so only those are looked up
+                unknown = [name for name, size in listing.items()
+                           if size is None and name in referenced and any(v.pdf_size for v in referenced[name])]
+                listing.update(self._sizes(storage, unknown))
+
+            for name, users in referenced.items():
+                if listing.get(name, False) is False:
+                    report['missing'].extend({'volume': v.pk, 'field': field_name, 'name': name} for v in users)
+                elif field_name == 'pdf_file':
+                    report['size_mismatches'].extend(
+                        {'volume': v.pk, 'name': name, 'recorded': v.pdf_size, 'stored': listing[name]}
+                        for v in users if v.pdf_size and listing[name] is not None and listing[name] != v.pdf_size
+                    )
+
+        missing_pdfs = {entry['volume'] for entry in report['missing'] if entry['field'] == 'pdf_file'}
+        missing_previews = {entry['volume'] for entry in report['missing'] if entry['field'] == 'preview_pdf'}
+        for volume in volumes:
+            if not volume.pdf_file or volume.pk in missing_pdfs:
+                continue
+            current = volume.pdf_sha256 and volume.preview_source == preview_source_key(
+                volume.pdf_sha256, volume.book_set.preview_pages)
+            if not volume.preview_pdf or volume.pk in missing_previews or not current:
+                report['stale_previews'].append(volume.pk)
+
+        if options['fix']:
+            for volume_id in report['stale_previews']:
+                if volume_id in missing_previews:
+                    # The job skips volumes whose preview looks current, so forget the lost file first
+                    Volume.objects.filter(pk=volume_id).update(preview_pdf='', preview_source='')
+                enqueue('preview', volume_id)
+            report['queued_previews'] = report['stale_previews']
+
+        self.stdout.write(json.dumps(report, indent=2))
+        problems = len(report['missing']) + len(report['size_mismatches']) + len(report['stale_previews'])
+        style = self.style.ERROR if problems else self.style.SUCCESS
+        self.stderr.write(style(
+            f"{len(volumes)} volumes: {len(report['missing'])} missing files, {len(report['size_mismatches'])} size "
+            f"mismatches, {len(report['orphans'])} orphans, {len(report['stale_previews'])} stale previews"
+        ))
+
+    def _existing(self, storage, names):
+        """``{name: None}`` for those of ``names`` that exist, checked in parallel."""
+        names = list(names)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return {name: None for name, exists in zip(names, pool.map(storage.exists, names)) if exists}
+
+    def _sizes(self, storage, names):
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return dict(zip(names, pool.map(storage.size, names)))
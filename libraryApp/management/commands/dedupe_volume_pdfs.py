@@ -0,0 +1,85 @@
+import hashlib
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from libraryApp.blobs import release, volume_pdf_path
+from libraryApp.models import Volume
+from libraryApp.streaming import iter_file_chunks
+
+
+def _hash(field_file):
+    digest, size = hashlib.sha256(), 0
+    for chunk in iter_file_chunks(field_file):
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def _pick(current, candidate, preferred):
+    """Keep one stored name per content, favouring the content-addressed one."""
+    if current is None or (candidate[0] == preferred and current[0] != preferred):
+        return candidate
+    return current
+
+
+class Command(BaseCommand):
+    help = 'Hash existing volume PDFs and point duplicates at one shared stored file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report duplicates without changing anything')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        volumes = list(Volume.objects.exclude(pdf_file='').order_by('pk'))
+        canonical = {}  # sha256 -> (pdf name, page count)
+        previews = {}  # preview_source -> (preview name, page count)
+        hashed = repointed = freed = 0
+
+        for volume in volumes:
+            if not volume.pdf_sha256 or not volume.pdf_size:
+                volume.pdf_sha256, volume.pdf_size = _hash(volume.pdf_file)
+                volume.hashed = True
+                hashed += 1
+            canonical[volume.pdf_sha256] = _pick(
+                canonical.get(volume.pdf_sha256), (volume.pdf_file.name, volume.pdf_page_count),
+                volume_pdf_path(volume, ''),
+            )
+            if volume.preview_pdf and volume.preview_source:
+                previews[volume.preview_source] = _pick(
+                    previews.get(volume.preview_source), (volume.preview_pdf.name, volume.preview_page_count), None,
+                )
+
+        for volume in volumes:
+            updates = {}
+            if getattr(volume, 'hashed', False):
+                updates['pdf_sha256'], updates['pdf_size'] = volume.pdf_sha256, volume.pdf_size
+            released = []
+            name, page_count = canonical[volume.pdf_sha256]
+            if name != volume.pdf_file.name:
+                updates['pdf_file'] = name
+                updates['pdf_page_count'] = page_count or volume.pdf_page_count
+                released.append((volume.pdf_file, 'pdf_file', volume.pdf_file.name))
+            if volume.preview_source in previews and volume.preview_pdf:
+                preview, preview_pages = previews[volume.preview_source]
+                if preview != volume.preview_pdf.name:
+                    updates['preview_pdf'] = preview
+                    updates['preview_page_count'] = preview_pages
+                    released.append((volume.preview_pdf, 'preview_pdf', volume.preview_pdf.name))
+
+            if released:
+                repointed += 1
+                freed += len(released)
+                self.stdout.write(f"Volume {volume.pk}: now sharing {', '.join(n for _, _, n in released)} -> "
+                                  f"{', '.join(updates[f] for f in ('pdf_file', 'preview_pdf') if f in updates)}")
+            if updates and not dry_run:
+                with transaction.atomic():
+                    # update() rather than save(): the content is unchanged, so no signals or rebuilds
+                    Volume.objects.filter(pk=volume.pk).update(**updates)
+                    for field_file, field_name, old_name in released:
+                        release(field_file, field_name, old_name)
+
+        prefix = '(dry run) ' if dry_run else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}Hashed {hashed} volumes, repointed {repointed}, released {freed} duplicate files"
+        ))
@@ -0,0 +1,35 @@
+from functools import partial
+
+from django.core.management.base import BaseCommand
+
+from libraryApp.models import Volume
+from libraryApp.pagetext import index_volume_text
+from libraryApp.parallel import run_batch
+
+
+def _index(force, volume_id):
+    """Index one volume. Returns the page count, or None if it was unchanged."""
+    return index_volume_text(Volume.objects.get(pk=volume_id), force=force)
+
+
+class Command(BaseCommand):
+    help = 'Extract per-page text from volume PDFs into the search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Number of worker processes')
+        parser.add_argument('--force', action='store_true', help='Re-index volumes even if their PDF is unchanged')
+
+    def handle(self, *args, **options):
+        volume_ids = list(Volume.objects.exclude(pdf_file='').values_list('id', flat=True))
+        self.stdout.write(f"Found {len(volume_ids)} volumes")
+
+        result = run_batch(
+            self, partial(_index, options['force']), volume_ids, options['workers'],
+            name='Volume {}'.format, failed='error extracting text', done='indexed {} pages',
+        )
+
+        rate = result.count / result.elapsed if result.elapsed else 0
+        self.stdout.write(
+            f"\nIndexed {result.done}, skipped {result.skipped}, failed {len(result.failures)} "
+            f"in {result.elapsed:.1f}s ({rate:.1f} pages/s)"
+        )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from libraryApp.payments import breaker, latency_histogram
+
+
+class Command(BaseCommand):
+    help = 'Show payment provider call latency histograms and circuit breaker state'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--operation', action='append', help='Operation name (default: checkout.session.create)')
+
+    def handle(self, *args, **options):
+        state = 'OPEN (failing fast)' if breaker.is_open() else 'closed'
+        self.stdout.write(f"Circuit breaker: {state}")
+        for operation in options['operation'] or ['checkout.session.create']:
+            histogram = latency_histogram(operation)
+            total = sum(count for _, count in histogram)
+            self.stdout.write(f"\n{operation}: {total} calls")
+            for bound, count in histogram:
+                label = f"<= {bound} ms" if bound is not None else f"> {histogram[-2][0]} ms"
+                share = count / total * 100 if total else 0
+                self.stdout.write(f"  {label:>12}  {count:>6}  {share:5.1f}%")
@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from libraryApp.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for all book sets'
+
+    def handle(self, *args, **kwargs):
+        started = time.monotonic()
+        count = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {count} book sets in {time.monotonic() - started:.1f}s"
+        ))
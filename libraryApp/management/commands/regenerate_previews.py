@@ -1,50 +1,41 @@
+from functools import partial
+
 from django.core.management.base import BaseCommand
+
 from libraryApp.models import Volume
-import os
-from django.conf import settings
+from libraryApp.parallel import run_batch
+from libraryApp.previews import build_volume_preview
+
+
+def _regenerate(incremental, volume_id):
+    """Rebuild one volume's preview. Returns the page count, or None if it was skipped."""
+    volume = Volume.objects.select_related('book_set').get(pk=volume_id)
+    return build_volume_preview(volume, force=not incremental)
+
 
 class Command(BaseCommand):
     help = 'Regenerate preview PDFs for all volumes'
 
-    def handle(self, *args, **kwargs):
-        volumes = Volume.objects.all()
-        self.stdout.write(f"Found {volumes.count()} volumes")
-        
-        # Clear existing previews
-        preview_dir = os.path.join(settings.MEDIA_ROOT, 'previews')
-        if os.path.exists(preview_dir):
-            for file in os.listdir(preview_dir):
-                if file.endswith('.pdf'):
-                    os.remove(os.path.join(preview_dir, file))
-        
-        for volume in volumes:
-            self.stdout.write(f"\nRegenerating preview for Volume {volume.id}: {volume}")
-            try:
-                # Clear existing preview
-                if volume.preview_pdf:
-                    volume.preview_pdf.delete()
-                
-                # Force preview regeneration
-                import PyPDF2
-                from io import BytesIO
-                
-                # Read full PDF
-                full_pdf = PyPDF2.PdfReader(volume.pdf_file.open())
-                preview_writer = PyPDF2.PdfWriter()
-                num_pages = min(volume.book_set.preview_pages, len(full_pdf.pages))
-                
-                # Add first N pages to preview
-                for page_num in range(num_pages):
-                    preview_writer.add_page(full_pdf.pages[page_num])
-                
-                # Save to BytesIO and upload
-                buffer = BytesIO()
-                preview_writer.write(buffer)
-                buffer.seek(0)
-                
-                preview_name = f"preview_{os.path.basename(volume.pdf_file.name)}"
-                volume.preview_pdf.save(preview_name, buffer, save=True)
-                
-                self.stdout.write(self.style.SUCCESS(f"Successfully regenerated preview as {preview_name}"))
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f"Error generating preview: {e}"))
\ No newline at end of file
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Number of worker processes')
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Skip volumes whose PDF and preview page count are unchanged since the last build',
+        )
+
+    def handle(self, *args, **options):
+        volume_ids = list(Volume.objects.exclude(pdf_file='').values_list('id', flat=True))
+        self.stdout.write(f"Found {len(volume_ids)} volumes")
+
+        result = run_batch(
+            self, partial(_regenerate, options['incremental']), volume_ids, options['workers'],
+            name='Volume {}'.format, failed='error generating preview', done='regenerated {} pages',
+        )
+
+        rate = result.count / result.elapsed if result.elapsed else 0
+        self.stdout.write(
+            f"\nBuilt {result.done}, skipped {result.skipped}, failed {len(result.failures)} "
+            f"in {result.elapsed:.1f}s ({rate:.1f} pages/s)"
+        )
+        for volume_id, error in result.failures:
+            self.stdout.write(self.style.ERROR(f"  Volume {volume_id}: {error}"))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from libraryApp.jobs import HANDLERS, run_pending
+
+
+class Command(BaseCommand):
+    help = 'Process queued background jobs (preview generation etc.)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--kind', action='append', choices=sorted(HANDLERS), help='Only run jobs of this kind')
+
+    def handle(self, *args, **options):
+        kinds = options['kind']
+        self.stdout.write(f"Worker started for: {', '.join(kinds or sorted(HANDLERS))}")
+
+        while True:
+            close_old_connections()
+            succeeded, failed = run_pending(kinds)
+            if succeeded or failed:
+                self.stdout.write(f"Processed {succeeded + failed} jobs ({failed} failed)")
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 12:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryApp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='volume',
+            name='pdf_sha256',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
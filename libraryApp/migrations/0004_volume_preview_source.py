@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 12:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryApp', '0003_backgroundjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='volume',
+            name='preview_source',
+            field=models.CharField(blank=True, editable=False, max_length=80),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.0.14 on 2026-10-18 12:55
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+FTS_TABLE = 'libraryApp_bookset_fts'
+
+POSTGRES_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(author, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')"
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS "libraryApp_bookset_search_gin" '
+            'ON "libraryApp_bookset" USING gin ("search_vector")'
+        )
+        schema_editor.execute(f'UPDATE "libraryApp_bookset" SET "search_vector" = {POSTGRES_VECTOR}')
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS "{FTS_TABLE}" USING fts5(title, author, description)'
+        )
+        schema_editor.execute(
+            f'INSERT INTO "{FTS_TABLE}" (rowid, title, author, description) '
+            'SELECT id, title, author, description FROM "libraryApp_bookset"'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS "libraryApp_bookset_search_gin"')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS "{FTS_TABLE}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryApp', '0004_volume_preview_source'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookset',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
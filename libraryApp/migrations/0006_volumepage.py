@@ -0,0 +1,59 @@
+# Generated by Django 5.0.14 on 2026-10-18 12:56
+
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+PAGE_FTS_TABLE = 'libraryApp_volumepage_fts'
+
+
+def create_page_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS "libraryApp_volumepage_search_gin" '
+            'ON "libraryApp_volumepage" USING gin ("search_vector")'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS "{PAGE_FTS_TABLE}" USING fts5(text, volume_id UNINDEXED)'
+        )
+
+
+def drop_page_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS "libraryApp_volumepage_search_gin"')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS "{PAGE_FTS_TABLE}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryApp', '0005_bookset_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='volume',
+            name='text_source',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.CreateModel(
+            name='VolumePage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.PositiveIntegerField()),
+                ('text', models.TextField(blank=True)),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(editable=False, null=True)),
+                ('volume', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='libraryApp.volume')),
+            ],
+            options={
+                'ordering': ['volume', 'page_number'],
+                'unique_together': {('volume', 'page_number')},
+            },
+        ),
+        migrations.RunPython(create_page_index, drop_page_index),
+    ]
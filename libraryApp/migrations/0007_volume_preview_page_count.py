@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 12:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryApp', '0006_volumepage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='volume',
+            name='preview_page_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
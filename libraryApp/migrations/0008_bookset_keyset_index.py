@@ -0,0 +1,17 @@
+# Generated by Django 5.0.14 on 2026-10-18 13:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryApp', '0007_volume_preview_page_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookset',
+            index=models.Index(fields=['created_at', 'id'], name='libraryApp__created_a5ce7c_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 13:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryApp', '0008_bookset_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookset',
+            name='cover_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
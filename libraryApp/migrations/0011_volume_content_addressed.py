@@ -0,0 +1,34 @@
+# Generated by Django 5.0.14 on 2026-10-18 13:11
+
+import libraryApp.blobs
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryApp', '0010_stripeevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='volume',
+            name='pdf_page_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='volume',
+            name='pdf_size',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='volume',
+            name='pdf_file',
+            field=models.FileField(upload_to=libraryApp.blobs.volume_pdf_path),
+        ),
+        migrations.AlterField(
+            model_name='volume',
+            name='pdf_sha256',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+    ]
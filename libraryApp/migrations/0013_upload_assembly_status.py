@@ -0,0 +1,29 @@
+# Generated by Django 5.0.14 on 2026-10-18 13:50
+
+from django.db import migrations, models
+
+
+def mark_assembled(apps, schema_editor):
+    UploadSession = apps.get_model('libraryApp', 'UploadSession')
+    UploadSession.objects.exclude(stored_name='').update(status='complete')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryApp', '0012_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='status',
+            field=models.CharField(choices=[('uploading', 'Uploading'), ('assembling', 'Assembling'), ('complete', 'Complete'), ('failed', 'Failed')], default='uploading', max_length=10),
+        ),
+        migrations.RunPython(mark_assembled, migrations.RunPython.noop),
+    ]
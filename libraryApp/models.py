@@ -1,10 +1,21 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_save, post_delete, m2m_changed
 from django.dispatch import receiver
+from django.contrib.postgres.search import SearchVectorField
 from django.utils.text import slugify
-import PyPDF2  # For preview generation
-from io import BytesIO
+from django.utils import timezone
+import hashlib
+import logging
+import uuid
+from .archives import invalidate_set_archives
+from .blobs import find_shared_pdf, release, volume_pdf_path
+from .catalog import bump_book_version, bump_catalog_version
+from .streaming import iter_file_chunks
+from .search import update_search_index, remove_from_search_index, remove_volume_pages
+from .entitlements import invalidate_entitlements
+
+logger = logging.getLogger(__name__)
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
@@ -24,6 +35,12 @@ def create_user_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance)
 
+# Student status feeds into cached entitlements
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_profile_entitlements(sender, instance, **kwargs):
+    invalidate_entitlements(instance.user_id)
+
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -52,6 +69,7 @@ class BookSet(models.Model):
     title = models.CharField(max_length=200)
     author = models.CharField(max_length=100, default="Your Client's Name")  # Customize as needed
     cover_image = models.ImageField(upload_to='covers/', blank=True, null=True)
+    cover_variants = models.JSONField(default=dict, blank=True, editable=False)  # Resized covers, see covers.py
     description = models.TextField()
     categories = models.ManyToManyField(Category, related_name='book_sets')
     access_type = models.CharField(max_length=20, choices=ACCESS_CHOICES, default='paid')
@@ -59,49 +77,204 @@ class BookSet(models.Model):
     preview_pages = models.PositiveIntegerField(default=10)  # Pages to extract for preview
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    search_vector = SearchVectorField(null=True, editable=False)  # Postgres only, see search.py
 
     def __str__(self):
         return self.title
 
     class Meta:
         ordering = ['-created_at']
-        indexes = [models.Index(fields=['title', 'access_type'])]
+        indexes = [
+            models.Index(fields=['title', 'access_type']),
+            models.Index(fields=['created_at', 'id']),  # Keyset pagination, see pagination.py
+        ]
+
+# Keep the full-text index in step with the catalog
+@receiver(post_save, sender=BookSet)
+def index_book_set(sender, instance, **kwargs):
+    update_search_index([instance.pk])
+
+@receiver(post_delete, sender=BookSet)
+def unindex_book_set(sender, instance, **kwargs):
+    remove_from_search_index([instance.pk])
+
+# Any catalog edit retires every cached listing at once (see catalog.py)
+@receiver(post_save, sender=BookSet)
+@receiver(post_delete, sender=BookSet)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def bump_catalog(sender, instance, **kwargs):
+    bump_catalog_version()
+    if sender is BookSet:
+        bump_book_version(instance.pk)
+
+# Build resized covers off the request path when a new cover is uploaded
+@receiver(post_save, sender=BookSet)
+def queue_cover_variants(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'cover_image' not in update_fields:
+        return
+    if (instance.cover_image.name or '') != instance.cover_variants.get('source', ''):
+        from .jobs import enqueue
+        enqueue('cover', instance.pk)
+
+@receiver(m2m_changed, sender=BookSet.categories.through)
+def bump_catalog_categories(sender, action, **kwargs):
+    if action.startswith('post_'):
+        bump_catalog_version()
 
 class Volume(models.Model):
     book_set = models.ForeignKey(BookSet, on_delete=models.CASCADE, related_name='volumes')
     volume_number = models.PositiveIntegerField()
     title = models.CharField(max_length=200, blank=True)  # Optional per-volume title
-    pdf_file = models.FileField(upload_to='volumes/')
-    preview_pdf = models.FileField(upload_to='previews/', blank=True)  # Auto-generated
+    pdf_file = models.FileField(upload_to=volume_pdf_path)  # Stored by content hash, shared between volumes
+    preview_pdf = models.FileField(upload_to='previews/', blank=True)  # Auto-generated, shared like pdf_file
+    pdf_sha256 = models.CharField(max_length=64, blank=True, editable=False, db_index=True)  # Content hash of pdf_file
+    pdf_size = models.PositiveBigIntegerField(default=0, editable=False)  # Bytes
+    pdf_page_count = models.PositiveIntegerField(default=0, editable=False)  # Recorded when the preview is built
+    preview_source = models.CharField(max_length=80, blank=True, editable=False)  # "<pdf_sha256>:<pages>" preview was built from
+    text_source = models.CharField(max_length=64, blank=True, editable=False)  # pdf_sha256 the page text was extracted from
+    preview_page_count = models.PositiveIntegerField(default=0, editable=False)  # Pages in preview_pdf
 
     def __str__(self):
         return f"{self.book_set.title} - Volume {self.volume_number}"
 
+    @property
+    def preview_version(self):
+        """Short token that changes whenever the preview is rebuilt (used to bust page image caches)."""
+        source = self.preview_source or self.preview_pdf.name
+        return hashlib.sha256(source.encode()).hexdigest()[:16]
+
+    @property
+    def preview_page_numbers(self):
+        return range(1, self.preview_page_count + 1)
+
     class Meta:
         ordering = ['volume_number']
         unique_together = ['book_set', 'volume_number']  # Prevent duplicates
 
-# Signal to auto-generate preview PDF on volume save
+# Hash new uploads while they are still local, before they go to storage, and files attached already stored
+@receiver(pre_save, sender=Volume)
+def hash_volume_pdf(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'pdf_file' not in update_fields:
+        return
+    duplicate = None
+    stored = Volume.objects.filter(pk=instance.pk).values_list('pdf_file', flat=True).first() if instance.pk else None
+    if instance.pdf_file and not instance.pdf_file._committed:
+        digest = hashlib.sha256()
+        for chunk in instance.pdf_file.chunks():
+            digest.update(chunk)
+        instance.pdf_file.seek(0)
+        instance.pdf_sha256 = digest.hexdigest()
+        instance.pdf_size = instance.pdf_file.size
+        shared = find_shared_pdf(instance.pdf_sha256, exclude_pk=instance.pk)
+        if shared:
+            # Already stored for another volume: reference that file instead of uploading a copy
+            instance.pdf_file.name, instance.pdf_page_count = shared
+            instance.pdf_file._committed = True
+        else:
+            instance.pdf_page_count = 0
+    elif not instance.pdf_file:
+        instance.pdf_sha256 = ''
+        instance.pdf_size = instance.pdf_page_count = 0
+    elif getattr(instance, '_pdf_sha256_verified', False):
+        pass  # Attached from a chunked upload that was hashed server-side
+    elif stored != instance.pdf_file.name:
+        # Already-stored file attached under a new name (FieldFile.save(save=False), commands, scripts)
+        duplicate = _hash_stored_pdf(instance)
+    instance._replaced_pdf = [name for name in (stored, duplicate) if name and name != instance.pdf_file.name]
+
+def _hash_stored_pdf(instance):
+    """Hash a committed pdf_file in place, sharing an identical stored file when there is one.
+
+    Returns the name of the copy given up in favour of the shared file, if any.
+    """
+    known = Volume.objects.filter(pdf_file=instance.pdf_file.name).exclude(pk=instance.pk).exclude(
+        pdf_sha256='').values_list('pdf_sha256', 'pdf_size', 'pdf_page_count').first()
+    if known:
+        # Pointed at a file another volume already holds: its hash still applies
+        instance.pdf_sha256, instance.pdf_size, instance.pdf_page_count = known
+        return None
+    digest, size = hashlib.sha256(), 0
+    try:
+        for chunk in iter_file_chunks(instance.pdf_file):
+            digest.update(chunk)
+            size += len(chunk)
+    except OSError:  # Includes requests' errors
+        # Missing or unreachable: save unhashed, as check_volumes will report it
+        logger.warning("Could not hash %s for volume %s", instance.pdf_file.name, instance.pk, exc_info=True)
+        instance.pdf_sha256 = ''
+        instance.pdf_size = instance.pdf_page_count = 0
+        return None
+    instance.pdf_sha256, instance.pdf_size = digest.hexdigest(), size
+    shared = find_shared_pdf(instance.pdf_sha256, exclude_pk=instance.pk)
+    if shared and shared[0] != instance.pdf_file.name:
+        # Same content as a stored file: use that one and let go of the copy just written
+        duplicate = instance.pdf_file.name
+        instance.pdf_file.name, instance.pdf_page_count = shared
+        return duplicate
+    instance.pdf_page_count = 0
+    return None
+
+# Delete files once the last volume using them lets go (see blobs.py)
+@receiver(post_save, sender=Volume)
+def release_replaced_pdf(sender, instance, **kwargs):
+    for name in getattr(instance, '_replaced_pdf', None) or ():
+        release(instance.pdf_file, 'pdf_file', name)
+    instance._replaced_pdf = None
+
+@receiver(post_delete, sender=Volume)
+def release_volume_files(sender, instance, **kwargs):
+    release(instance.pdf_file, 'pdf_file', instance.pdf_file.name)
+    release(instance.preview_pdf, 'preview_pdf', instance.preview_pdf.name)
+
+# Prebuilt set archives are stale once any of their volumes change
+@receiver(post_save, sender=Volume)
+@receiver(post_delete, sender=Volume)
+def invalidate_volume_archives(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'pdf_file' not in update_fields:
+        return  # e.g. only the preview changed
+    invalidate_set_archives(instance.book_set_id)
+
+# Queue preview generation when there is no preview of the current PDF; run_jobs builds it off the request path
 @receiver(post_save, sender=Volume)
 def generate_preview_pdf(sender, instance, **kwargs):
-    if instance.pdf_file and not instance.preview_pdf:
-        try:
-            # Read full PDF
-            full_pdf = PyPDF2.PdfReader(instance.pdf_file.open())
-            preview_writer = PyPDF2.PdfWriter()
-            num_pages = min(instance.book_set.preview_pages, len(full_pdf.pages))
-            
-            # Add first N pages to preview
-            for page_num in range(num_pages):
-                preview_writer.add_page(full_pdf.pages[page_num])
-            
-            # Save to BytesIO and upload
-            buffer = BytesIO()
-            preview_writer.write(buffer)
-            buffer.seek(0)
-            instance.preview_pdf.save(f"preview_{instance.pdf_file.name}", buffer)
-        except Exception as e:
-            print(f"Error generating preview: {e}")  # Log in prod
+    current = instance.pdf_sha256 and instance.preview_source.startswith(instance.pdf_sha256 + ':')
+    if instance.pdf_file and not (instance.preview_pdf and current):
+        from .jobs import enqueue
+        enqueue('preview', instance.pk)
+
+# Queue page text extraction when the PDF is new or replaced
+@receiver(post_save, sender=Volume)
+def queue_page_text(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'pdf_file' not in update_fields:
+        return
+    if instance.pdf_file and (not instance.pdf_sha256 or instance.text_source != instance.pdf_sha256):
+        from .jobs import enqueue
+        enqueue('page_text', instance.pk)
+
+class VolumePage(models.Model):
+    """Extracted text of one page of a volume, for searching inside PDFs."""
+    volume = models.ForeignKey(Volume, on_delete=models.CASCADE, related_name='pages')
+    page_number = models.PositiveIntegerField()
+    text = models.TextField(blank=True)
+    search_vector = SearchVectorField(null=True, editable=False)  # Postgres only, see search.py
+
+    def __str__(self):
+        return f"{self.volume} - page {self.page_number}"
+
+    class Meta:
+        ordering = ['volume', 'page_number']
+        unique_together = ['volume', 'page_number']
+
+@receiver(post_delete, sender=Volume)
+def unindex_volume_text(sender, instance, **kwargs):
+    remove_volume_pages(instance.pk)
+
+# Drop the set's cached table of contents (see BookDetailView)
+@receiver(post_save, sender=Volume)
+@receiver(post_delete, sender=Volume)
+def bump_volume_book(sender, instance, **kwargs):
+    bump_book_version(instance.book_set_id)
 
 class Purchase(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='purchases')
@@ -116,4 +289,95 @@ class Purchase(models.Model):
         unique_together = ['user', 'book_set']  # One purchase per user/set
         indexes = [models.Index(fields=['purchased_at'])]
 
-        
\ No newline at end of file
+@receiver(post_save, sender=Purchase)
+@receiver(post_delete, sender=Purchase)
+def invalidate_purchase_entitlements(sender, instance, **kwargs):
+    invalidate_entitlements(instance.user_id)
+
+
+class BackgroundJob(models.Model):
+    """A unit of deferred work, processed by ``manage.py run_jobs`` (see jobs.py)."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=30)  # Key into jobs.HANDLERS
+    object_id = models.PositiveBigIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)  # Pushed back on retry
+    locked_at = models.DateTimeField(null=True, blank=True)  # When a worker claimed it
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.kind} #{self.object_id} ({self.status})"
+
+    class Meta:
+        unique_together = ['kind', 'object_id']  # One job per object and kind
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+class StripeEvent(models.Model):
+    """Inbox of verified Stripe webhook events, applied in batches (see webhooks.py)."""
+    event_id = models.CharField(max_length=255, unique=True)  # Stripe's evt_... id; retries are dropped
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()  # The event's data
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)  # Why the event could not be applied
+
+    def __str__(self):
+        return f"{self.type} {self.event_id}"
+
+    class Meta:
+        indexes = [models.Index(fields=['processed_at', 'received_at'])]
+
+class UploadSession(models.Model):
+    """A chunked upload of a large PDF from the admin (see uploads.py)."""
+    UPLOADING = 'uploading'
+    ASSEMBLING = 'assembling'
+    COMPLETE = 'complete'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (UPLOADING, 'Uploading'),
+        (ASSEMBLING, 'Assembling'),
+        (COMPLETE, 'Complete'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()  # Total bytes announced by the client
+    chunk_size = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=UPLOADING)
+    error = models.TextField(blank=True)  # Why assembly failed
+    stored_name = models.CharField(max_length=255, blank=True)  # Set once assembled into media storage
+    sha256 = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def chunk_count(self):
+        return -(-self.size // self.chunk_size)
+
+    def __str__(self):
+        return f"{self.filename} ({self.size} bytes)"
+
+class UploadChunk(models.Model):
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64)  # Verified against the client's checksum
+    size = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ['session', 'index']
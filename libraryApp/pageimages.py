@@ -0,0 +1,73 @@
+"""Rendered WebP images of preview pages, cached on local disk.
+
+Each page is rasterised once with PyMuPDF and kept under PAGE_IMAGE_ROOT until
+evicted by size. PyMuPDF is AGPL-3.0, so it is an optional extra
+(requirements-render.txt): without it the page reader is hidden, these
+images 404 and readers get the preview PDF. File names carry the preview
+version, so a rebuilt preview never serves stale images and old ones simply
+age out. A miss renders from a local copy of the preview, so a remote PDF is
+never held in memory. It runs under a lock, so concurrent first requests for
+a page render it only once.
+"""
+import os
+from importlib.util import find_spec
+from io import BytesIO
+
+from django.conf import settings
+from PIL import Image
+
+from .filecache import count_added, locked, touch, write_atomic
+from .streaming import local_copy
+
+RENDERER_INSTALLED = find_spec('fitz') is not None
+
+# Target pixel widths for each rendition
+WIDTHS = {
+    'page': 1200,
+    'thumb': 200,
+}
+WEBP_QUALITY = 80
+
+
+def page_image_path(volume, page_number, rendition):
+    name = f"{volume.pk}-{volume.preview_version}-{page_number}-{rendition}.webp"
+    return os.path.join(settings.PAGE_IMAGE_ROOT, name)
+
+
+def render_page(pdf_path, page_number, width):
+    """Rasterise one page (numbered from 1) of a PDF to WebP bytes ``width`` pixels wide."""
+    import fitz  # PyMuPDF
+
+    with fitz.open(pdf_path) as doc:
+        if not 1 <= page_number <= doc.page_count:
+            raise IndexError(page_number)
+        page = doc[page_number - 1]
+        zoom = width / page.rect.width
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+
+    image = Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+    buffer = BytesIO()
+    image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def get_page_image(volume, page_number, rendition='page'):
+    """Return the path of the cached rendition, rendering it on first use.
+
+    Raises IndexError if the page is outside the preview.
+    """
+    # Previews built before page counts were recorded are range-checked while rendering
+    if volume.preview_page_count and not 1 <= page_number <= volume.preview_page_count:
+        raise IndexError(page_number)
+    path = page_image_path(volume, page_number, rendition)
+    if os.path.exists(path) and touch(path):
+        return path
+
+    with locked(settings.PAGE_IMAGE_ROOT, os.path.basename(path)):
+        if os.path.exists(path) and touch(path):
+            return path  # Rendered by whoever held the lock before us
+        with local_copy(volume.preview_pdf, suffix='.pdf') as pdf_path:
+            data = render_page(pdf_path, page_number, WIDTHS[rendition])
+        write_atomic(path, data)
+    count_added(settings.PAGE_IMAGE_ROOT, '*.webp', len(data), settings.PAGE_IMAGE_MAX_BYTES)
+    return path
@@ -0,0 +1,59 @@
+import PyPDF2
+from django.db import transaction
+
+from .models import Volume, VolumePage
+from .previews import file_sha256
+from .search import index_volume_pages, remove_volume_pages
+from .streaming import local_copy
+
+
+def extract_page_texts(source):
+    """Yield ``(page_number, text)`` for every page of a PDF, numbered from 1."""
+    reader = PyPDF2.PdfReader(source)
+    for number, page in enumerate(reader.pages, start=1):
+        try:
+            text = page.extract_text() or ''
+        except Exception:
+            text = ''  # Scanned or malformed page: index it as empty rather than fail the volume
+        yield number, text.replace('\x00', ' ').strip()
+
+
+def index_volume_text(volume, force=False):
+    """Extract and index the text of every page of ``volume``.
+
+    Returns the number of pages indexed, or None when ``force`` is off and the
+    index already matches the current PDF.
+    """
+    if not force and volume.pdf_sha256 and volume.text_source == volume.pdf_sha256:
+        return None
+
+    # Same PDF already indexed for another volume: copy its rows instead of parsing again
+    twin = None
+    if not force and volume.pdf_sha256:
+        twin = Volume.objects.filter(text_source=volume.pdf_sha256).exclude(pk=volume.pk).first()
+    if twin:
+        pdf_sha256 = volume.pdf_sha256
+        pages = [
+            VolumePage(volume=volume, page_number=number, text=text)
+            for number, text in twin.pages.order_by('page_number').values_list('page_number', 'text')
+        ]
+    else:
+        # Remote storage would buffer the whole file on open(); a local copy is read page by page
+        with local_copy(volume.pdf_file, suffix='.pdf') as path, open(path, 'rb') as source:
+            pdf_sha256 = volume.pdf_sha256 or file_sha256(source)
+            if not force and volume.text_source == pdf_sha256:
+                return None
+            pages = [
+                VolumePage(volume=volume, page_number=number, text=text)
+                for number, text in extract_page_texts(source)
+            ]
+
+    with transaction.atomic():
+        remove_volume_pages(volume.pk)
+        VolumePage.objects.filter(volume=volume).delete()
+        pages = VolumePage.objects.bulk_create(pages, batch_size=500)
+        index_volume_pages(volume.pk, pages)
+        volume.pdf_sha256 = pdf_sha256
+        volume.text_source = pdf_sha256
+        volume.save(update_fields=['pdf_sha256', 'text_source'])
+    return len(pages)
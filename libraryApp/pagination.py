@@ -0,0 +1,72 @@
+"""Catalog pagination without deep OFFSETs or exact counts.
+
+The first MAX_PAGE_NUMBER pages are still addressed as ``?page=N``. Past
+them, browsing continues with opaque ``?after=``/``?before=`` cursors over
+``(created_at, id)``, so every page is an index range scan no matter how deep
+it is. Totals are counted only up to what page numbers can reach, and
+``count_is_exact`` says whether the shown total is the real one.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+MAX_PAGE_NUMBER = 10
+
+
+def encode_cursor(book):
+    raw = f"{book.created_at.isoformat()}|{book.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return ``(created_at, id)`` from a cursor; raises ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        created_at, pk = raw.split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (TypeError, UnicodeDecodeError, binascii.Error) as exc:
+        raise ValueError(token) from exc
+
+
+def keyset_page(queryset, page_size, after=None, before=None):
+    """One page newest first, starting after (or ending before) a cursor.
+
+    Returns ``(objects, has_previous, has_next)``.
+    """
+    if before:
+        created_at, pk = decode_cursor(before)
+        rows = list(queryset.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+        ).order_by('created_at', 'id')[:page_size + 1])
+        has_previous = len(rows) > page_size
+        rows = rows[:page_size]
+        rows.reverse()
+        return rows, has_previous, True
+
+    queryset = queryset.order_by('-created_at', '-id')
+    if after:
+        created_at, pk = decode_cursor(after)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    rows = list(queryset[:page_size + 1])
+    return rows[:page_size], bool(after), len(rows) > page_size
+
+
+class CappedPaginator(Paginator):
+    """Counts at most one row past the last numbered page instead of the whole result."""
+
+    @cached_property
+    def count(self):
+        limit = MAX_PAGE_NUMBER * self.per_page + 1
+        return self.object_list.order_by()[:limit].count()
+
+    @property
+    def count_is_exact(self):
+        return self.count <= MAX_PAGE_NUMBER * self.per_page
+
+    @property
+    def display_count(self):
+        return min(self.count, MAX_PAGE_NUMBER * self.per_page)
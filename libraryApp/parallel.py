@@ -0,0 +1,66 @@
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+
+import django
+from django.db import connections
+
+
+def _init_worker():
+    # Forked workers must not share the parent's database connections
+    django.setup()
+    connections.close_all()
+
+
+def run_in_processes(func, items, workers=1):
+    """Yield ``func(item)`` for every item, spread over ``workers`` processes.
+
+    Results come back in completion order. ``func`` must be a module-level
+    function so it can be pickled. With one worker everything runs inline,
+    which keeps tracebacks and debugging simple.
+    """
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    # Children get fresh connections instead of the parent's
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(func, item) for item in items]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+BatchResult = namedtuple('BatchResult', 'done skipped count failures elapsed')
+
+
+def _call(func, item):
+    try:
+        return item, func(item), None
+    except Exception as e:
+        return item, None, str(e)
+
+
+def run_batch(command, func, items, workers, name, failed, done):
+    """Run ``func`` over ``items`` as run_in_processes does, reporting each result on ``command.stdout``.
+
+    ``func(item)`` returns a count (pages, files) or None if the item was
+    already current. An exception fails that item only. Lines read
+    ``"<name(item)>: <failed>: <error>"`` and ``"<name(item)>: <done, with {} as the count>"``.
+    """
+    started = time.monotonic()
+    num_done = skipped = count = 0
+    failures = []
+    for item, num, error in run_in_processes(partial(_call, func), items, workers):
+        if error:
+            failures.append((item, error))
+            command.stdout.write(command.style.ERROR(f"{name(item)}: {failed}: {error}"))
+        elif num is None:
+            skipped += 1
+        else:
+            num_done += 1
+            count += num
+            command.stdout.write(command.style.SUCCESS(f"{name(item)}: {done.format(num)}"))
+    return BatchResult(num_done, skipped, count, failures, time.monotonic() - started)
@@ -0,0 +1,139 @@
+"""Calls to the payment provider (Stripe) from request handlers.
+
+A single StripeClient per process reuses pooled HTTP connections and has
+strict timeouts. Each call carries an idempotency key, so a retry or a
+double-submitted form cannot create a second Checkout Session.
+
+A circuit breaker is shared through the cache. After repeated provider
+failures, calls fail fast with PaymentUnavailable for a cooldown period
+instead of holding a worker on timeouts. Latency is counted per operation
+in histogram buckets; see ``manage.py payment_stats``.
+
+Set STRIPE_API_BASE to a local stripe-mock (e.g. http://localhost:12111)
+to exercise everything without the real API.
+"""
+import hashlib
+import time
+from bisect import bisect_left
+
+import stripe
+from django.conf import settings
+from django.core.cache import cache
+
+# Upper bounds in ms; the last bucket catches everything slower
+LATENCY_BUCKETS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+STATS_TIMEOUT = 7 * 24 * 60 * 60
+IDEMPOTENCY_WINDOW = 10 * 60  # Repeat submits within this window reuse one session
+
+# Provider-side trouble trips the breaker; card and request errors are the buyer's
+TRANSIENT_ERRORS = (stripe.APIConnectionError, stripe.RateLimitError)
+
+_client = None
+
+
+class PaymentUnavailable(Exception):
+    """The provider is down or slow; tell the buyer to try again shortly."""
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = stripe.StripeClient(
+            settings.STRIPE_SECRET_KEY,
+            base_addresses={'api': settings.STRIPE_API_BASE},
+            http_client=stripe.RequestsClient(
+                timeout=(settings.STRIPE_CONNECT_TIMEOUT, settings.STRIPE_READ_TIMEOUT),
+            ),
+            max_network_retries=settings.STRIPE_MAX_RETRIES,
+        )
+    return _client
+
+
+def idempotency_key(*parts):
+    return hashlib.sha256(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+class CircuitBreaker:
+    """Opens after ``threshold`` failures within ``window`` seconds, for ``cooldown`` seconds."""
+
+    def __init__(self, name, threshold, window, cooldown):
+        self.failures_key = f"libraryApp:breaker:{name}:failures"
+        self.open_key = f"libraryApp:breaker:{name}:open"
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+
+    def is_open(self):
+        return cache.get(self.open_key) is not None
+
+    def record_success(self):
+        cache.delete(self.failures_key)
+
+    def record_failure(self):
+        cache.add(self.failures_key, 0, self.window)
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:  # Expired between add and incr
+            failures = 1
+        if failures >= self.threshold:
+            cache.set(self.open_key, True, self.cooldown)
+            cache.delete(self.failures_key)
+
+
+breaker = CircuitBreaker(
+    'stripe',
+    threshold=settings.STRIPE_BREAKER_THRESHOLD,
+    window=60,
+    cooldown=settings.STRIPE_BREAKER_COOLDOWN,
+)
+
+
+def _bucket_key(operation, index):
+    return f"libraryApp:payments:latency:{operation}:{index}"
+
+
+def record_latency(operation, millis):
+    key = _bucket_key(operation, bisect_left(LATENCY_BUCKETS, millis))
+    cache.add(key, 0, STATS_TIMEOUT)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def latency_histogram(operation):
+    """``[(upper bound in ms or None, count)]`` for ``operation``."""
+    bounds = list(LATENCY_BUCKETS) + [None]
+    counts = cache.get_many([_bucket_key(operation, i) for i in range(len(bounds))])
+    return [(bound, counts.get(_bucket_key(operation, i), 0)) for i, bound in enumerate(bounds)]
+
+
+def call(operation, func, *args, **kwargs):
+    """Run one provider call behind the breaker, timing it under ``operation``."""
+    if breaker.is_open():
+        raise PaymentUnavailable(operation)
+    started = time.monotonic()
+    try:
+        result = func(*args, **kwargs)
+    except TRANSIENT_ERRORS as e:
+        breaker.record_failure()
+        raise PaymentUnavailable(operation) from e
+    except stripe.APIError as e:
+        if (e.http_status or 500) >= 500:
+            breaker.record_failure()
+            raise PaymentUnavailable(operation) from e
+        raise
+    else:
+        breaker.record_success()
+        return result
+    finally:
+        record_latency(operation, (time.monotonic() - started) * 1000)
+
+
+def create_checkout_session(params, key_parts):
+    """Create a Checkout Session; ``key_parts`` identify the purchase attempt for idempotency."""
+    client = get_client()
+    return call(
+        'checkout.session.create', client.v1.checkout.sessions.create,
+        params, {'idempotency_key': idempotency_key('checkout', *key_parts, int(time.time() // IDEMPOTENCY_WINDOW))},
+    )
@@ -0,0 +1,177 @@
+"""Preview PDFs: the first ``preview_pages`` pages of a volume.
+
+PyPDF2 reads objects from the open file as they are needed, so copying a few
+pages out of a 2,000 page volume only loads the objects those pages
+reference instead of the whole file. Each build has a budget. Pages are
+copied only while the bytes they reference fit in PREVIEW_MAX_BYTES, counted
+from the cross-reference table before anything is read, so one oversized
+scan cannot blow up a worker's memory. A build that runs past
+PREVIEW_TIME_BUDGET is abandoned. The output has no timestamps or random
+IDs, so the same source always produces the same bytes.
+``manage.py benchmark_previews`` measures all of this on sample PDFs.
+"""
+import hashlib
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.files import File
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject
+
+from .blobs import find_shared_preview, preview_pdf_name, release
+from .streaming import iter_file_chunks, local_copy
+
+# Keys that lead away from a page (back to the page tree, or into other pages via annotations)
+_BACK_REFERENCES = {'/Parent', '/P', '/Annots', '/Dest'}
+
+
+class PreviewBudgetExceeded(Exception):
+    pass
+
+
+def _object_sizes(reader, file_size):
+    """Stored size of each object, as the distance to the next object in the file.
+
+    Objects packed into object streams are counted with their stream.
+    """
+    offsets = sorted((offset, idnum) for objects in reader.xref.values() for idnum, offset in objects.items())
+    ends = [offset for offset, _ in offsets[1:]] + [file_size]
+    return {idnum: end - offset for (offset, idnum), end in zip(offsets, ends)}
+
+
+def _references(obj):
+    if isinstance(obj, IndirectObject):
+        yield obj
+    elif isinstance(obj, DictionaryObject):
+        for key, value in obj.items():
+            if key not in _BACK_REFERENCES:
+                yield from _references(value)
+    elif isinstance(obj, ArrayObject):
+        for value in obj:
+            yield from _references(value)
+
+
+def _page_cost(page, sizes, seen, limit):
+    """Bytes of the objects ``page`` references that are not in ``seen`` yet.
+
+    Counting stops past ``limit``, before the object that crossed it is read.
+    """
+    cost = 0
+    pending = [page.indirect_reference]
+    while pending and cost <= limit:
+        reference = pending.pop()
+        if reference.idnum in seen:
+            continue
+        seen.add(reference.idnum)
+        cost += sizes.get(reference.idnum, 0)
+        if cost <= limit:
+            pending.extend(_references(reference.get_object()))
+    return cost
+
+
+def render_preview(source_path, preview_pages, target_path, max_bytes=None, time_budget=None):
+    """Write the first ``preview_pages`` pages of ``source_path`` to ``target_path``.
+
+    Returns ``(page_count, source_page_count)``. Fewer pages are copied when
+    the byte budget runs out first.
+    """
+    max_bytes = settings.PREVIEW_MAX_BYTES if max_bytes is None else max_bytes
+    time_budget = settings.PREVIEW_TIME_BUDGET if time_budget is None else time_budget
+    deadline = time.monotonic() + time_budget
+
+    # Given an open file rather than a path, PdfReader seeks to objects instead of reading it all into memory
+    with open(source_path, 'rb') as source:
+        reader = PdfReader(source)
+        sizes = _object_sizes(reader, os.path.getsize(source_path))
+        total_pages = len(reader.pages)
+        preview = PdfWriter()
+        seen = set()
+        used = 0
+        num_pages = 0
+        for page in reader.pages[:preview_pages]:
+            used += _page_cost(page, sizes, seen, max_bytes - used)
+            if used > max_bytes:
+                break
+            # The writer remembers what it has copied, so resources used by several pages are copied once
+            preview.add_page(page, excluded_keys=['/Annots'])
+            num_pages += 1
+            if time.monotonic() > deadline:
+                raise PreviewBudgetExceeded(f"Preview took longer than {time_budget}s")
+        if num_pages == 0:
+            raise PreviewBudgetExceeded(f"First page alone references more than {max_bytes} bytes")
+        with open(target_path, 'wb') as target:
+            preview.write(target)
+    return num_pages, total_pages
+
+
+def file_sha256(source):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: source.read(64 * 1024), b''):
+        digest.update(chunk)
+    source.seek(0)
+    return digest.hexdigest()
+
+
+def preview_source_key(pdf_sha256, preview_pages):
+    """Identifies what a preview was built from, so unchanged volumes can be skipped."""
+    return f"{pdf_sha256}:{preview_pages}"
+
+
+def build_volume_preview(volume, force=False):
+    """Generate and store the preview PDF for ``volume``.
+
+    Returns the number of preview pages written, or None when ``force`` is off
+    and the existing preview was built from the same PDF and page count.
+    The new preview is stored before the old one is removed, so the volume
+    always has a preview to serve. A preview already stored under the same
+    content address is reused, or replaced in place when ``force`` is on,
+    so the name never picks up a storage suffix.
+    """
+    preview_pages = volume.book_set.preview_pages
+    if not force and volume.preview_pdf and volume.pdf_sha256:
+        if volume.preview_source == preview_source_key(volume.pdf_sha256, preview_pages):
+            return None
+
+    pdf_sha256 = volume.pdf_sha256
+    if not pdf_sha256:
+        digest = hashlib.sha256()
+        for chunk in iter_file_chunks(volume.pdf_file):
+            digest.update(chunk)
+        pdf_sha256 = digest.hexdigest()
+    source_key = preview_source_key(pdf_sha256, preview_pages)
+    if not force and volume.preview_pdf and volume.preview_source == source_key:
+        return None
+
+    old_name = volume.preview_pdf.name if volume.preview_pdf else None
+    # Another volume with the same PDF and page count already has this preview
+    shared = None if force else find_shared_preview(source_key, exclude_pk=volume.pk)
+    if shared:
+        volume.preview_pdf.name, num_pages, total_pages = shared
+    else:
+        fd, preview_path = tempfile.mkstemp(suffix='.pdf')
+        os.close(fd)
+        try:
+            with local_copy(volume.pdf_file, suffix='.pdf') as source_path:
+                num_pages, total_pages = render_preview(source_path, preview_pages, preview_path)
+            storage = volume.preview_pdf.storage
+            name = volume.preview_pdf.field.generate_filename(volume, preview_pdf_name(source_key))
+            if storage.exists(name) and force:
+                storage.delete(name)  # The render is deterministic, so this only repairs a damaged copy
+            if storage.exists(name):
+                volume.preview_pdf.name = name
+            else:
+                with open(preview_path, 'rb') as preview:
+                    volume.preview_pdf.save(preview_pdf_name(source_key), File(preview), save=False)
+        finally:
+            os.remove(preview_path)
+
+    volume.pdf_sha256 = pdf_sha256
+    volume.pdf_page_count = total_pages
+    volume.preview_source = source_key
+    volume.preview_page_count = num_pages
+    volume.save(update_fields=['preview_pdf', 'pdf_sha256', 'pdf_page_count', 'preview_source', 'preview_page_count'])
+    if old_name and old_name != volume.preview_pdf.name:
+        release(volume.preview_pdf, 'preview_pdf', old_name)
+    return num_pages
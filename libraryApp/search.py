@@ -0,0 +1,211 @@
+"""Ranked full-text search over the catalog and the text inside volumes.
+
+Postgres keeps weighted ``search_vector`` columns behind GIN indexes.
+SQLite (dev/test) mirrors the same text into FTS5 tables and ranks with
+bm25. Any other backend falls back to ``icontains``.
+"""
+import re
+
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+FTS_TABLE = 'libraryApp_bookset_fts'
+PAGE_FTS_TABLE = 'libraryApp_volumepage_fts'
+
+# Highlight markers that cannot appear in extracted text; swapped for <mark> after escaping
+MARK_START, MARK_STOP = '\x02', '\x03'
+
+# Relative weight of each column: title matches outrank author, then description
+WEIGHTS = {'title': 'A', 'author': 'B', 'description': 'C'}
+BM25_WEIGHTS = '10.0, 4.0, 1.0'  # Same order as the FTS5 columns below
+
+
+def _search_vector():
+    from django.contrib.postgres.search import SearchVector
+
+    vector = None
+    for column, weight in WEIGHTS.items():
+        part = SearchVector(column, weight=weight, config='english')
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def _fts_match(query):
+    """Turn free text into a safe FTS5 expression: every word must match, last one as a prefix."""
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_book_sets(queryset, query):
+    """Filter ``queryset`` to sets matching ``query``, annotated with a ``rank`` (higher is better)."""
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        search_query = SearchQuery(query, search_type='websearch', config='english')
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        )
+
+    if connection.vendor == 'sqlite':
+        match = _fts_match(query)
+        if match is None:
+            return queryset.none().annotate(rank=Value(0.0, output_field=FloatField()))  # Still orderable by rank
+        table = queryset.model._meta.db_table
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM "{FTS_TABLE}" WHERE "{FTS_TABLE}" MATCH %s', [match])
+        ).annotate(
+            rank=RawSQL(
+                f'SELECT -bm25("{FTS_TABLE}", {BM25_WEIGHTS}) FROM "{FTS_TABLE}" '
+                f'WHERE "{FTS_TABLE}" MATCH %s AND rowid = "{table}"."id"',
+                [match],
+                output_field=FloatField(),
+            )
+        )
+
+    return queryset.filter(
+        Q(title__icontains=query) | Q(description__icontains=query)
+    ).annotate(rank=Value(0.0, output_field=FloatField()))
+
+
+def update_search_index(book_ids):
+    """Refresh the index entries for the given BookSet ids."""
+    from .models import BookSet
+
+    book_ids = list(book_ids)
+    if not book_ids:
+        return
+    if connection.vendor == 'postgresql':
+        BookSet.objects.filter(id__in=book_ids).update(search_vector=_search_vector())
+    elif connection.vendor == 'sqlite':
+        rows = BookSet.objects.filter(id__in=book_ids).values_list('id', 'title', 'author', 'description')
+        with connection.cursor() as cursor:
+            remove_from_search_index(book_ids, cursor=cursor)
+            cursor.executemany(
+                f'INSERT INTO "{FTS_TABLE}" (rowid, title, author, description) VALUES (%s, %s, %s, %s)',
+                list(rows),
+            )
+
+
+def remove_from_search_index(book_ids, cursor=None):
+    # Postgres keeps the vector on the row itself, so only SQLite needs cleanup
+    if connection.vendor != 'sqlite':
+        return
+    book_ids = list(book_ids)
+    if cursor is None:
+        with connection.cursor() as cursor:
+            return remove_from_search_index(book_ids, cursor=cursor)
+    cursor.executemany(f'DELETE FROM "{FTS_TABLE}" WHERE rowid = %s', [(pk,) for pk in book_ids])
+
+
+def rebuild_search_index():
+    """Recompute the whole index. Returns the number of sets indexed."""
+    from .models import BookSet
+
+    if connection.vendor == 'postgresql':
+        return BookSet.objects.update(search_vector=_search_vector())
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM "{FTS_TABLE}"')
+        ids = list(BookSet.objects.values_list('id', flat=True))
+        for start in range(0, len(ids), 500):
+            update_search_index(ids[start:start + 500])
+        return len(ids)
+    return 0
+
+
+
+def _highlight(snippet):
+    return mark_safe(
+        escape(snippet).replace(MARK_START, '<mark>').replace(MARK_STOP, '</mark>')
+    )
+
+
+def search_pages(query, entitlements, limit=20):
+    """Best matching volume pages for ``query``, each with ``rank`` and a highlighted ``snippet``.
+
+    Snippets are only shown from pages ``entitlements`` lets the visitor read, or that are part of
+    the free preview; other hits keep just their page number.
+    """
+    from .models import VolumePage
+
+    pages = VolumePage.objects.select_related('volume__book_set').defer('text', 'search_vector')
+
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+
+        search_query = SearchQuery(query, search_type='websearch', config='english')
+        hits = list(
+            pages.filter(search_vector=search_query)
+            .annotate(
+                rank=SearchRank(F('search_vector'), search_query),
+                snippet=SearchHeadline(
+                    'text', search_query, config='english',
+                    start_sel=MARK_START, stop_sel=MARK_STOP, max_words=30, min_words=12,
+                ),
+            )
+            .order_by('-rank')[:limit]
+        )
+    elif connection.vendor == 'sqlite':
+        match = _fts_match(query)
+        if match is None:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, -bm25("{PAGE_FTS_TABLE}"), '
+                f'snippet("{PAGE_FTS_TABLE}", 0, %s, %s, \'\', 24) '
+                f'FROM "{PAGE_FTS_TABLE}" WHERE "{PAGE_FTS_TABLE}" MATCH %s ORDER BY rank LIMIT %s',
+                [MARK_START, MARK_STOP, match, limit],
+            )
+            rows = cursor.fetchall()
+        by_id = pages.in_bulk([row[0] for row in rows])
+        hits = []
+        for page_id, rank, snippet in rows:
+            if page_id in by_id:
+                page = by_id[page_id]
+                page.rank, page.snippet = rank, snippet
+                hits.append(page)
+    else:
+        hits = list(pages.filter(text__icontains=query)[:limit])
+        for page in hits:
+            page.rank, page.snippet = 0.0, ''
+
+    for page in hits:
+        book = page.volume.book_set
+        if page.page_number <= book.preview_pages or entitlements.can_read(book):
+            page.snippet = _highlight(page.snippet or '')
+        else:
+            page.snippet = ''  # Paid text: say where it matched, not what it says
+    return hits
+
+
+def index_volume_pages(volume_id, pages):
+    """Add freshly created VolumePage rows for one volume to the index."""
+    from .models import VolumePage
+
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchVector
+
+        VolumePage.objects.filter(volume_id=volume_id).update(
+            search_vector=SearchVector('text', config='english')
+        )
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO "{PAGE_FTS_TABLE}" (rowid, text, volume_id) VALUES (%s, %s, %s)',
+                [(page.pk, page.text, volume_id) for page in pages],
+            )
+
+
+def remove_volume_pages(volume_id):
+    # Postgres keeps the vector on the row itself, so only SQLite needs cleanup
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM "{PAGE_FTS_TABLE}" WHERE volume_id = %s', [volume_id])
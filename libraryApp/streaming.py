@@ -0,0 +1,128 @@
+import os
+import tempfile
+import zipfile
+from contextlib import contextmanager
+
+import requests
+
+# 64 KB keeps memory flat per download while staying large enough for fast I/O
+CHUNK_SIZE = 64 * 1024
+
+
+def local_path(field_file):
+    """Filesystem path of a stored file, or None for remote storage."""
+    try:
+        return field_file.path
+    except NotImplementedError:
+        return None
+
+
+def iter_file_chunks(field_file, chunk_size=CHUNK_SIZE, start=0, length=None):
+    """Yield the contents of a stored file chunk by chunk.
+
+    ``start`` and ``length`` select a byte range (the whole file by default).
+    Local storage is read straight from disk. Remote storage (Cloudinary)
+    has no filesystem path and its ``open()`` downloads the whole file into
+    memory, so we stream the public URL over HTTP instead.
+    """
+    path = local_path(field_file)
+    if path:
+        with open(path, 'rb') as fh:
+            fh.seek(start)
+            yield from _read_limited(iter(lambda: fh.read(chunk_size), b''), length)
+        return
+
+    headers = {}
+    if start or length is not None:
+        end = '' if length is None else start + length - 1
+        headers['Range'] = f'bytes={start}-{end}'
+    with requests.get(field_file.url, headers=headers, stream=True, timeout=(5, 60)) as response:
+        response.raise_for_status()
+        chunks = (chunk for chunk in response.iter_content(chunk_size=chunk_size) if chunk)
+        if start and response.status_code != 206:
+            chunks = _skip(chunks, start)  # Server ignored the Range header
+        yield from _read_limited(chunks, length)
+
+
+@contextmanager
+def local_copy(field_file, suffix=''):
+    """Yield a filesystem path holding the stored file's contents.
+
+    Local files are used in place. Remote ones are streamed to a temporary
+    file, removed again on exit, so callers can seek around a large file
+    without holding it in memory.
+    """
+    path = local_path(field_file)
+    if path:
+        yield path
+        return
+    fd, tmp_path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            for chunk in iter_file_chunks(field_file):
+                tmp.write(chunk)
+        yield tmp_path
+    finally:
+        os.remove(tmp_path)
+
+
+def _skip(chunks, count):
+    for chunk in chunks:
+        if count >= len(chunk):
+            count -= len(chunk)
+            continue
+        yield chunk[count:]
+        count = 0
+
+
+def _read_limited(chunks, length):
+    if length is None:
+        yield from chunks
+        return
+    for chunk in chunks:
+        if length <= 0:
+            break
+        yield chunk[:length]
+        length -= len(chunk)
+
+
+class _ZipBuffer:
+    """Write-only sink for ZipFile that hands back what was written so far."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(entries, chunk_size=CHUNK_SIZE):
+    """Yield a ZIP archive built from ``(arcname, field_file)`` pairs.
+
+    Entries are written as they are read, so memory use stays at roughly one
+    chunk no matter how large the set is. PDFs are already compressed, so they
+    are stored as-is instead of being deflated again.
+    """
+    sink = _ZipBuffer()
+    # An unseekable sink makes ZipFile emit data descriptors after each entry
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as archive:
+        for arcname, field_file in entries:
+            with archive.open(arcname, 'w', force_zip64=True) as dest:
+                for chunk in iter_file_chunks(field_file, chunk_size):
+                    dest.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    yield sink.drain()
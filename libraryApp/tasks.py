@@ -0,0 +1,37 @@
+"""Handlers for background jobs. Each one takes the job's object_id."""
+from .covers import build_cover_variants
+from .models import BookSet, Volume
+from .pagetext import index_volume_text
+from .previews import build_volume_preview
+from .uploads import assemble_pending_uploads
+from .webhooks import apply_pending_events
+
+
+def build_preview(volume_id):
+    volume = Volume.objects.select_related('book_set').filter(pk=volume_id).first()
+    if volume is None or not volume.pdf_file:
+        return  # Deleted or emptied since it was queued
+    build_volume_preview(volume, force=False)
+
+
+def index_page_text(volume_id):
+    volume = Volume.objects.filter(pk=volume_id).first()
+    if volume is None or not volume.pdf_file:
+        return
+    index_volume_text(volume)
+
+
+def build_covers(book_id):
+    book = BookSet.objects.filter(pk=book_id).first()
+    if book is None:
+        return
+    build_cover_variants(book)
+
+
+def assemble_uploads(_):
+    assemble_pending_uploads()
+
+
+def apply_stripe_events(_):
+    while apply_pending_events():
+        pass
@@ -0,0 +1,39 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+register = template.Library()
+
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+
+
+@register.simple_tag
+def cover_picture(book, sizes='100vw', css_class='', loading='lazy'):
+    """A ``<picture>`` for a set's cover with AVIF/WebP ``srcset`` sources.
+
+    Falls back to the original upload until derivatives have been built.
+    Usage: ``{% cover_picture book sizes="(min-width: 1024px) 33vw, 100vw" css_class="w-full" %}``
+    """
+    if not book.cover_image:
+        return ''
+    variants = book.cover_variants
+    if variants.get('source') != book.cover_image.name or not variants['formats']:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}" decoding="async">',
+            book.cover_image.url, book.title, css_class, loading,
+        )
+
+    storage = book.cover_image.storage
+    sources = []
+    for ext, mime in MIME_TYPES.items():
+        names = variants['formats'].get(ext)
+        if names:
+            srcset = ', '.join(f"{storage.url(name)} {width}w" for width, name in names)
+            sources.append((mime, srcset, sizes))
+    # Largest WebP as the plain <img>, for browsers without <picture> support
+    fallback_names = variants['formats'].get('webp') or next(iter(variants['formats'].values()))
+    fallback = storage.url(fallback_names[-1][1])
+    return format_html(
+        '<picture>{}<img src="{}" alt="{}" class="{}" width="{}" height="{}" loading="{}" decoding="async"></picture>',
+        format_html_join('', '<source type="{}" srcset="{}" sizes="{}">', sources),
+        fallback, book.title, css_class, variants['width'], variants['height'], loading,
+    )
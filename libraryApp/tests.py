@@ -1,3 +1,737 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from PyPDF2 import PdfReader, PdfWriter
+
+from . import filecache, pageimages, payments, uploads
+from .archives import cached_archive
+from .catalog import facet_counts
+from .delivery import parse_range
+from .pagination import MAX_PAGE_NUMBER
+from .entitlements import get_entitlements
+from .forms import VolumeAdminForm
+from .jobs import run_pending
+from .models import BackgroundJob, BookSet, Category, Purchase, StripeEvent, UploadSession, Volume, VolumePage
+from .pagetext import index_volume_text
+from .previews import PreviewBudgetExceeded, build_volume_preview, render_preview
+from .streaming import stream_zip
+from .search import index_volume_pages
+from .webhooks import apply_pending_events, verify_event
+
+# The manifest storage needs collectstatic, which the tests do not run
+PLAIN_STATIC = override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+
+
+def temp_media(test, *field_names):
+    """Point the named Volume file fields at a temporary FileSystemStorage for the length of ``test``."""
+    root = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, root)
+    storage = FileSystemStorage(root)
+    for field_name in field_names:
+        patcher = mock.patch.object(Volume._meta.get_field(field_name), 'storage', storage)
+        patcher.start()
+        test.addCleanup(patcher.stop)
+    return storage
+
+
+def make_pdf(pages):
+    """Bytes of a PDF with ``pages`` blank pages, each a different width so they can be told apart."""
+    writer = PdfWriter()
+    for number in range(pages):
+        writer.add_blank_page(width=200 + number, height=300)
+    out = BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def make_set(title='Torts', volumes=(), **fields):
+    """A BookSet with one volume per entry of ``volumes``, each the bytes of its PDF (see temp_media)."""
+    book = BookSet.objects.create(title=title, author='A. Author', **fields)
+    for number, data in enumerate(volumes, start=1):
+        volume = Volume(book_set=book, volume_number=number)
+        volume.pdf_file.save(f"v{number}.pdf", ContentFile(data))
+    return book
+
+
+@PLAIN_STATIC
+class CatalogSearchTests(TestCase):
+    def test_query_without_words_returns_no_results(self):
+        BookSet.objects.create(title='Contract Law', author='A. Author')
+        response = self.client.get(reverse('search'), {'q': '!!!'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['books']), [])
+
+    def test_query_matches_title(self):
+        book = BookSet.objects.create(title='Contract Law', author='A. Author')
+        BookSet.objects.create(title='Evidence', author='B. Author')
+        response = self.client.get(reverse('search'), {'q': 'contract'})
+        self.assertEqual([b.pk for b in response.context['books']], [book.pk])
+
+    def test_page_hits_hide_paid_text_beyond_the_preview(self):
+        temp_media(self, 'pdf_file')
+        volume = make_set('Evidence', [make_pdf(1)], access_type='paid', preview_pages=2).volumes.get()
+        pages = [
+            VolumePage.objects.create(volume=volume, page_number=1, text='hearsay rule in the preview'),
+            VolumePage.objects.create(volume=volume, page_number=5, text='hearsay exceptions behind the paywall'),
+        ]
+        index_volume_pages(volume.pk, pages)
+
+        response = self.client.get(reverse('search'), {'q': 'hearsay'})
+        hits = {hit.page_number: hit for hit in response.context['page_hits']}
+        self.assertIn('<mark>hearsay</mark>', hits[1].snippet)
+        self.assertEqual(hits[5].snippet, '')
+        self.assertNotContains(response, 'paywall')
+        self.assertContains(response, 'Match on page 5')
+
+
+@PLAIN_STATIC
+class CatalogCacheTests(TestCase):
+    def titles(self, **params):
+        return [book.title for book in self.client.get(reverse('library_list'), params).context['books']]
+
+    def test_list_is_cached_until_the_catalog_changes(self):
+        BookSet.objects.create(title='Torts', author='A. Author')
+        self.assertEqual(self.titles(), ['Torts'])
+        BookSet.objects.bulk_create([BookSet(title='Evidence', author='A. Author')])  # No signal, no new version
+        self.assertEqual(self.titles(), ['Torts'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BookSet.objects.create(title='Contracts', author='A. Author')
+        self.assertEqual(self.titles(), ['Contracts', 'Evidence', 'Torts'])
+
+    def test_equivalent_filters_share_an_entry(self):
+        BookSet.objects.create(title='Torts', author='A. Author', access_type='free')
+        self.assertEqual(self.titles(access='free'), ['Torts'])
+        BookSet.objects.bulk_create([BookSet(title='Evidence', author='A. Author', access_type='free')])
+        self.assertEqual(self.titles(access=' free ', category=''), ['Torts'])  # Normalised to the same key
+        self.assertEqual(self.titles(access='bogus'), ['Evidence', 'Torts'])  # Unknown access means no filter
+
+
+# Query counts then measure the database alone, not reads of the database cache
+LOCAL_CACHE = override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+
+
+@PLAIN_STATIC
+@LOCAL_CACHE
+class BookDetailTests(TestCase):
+    def setUp(self):
+        temp_media(self, 'pdf_file', 'preview_pdf')
+        self.book = make_set(volumes=[make_pdf(1)] * 4, preview_pages=2)
+        self.url = reverse('book_detail', args=[self.book.pk])
+        self.addCleanup(cache.clear)
+
+    def test_query_budget(self):
+        # The set, its categories and, for the table of contents, all volumes in one query
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        # The table of contents now comes from the fragment cache
+        with self.assertNumQueries(2):
+            self.assertContains(self.client.get(self.url), 'Preview available for first 2 pages', count=4)
+
+    def test_editing_a_volume_refreshes_the_contents(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.volumes.get(volume_number=1).save()
+        with self.assertNumQueries(3):
+            self.client.get(self.url)
+
+
+class FacetCountTests(TestCase):
+    def setUp(self):
+        self.torts, self.evidence = Category.objects.create(name='Torts'), Category.objects.create(name='Evidence')
+        make_set('Negligence', access_type='free').categories.add(self.torts)
+        make_set('Nuisance').categories.add(self.torts)
+        make_set('Hearsay').categories.add(self.evidence, self.torts)
+
+    def test_each_facet_ignores_its_own_filter(self):
+        self.assertEqual(facet_counts(('', '', '')), {
+            'category': {'torts': 3, 'evidence': 1}, 'access': {'free': 1, 'paid': 2},
+        })
+        self.assertEqual(facet_counts(('', 'evidence', 'paid')), {
+            'category': {'torts': 2, 'evidence': 1}, 'access': {'paid': 1},
+        })
+
+    def test_counts_are_cached_until_the_catalog_changes(self):
+        facet_counts(('', '', ''))
+        BookSet.objects.bulk_create([BookSet(title='Trespass', author='A. Author', access_type='free')])
+        self.assertEqual(facet_counts(('', '', ''))['access'], {'free': 1, 'paid': 2})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BookSet.objects.get(title='Trespass').categories.add(self.torts)
+        self.assertEqual(facet_counts(('', '', '')), {
+            'category': {'torts': 4, 'evidence': 1}, 'access': {'free': 2, 'paid': 2},
+        })
+
+
+@PLAIN_STATIC
+class CatalogPaginationTests(TestCase):
+    PAGE_SIZE = 12  # LibraryListView.paginate_by
+
+    @classmethod
+    def setUpTestData(cls):
+        # Three sets past what the numbered pages can reach
+        total = MAX_PAGE_NUMBER * cls.PAGE_SIZE + 3
+        BookSet.objects.bulk_create([BookSet(title=f"Set {n:03d}", author='A. Author') for n in range(total)])
+
+    def get(self, url=None, **params):
+        return self.client.get(url or reverse('library_list'), params)
+
+    def test_total_is_capped_at_the_numbered_pages(self):
+        context = self.get().context
+        self.assertEqual(context['result_count'], MAX_PAGE_NUMBER * self.PAGE_SIZE)
+        self.assertFalse(context['count_is_exact'])
+
+    def test_pages_past_the_cap_are_404(self):
+        self.assertEqual(self.get(page=MAX_PAGE_NUMBER).status_code, 200)
+        self.assertEqual(self.get(page=MAX_PAGE_NUMBER + 1).status_code, 404)
+        self.assertEqual(self.get(page='x').status_code, 404)
+
+    def test_last_numbered_page_continues_with_a_cursor(self):
+        context = self.get(page=MAX_PAGE_NUMBER).context
+        self.assertIn('after=', context['next_url'])
+        rest = self.get(reverse('library_list') + context['next_url']).context
+        self.assertEqual(len(rest['books']), 3)
+        self.assertIsNone(rest['next_url'])
+        self.assertIsNone(rest['page_number'])
+
+        previous = self.get(reverse('library_list') + rest['previous_url']).context
+        self.assertEqual([b.pk for b in previous['books']], [b.pk for b in context['books']])
+
+    def test_malformed_cursor_is_404(self):
+        self.assertEqual(self.get(after='not-a-cursor').status_code, 404)
+        self.assertEqual(self.get(before='!!!').status_code, 404)
+
+
+class FileCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.addCleanup(filecache._usage.clear)
+
+    def add(self, name, size, max_bytes):
+        path = os.path.join(self.root, name)
+        filecache.write_atomic(path, b'x' * size)
+        filecache.count_added(self.root, '*.bin', size, max_bytes)
+        return path
+
+    def test_scans_only_when_the_counter_passes_the_cap(self):
+        with mock.patch.object(filecache, 'evict_lru', wraps=filecache.evict_lru) as evict:
+            self.add('a.bin', 40, 100)  # First write seeds the counter with one scan
+            self.add('b.bin', 40, 100)
+            self.assertEqual(evict.call_count, 1)
+            self.add('c.bin', 40, 100)
+            self.assertEqual(evict.call_count, 2)
+        self.assertLessEqual(sum(os.path.getsize(os.path.join(self.root, n)) for n in os.listdir(self.root)), 100)
+
+
+WEBHOOK_SECRET = 'whsec_test'
+
+
+def sign(payload, timestamp=None, secret=WEBHOOK_SECRET):
+    """A Stripe-Signature header for ``payload``, computed the way Stripe does."""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET, STRIPE_WEBHOOK_TOLERANCE=300)
+class StripeWebhookTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'pw')
+        self.book = BookSet.objects.create(title='Torts', author='A. Author', access_type='paid')
+
+    def event(self, event_id='evt_1', **session):
+        session = {
+            'payment_status': 'paid',
+            'metadata': {'user_id': str(self.user.pk), 'book_id': str(self.book.pk)},
+            **session,
+        }
+        return json.dumps({'id': event_id, 'type': 'checkout.session.completed', 'data': {'object': session}})
+
+    def post(self, payload, signature):
+        return self.client.post(reverse('stripe_webhook'), payload, content_type='application/json',
+                                HTTP_STRIPE_SIGNATURE=signature)
+
+    def test_verify_event_decodes_a_signed_payload(self):
+        payload = self.event()
+        event = verify_event(payload.encode(), sign(payload))
+        self.assertEqual((event['id'], event['type']), ('evt_1', 'checkout.session.completed'))
+
+    def test_signed_event_is_stored_once(self):
+        payload = self.event()
+        self.assertEqual(self.post(payload, sign(payload)).status_code, 200)
+        self.assertEqual(self.post(payload, sign(payload)).status_code, 200)  # Stripe retry
+        self.assertEqual(StripeEvent.objects.filter(event_id='evt_1').count(), 1)
+        self.assertTrue(BackgroundJob.objects.filter(kind='stripe_events', status=BackgroundJob.PENDING).exists())
+
+    def test_bad_signature_is_rejected(self):
+        payload = self.event()
+        self.assertEqual(self.post(payload, sign(payload, secret='whsec_other')).status_code, 400)
+        self.assertEqual(self.post(payload, 'garbage').status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_stale_signature_is_rejected(self):
+        payload = self.event()
+        self.assertEqual(self.post(payload, sign(payload, timestamp=int(time.time()) - 3600)).status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_applying_events_creates_the_purchase_and_refreshes_entitlements(self):
+        self.assertFalse(get_entitlements(self.user).can_read(self.book))  # Cached as not bought
+        payload = self.event()
+        self.post(payload, sign(payload))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(apply_pending_events(), 1)
+        self.assertTrue(Purchase.objects.filter(user=self.user, book_set=self.book).exists())
+        self.assertIsNotNone(StripeEvent.objects.get(event_id='evt_1').processed_at)
+        self.assertTrue(get_entitlements(User.objects.get(pk=self.user.pk)).can_read(self.book))
+
+        self.assertEqual(apply_pending_events(), 0)  # Already processed
+        self.assertEqual(Purchase.objects.count(), 1)
+
+    def test_unpaid_session_grants_nothing(self):
+        payload = self.event(payment_status='unpaid')
+        self.post(payload, sign(payload))
+        apply_pending_events()
+        self.assertFalse(Purchase.objects.exists())
+
+
+class FakeStripe(BaseHTTPRequestHandler):
+    """A stripe-mock style stand-in: answers Checkout Session creation and records each request."""
+    requests = []
+    status = 200
+    delay = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        FakeStripe.requests.append({'path': self.path, 'idempotency_key': self.headers.get('Idempotency-Key')})
+        time.sleep(FakeStripe.delay)
+        body = {'id': 'cs_test_1', 'object': 'checkout.session', 'url': 'https://checkout.example/cs_test_1'}
+        if FakeStripe.status != 200:
+            body = {'error': {'type': 'api_error', 'message': 'Stand-in failure'}}
+        data = json.dumps(body).encode()
+        self.send_response(FakeStripe.status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except OSError:
+            pass  # The client already gave up
+
+    def log_message(self, *args):
+        pass
+
+
+class PaymentClientTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeStripe)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        FakeStripe.requests, FakeStripe.status, FakeStripe.delay = [], 200, 0
+        settings = override_settings(
+            STRIPE_SECRET_KEY='sk_test_123', STRIPE_API_BASE=f"http://127.0.0.1:{self.server.server_port}",
+            STRIPE_CONNECT_TIMEOUT=1, STRIPE_READ_TIMEOUT=0.3, STRIPE_MAX_RETRIES=0,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        payments._client = None  # Built from the settings above
+        self.addCleanup(setattr, payments, '_client', None)
+
+    def checkout(self, *key_parts):
+        return payments.create_checkout_session({'mode': 'payment'}, key_parts=key_parts or ('buyer', 1, '9.99'))
+
+    def test_creates_a_session_through_the_configured_base(self):
+        session = self.checkout()
+        self.assertEqual(session.url, 'https://checkout.example/cs_test_1')
+        self.assertEqual(FakeStripe.requests[0]['path'], '/v1/checkout/sessions')
+
+    def test_repeat_submits_share_an_idempotency_key(self):
+        self.checkout('buyer', 1, '9.99')
+        self.checkout('buyer', 1, '9.99')
+        self.checkout('buyer', 2, '9.99')
+        keys = [request['idempotency_key'] for request in FakeStripe.requests]
+        self.assertEqual(keys[0], keys[1])
+        self.assertNotEqual(keys[0], keys[2])
+
+    def test_slow_provider_times_out(self):
+        FakeStripe.delay = 1
+        started = time.monotonic()
+        with self.assertRaises(payments.PaymentUnavailable):
+            self.checkout()
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_breaker_opens_after_repeated_failures(self):
+        FakeStripe.status = 500
+        with mock.patch.object(payments.breaker, 'threshold', 3):
+            for _ in range(3):
+                with self.assertRaises(payments.PaymentUnavailable):
+                    self.checkout()
+            self.assertTrue(payments.breaker.is_open())
+            with self.assertRaises(payments.PaymentUnavailable):
+                self.checkout()
+        self.assertEqual(len(FakeStripe.requests), 3)  # The fourth call failed fast
+
+    def test_buyer_errors_do_not_trip_the_breaker(self):
+        FakeStripe.status = 400
+        with self.assertRaises(payments.stripe.InvalidRequestError):
+            self.checkout()
+        self.assertFalse(payments.breaker.is_open())
+
+
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        settings = override_settings(UPLOAD_CHUNK_ROOT=root, UPLOAD_CHUNK_STORAGE='')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        temp_media(self, 'pdf_file')
+        patcher = mock.patch.object(uploads, 'CHUNK_SIZE', 4)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.staff = User.objects.create_user('editor', 'editor@example.com', 'pw', is_staff=True)
+        self.client.force_login(self.staff)
+
+    def upload(self, data):
+        response = self.client.post(reverse('upload_start'), {'filename': 'v1.pdf', 'size': len(data)},
+                                    content_type='application/json')
+        upload_id = response.json()['id']
+        for index in range(0, len(data), 4):
+            chunk = data[index:index + 4]
+            response = self.client.put(reverse('upload_chunk', args=[upload_id, index // 4]), chunk,
+                                       content_type='application/octet-stream',
+                                       HTTP_X_CHUNK_SHA256=hashlib.sha256(chunk).hexdigest())
+            self.assertEqual(response.status_code, 204)
+        return upload_id
+
+    def test_assembly_runs_in_the_worker(self):
+        data = b'%PDF-1.4 volume one'
+        upload_id = self.upload(data)
+
+        response = self.client.post(reverse('upload_complete', args=[upload_id]))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], UploadSession.ASSEMBLING)
+        self.assertEqual(UploadSession.objects.get(pk=upload_id).stored_name, '')
+
+        self.assertEqual(run_pending(['uploads']), (1, 0))
+        status = self.client.get(reverse('upload_detail', args=[upload_id])).json()
+        self.assertEqual((status['status'], status['complete']), (UploadSession.COMPLETE, True))
+        session = UploadSession.objects.get(pk=upload_id)
+        self.assertEqual(session.sha256, hashlib.sha256(data).hexdigest())
+        with Volume._meta.get_field('pdf_file').storage.open(session.stored_name) as stored:
+            self.assertEqual(stored.read(), data)
+
+    def test_size_mismatch_marks_the_upload_failed(self):
+        upload_id = self.upload(b'%PDF-1.4 volume one')
+        UploadSession.objects.filter(pk=upload_id).update(size=18)  # Same chunk count, one byte short
+        self.client.post(reverse('upload_complete', args=[upload_id]))
+
+        self.assertEqual(run_pending(['uploads']), (1, 0))
+        status = self.client.get(reverse('upload_detail', args=[upload_id])).json()
+        self.assertEqual(status['status'], UploadSession.FAILED)
+        self.assertTrue(status['error'])
+
+    def test_form_attaches_only_the_editors_own_uploads(self):
+        book = BookSet.objects.create(title='Torts', author='A. Author')
+        other = User.objects.create_user('other', 'other@example.com', 'pw', is_staff=True)
+        session = UploadSession.objects.create(user=other, filename='v1.pdf', size=10, chunk_size=4,
+                                               stored_name='volumes/ab/ab.pdf', status=UploadSession.COMPLETE)
+        data = {'book_set': book.pk, 'volume_number': 1, 'pdf_upload': str(session.pk)}
+
+        form = VolumeAdminForm(data, user=self.staff)
+        self.assertFalse(form.is_valid())
+        self.assertIn('pdf_upload', form.errors)
+
+        UploadSession.objects.filter(pk=session.pk).update(user=self.staff)
+        form = VolumeAdminForm(data, user=self.staff)
+        self.assertTrue(form.is_valid(), form.errors)
+
+    @PLAIN_STATIC
+    def test_admin_inline_passes_the_editor_to_each_form(self):
+        self.staff.is_superuser = True
+        self.staff.save()
+        response = self.client.get(reverse('admin:libraryApp_bookset_add'))
+        formset = response.context['inline_admin_formsets'][0].formset
+        self.assertEqual([form.user for form in formset.forms], [self.staff])
+        self.assertEqual(formset.empty_form.user, self.staff)
+
+
+class CheckVolumesTests(TestCase):
+    def setUp(self):
+        temp_media(self, 'pdf_file', 'preview_pdf')
+
+    def check(self):
+        out = StringIO()
+        call_command('check_volumes', stdout=out)
+        return json.loads(out.getvalue())
+
+    def test_runs_against_an_empty_media_root(self):
+        book = BookSet.objects.create(title='Torts', author='A. Author')
+        with self.assertLogs('libraryApp.models', 'WARNING'):  # Missing, so saved unhashed
+            volume = Volume.objects.create(book_set=book, volume_number=1, pdf_file='volumes/ab/ab.pdf')
+        report = self.check()
+        self.assertEqual(report['listing'], {'pdf_file': 'bulk', 'preview_pdf': 'bulk'})
+        self.assertEqual(report['missing'], [{'volume': volume.pk, 'field': 'pdf_file', 'name': 'volumes/ab/ab.pdf'}])
+        self.assertEqual(report['orphans'], [])
+
+
+class StoredPdfHashTests(TestCase):
+    def setUp(self):
+        self.storage = temp_media(self, 'pdf_file')
+
+    def test_files_saved_before_the_volume_are_hashed_and_shared(self):
+        data = make_pdf(2)
+        first = make_set(volumes=[data]).volumes.get()  # FieldFile.save() stores the file, then saves
+        self.assertEqual(first.pdf_sha256, hashlib.sha256(data).hexdigest())
+        self.assertEqual(first.pdf_size, len(data))
+
+        copy = Volume(book_set=make_set('Equity'), volume_number=1)
+        copy.pdf_file.save('copy.pdf', ContentFile(data), save=False)
+        written = copy.pdf_file.name
+        with self.captureOnCommitCallbacks(execute=True):
+            copy.save()
+        self.assertEqual(copy.pdf_file.name, first.pdf_file.name)
+        self.assertEqual(copy.pdf_sha256, first.pdf_sha256)
+        self.assertFalse(self.storage.exists(written))
+
+    def test_missing_files_are_saved_unhashed(self):
+        book = make_set()
+        with self.assertLogs('libraryApp.models', 'WARNING'):
+            volume = Volume.objects.create(book_set=book, volume_number=1, pdf_file='volumes/gone.pdf')
+        self.assertEqual((volume.pdf_sha256, volume.pdf_size), ('', 0))
+
+
+class PreviewBuildTests(TestCase):
+    def setUp(self):
+        self.storage = temp_media(self, 'pdf_file', 'preview_pdf')
+        self.volume = make_set(volumes=[make_pdf(5)], preview_pages=2).volumes.get()
+
+    def test_incremental_build_skips_a_current_preview(self):
+        self.assertEqual(build_volume_preview(self.volume), 2)
+        self.assertIsNone(build_volume_preview(self.volume))
+
+    def test_copies_the_first_pages_within_the_byte_budget(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        source, target = os.path.join(workdir, 'source.pdf'), os.path.join(workdir, 'preview.pdf')
+        with open(source, 'wb') as fh:
+            fh.write(make_pdf(5))
+
+        self.assertEqual(render_preview(source, 2, target, max_bytes=10 ** 6), (2, 5))
+        widths = [page.mediabox.width for page in PdfReader(target).pages]
+        self.assertEqual(widths, [200, 201])
+        with self.assertRaises(PreviewBudgetExceeded):
+            render_preview(source, 2, target, max_bytes=10)
+
+    def test_forced_rebuild_keeps_the_content_address(self):
+        build_volume_preview(self.volume, force=True)
+        name = self.volume.preview_pdf.name
+        with self.captureOnCommitCallbacks(execute=True):
+            build_volume_preview(self.volume, force=True)
+        self.assertEqual(self.volume.preview_pdf.name, name)
+        self.assertTrue(self.storage.exists(name))
+        directory = os.path.dirname(name)
+        self.assertEqual(self.storage.listdir(directory)[1], [os.path.basename(name)])
+
+
+class PageTextTests(TestCase):
+    def test_indexes_remote_pdfs_from_a_local_copy(self):
+        temp_media(self, 'pdf_file')
+        volume = make_set(volumes=[make_pdf(3)]).volumes.get()
+
+        # As with Cloudinary: no filesystem path, and open() would buffer the whole file
+        with mock.patch.object(type(volume.pdf_file), 'path', new_callable=mock.PropertyMock,
+                               side_effect=NotImplementedError), \
+                mock.patch('libraryApp.streaming.iter_file_chunks',
+                           side_effect=lambda f: iter([volume.pdf_file.storage.open(volume.pdf_file.name).read()])), \
+                mock.patch.object(type(volume.pdf_file), 'open', side_effect=AssertionError('buffered open')):
+            self.assertEqual(index_volume_text(volume, force=True), 3)
+        self.assertEqual(volume.pages.count(), 3)
+
+
+class PageImageTests(TestCase):
+    def setUp(self):
+        temp_media(self, 'pdf_file', 'preview_pdf')
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        settings = override_settings(PAGE_IMAGE_ROOT=root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        book = BookSet.objects.create(title='Torts', author='A. Author', preview_pages=2)
+        self.volume = Volume.objects.create(book_set=book, volume_number=1, preview_page_count=2)
+        self.volume.preview_pdf.save('preview.pdf', ContentFile(make_pdf(2)))
+
+    @skipUnless(pageimages.RENDERER_INSTALLED, 'PyMuPDF is an optional extra (requirements-render.txt)')
+    def test_pages_outside_the_preview_are_404(self):
+        for page in (0, 3):
+            response = self.client.get(reverse('preview_page_image', args=[self.volume.pk, page]))
+            self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('preview_thumb_image', args=[self.volume.pk, 2]))
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/webp'))
+
+    @skipUnless(pageimages.RENDERER_INSTALLED, 'PyMuPDF is an optional extra (requirements-render.txt)')
+    def test_concurrent_misses_render_the_page_once(self):
+        def slow_render(*args):
+            time.sleep(0.2)
+            return render(*args)
+
+        render = pageimages.render_page
+        with mock.patch.object(pageimages, 'render_page', side_effect=slow_render) as rendered:
+            threads = [threading.Thread(target=pageimages.get_page_image, args=(self.volume, 1)) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(rendered.call_count, 1)
+        self.assertTrue(os.path.exists(pageimages.page_image_path(self.volume, 1, 'page')))
+
+    @PLAIN_STATIC
+    def test_without_the_renderer_only_the_preview_pdf_is_offered(self):
+        with mock.patch('libraryApp.views.RENDERER_INSTALLED', False):
+            image = self.client.get(reverse('preview_page_image', args=[self.volume.pk, 1]))
+            detail = self.client.get(reverse('book_detail', args=[self.volume.book_set_id]))
+        self.assertEqual(image.status_code, 404)
+        self.assertContains(detail, 'View Preview')
+        self.assertNotContains(detail, 'Read Preview Here')
+
+
+class DownloadSetTests(TestCase):
+    def setUp(self):
+        temp_media(self, 'pdf_file', 'preview_pdf')
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        settings = override_settings(SET_ARCHIVE_ROOT=root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.pdfs = [make_pdf(1), make_pdf(3)]
+        self.book = make_set(volumes=self.pdfs, access_type='free')
+        self.client.force_login(User.objects.create_user('reader', 'reader@example.com', 'pw'))
+
+    def download(self):
+        response = self.client.get(reverse('download_set', args=[self.book.pk]))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_streams_a_stored_zip_of_every_volume(self):
+        response = self.download()
+        self.assertTrue(response.streaming)
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertEqual([info.compress_type for info in archive.infolist()], [zipfile.ZIP_STORED] * 2)
+            self.assertEqual([archive.read(f"Torts_Vol{n}.pdf") for n in (1, 2)], self.pdfs)
+
+    def test_second_download_is_served_from_the_archive_cache(self):
+        streamed = b''.join(self.download().streaming_content)
+        path = cached_archive(self.book)
+        self.assertIsNotNone(path)
+        response = self.download()
+        self.assertEqual(response['Content-Length'], str(len(streamed)))
+        self.assertEqual(b''.join(response.streaming_content), streamed)
+
+    def test_replacing_a_volume_pdf_invalidates_the_archive(self):
+        b''.join(self.download().streaming_content)
+        old_path = cached_archive(self.book)
+        volume = self.book.volumes.get(volume_number=1)
+        volume.pdf_file.save('v1-new.pdf', ContentFile(make_pdf(2)))
+
+        self.assertFalse(os.path.exists(old_path))
+        self.assertIsNone(cached_archive(self.book))
+        with zipfile.ZipFile(BytesIO(b''.join(self.download().streaming_content))) as archive:
+            self.assertEqual(archive.read('Torts_Vol1.pdf'), make_pdf(2))
+
+    def test_memory_stays_at_about_one_chunk(self):
+        volume = self.book.volumes.get(volume_number=2)
+        volume.pdf_file.save('big.pdf', ContentFile(os.urandom(256 * 1024)))
+        pieces = list(stream_zip([('big.pdf', volume.pdf_file)], chunk_size=4096))
+        self.assertGreater(len(pieces), 60)
+        self.assertLess(max(len(piece) for piece in pieces), 4096 + 1024)  # One chunk plus ZIP headers
+
+
+class VolumeDeliveryTests(TestCase):
+    def setUp(self):
+        temp_media(self, 'pdf_file', 'preview_pdf')
+        self.pdf = make_pdf(2)
+        self.book = make_set(volumes=[self.pdf], access_type='paid')
+        self.volume = self.book.volumes.get()
+        self.url = reverse('volume_pdf', args=[self.volume.pk])
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'pw')
+        Purchase.objects.create(user=self.user, book_set=self.book)
+        self.client.force_login(self.user)
+
+    def get(self, **headers):
+        response = self.client.get(self.url, **headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-9', 100), (0, 10))
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 10))
+        self.assertEqual(parse_range('bytes=-5', 100), (95, 5))
+        self.assertEqual(parse_range('bytes=50-500', 100), (50, 50))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 100))  # Multiple ranges: send it all
+        for header in ('bytes=100-', 'bytes=-0', 'bytes=9-3'):
+            with self.assertRaises(ValueError):
+                parse_range(header, 100)
+
+    def test_whole_file(self):
+        response, body = self.get()
+        self.assertEqual((response.status_code, response['Accept-Ranges']), (200, 'bytes'))
+        self.assertEqual(body, self.pdf)
+
+    def test_byte_range(self):
+        response, body = self.get(HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f"bytes 10-19/{len(self.pdf)}")
+        self.assertEqual(body, self.pdf[10:20])
+
+    def test_unsatisfiable_range_is_416(self):
+        response, _ = self.get(HTTP_RANGE=f"bytes={len(self.pdf)}-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f"bytes */{len(self.pdf)}")
+
+    def test_stale_if_range_sends_the_whole_file(self):
+        response, body = self.get(HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"old"')
+        self.assertEqual((response.status_code, body), (200, self.pdf))
+
+    def test_etag_revalidation(self):
+        response, _ = self.get()
+        response, _ = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_readers_without_the_set_are_refused(self):
+        self.client.force_login(User.objects.create_user('other', 'other@example.com', 'pw'))
+        self.assertEqual(self.get()[0].status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.get()[0].status_code, 302)
+
+    @override_settings(MEDIA_SENDFILE_BACKEND='nginx', MEDIA_SENDFILE_URL='/protected/')
+    def test_sendfile_hands_off_to_the_front_server(self):
+        response, body = self.get()
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/' + self.volume.pdf_file.path.lstrip('/'))
+        self.assertEqual(body, b'')
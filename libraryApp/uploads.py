@@ -0,0 +1,241 @@
+"""Chunked, resumable uploads of large volume PDFs from the admin.
+
+The browser splits a file into CHUNK_SIZE pieces and PUTs each one with its
+SHA-256. Every chunk is streamed from the request straight into the chunk
+storage and hashed on the way. A chunk whose digest does not match is
+discarded and can be sent again. Any chunk can be retried, so a dropped
+connection resumes from the chunks the server already holds (see
+``upload_status``) instead of starting over.
+
+Once every chunk is in, ``request_assembly`` hands the upload to the
+``uploads`` background job and the browser polls ``upload_status``.
+Assembling a 2 GB file would outlast the proxy's request timeout.
+``assemble_upload`` streams the chunks in order, once to hash the whole file
+and, unless an identical PDF is already stored (see blobs.py), once more
+into the media storage under its content-addressed name. No step holds more
+than one read buffer in memory. The worker reads the chunks from
+``chunk_storage``, so it must share that storage with the web processes.
+"""
+import hashlib
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .blobs import content_pdf_name, find_shared_pdf, release
+from .models import UploadChunk, UploadSession, Volume
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 8 * 1024 * 1024
+READ_SIZE = 64 * 1024
+MAX_UPLOAD_SIZE = 2 * 1024 ** 3
+STALE_AFTER = timedelta(days=1)
+
+
+class UploadError(Exception):
+    pass
+
+
+def chunk_storage():
+    # Local by default; point UPLOAD_CHUNK_STORAGE at shared storage when running several web servers
+    if settings.UPLOAD_CHUNK_STORAGE:
+        return import_string(settings.UPLOAD_CHUNK_STORAGE)()
+    return FileSystemStorage(location=settings.UPLOAD_CHUNK_ROOT)
+
+
+def _chunk_name(session, index):
+    return f"{session.pk}/{index:06d}"
+
+
+class _HashingReader:
+    """File-like view of a request body that hashes and counts what is read, up to ``limit`` bytes."""
+
+    def __init__(self, stream, limit):
+        self.stream = stream
+        self.limit = limit
+        self.size = 0
+        self.digest = hashlib.sha256()
+
+    def read(self, size=READ_SIZE):
+        data = self.stream.read(size if size and size > 0 else READ_SIZE)
+        self.size += len(data)
+        if self.size > self.limit:
+            raise UploadError('Chunk is larger than the agreed chunk size')
+        self.digest.update(data)
+        return data
+
+
+class _ChainedChunks:
+    """Read-only file over a session's chunks in order, opening one chunk at a time."""
+
+    def __init__(self, storage, names):
+        self.storage = storage
+        self.names = iter(names)
+        self.current = None
+
+    def read(self, size=READ_SIZE):
+        size = size if size and size > 0 else READ_SIZE
+        while True:
+            if self.current is None:
+                name = next(self.names, None)
+                if name is None:
+                    return b''
+                self.current = self.storage.open(name, 'rb')
+            data = self.current.read(size)
+            if data:
+                return data
+            self.current.close()
+            self.current = None
+
+    def close(self):
+        if self.current is not None:
+            self.current.close()
+
+
+def start_upload(user, filename, size):
+    if not 0 < size <= MAX_UPLOAD_SIZE:
+        raise UploadError('File is empty or too large')
+    purge_stale_uploads()
+    return UploadSession.objects.create(user=user, filename=filename[:255], size=size, chunk_size=CHUNK_SIZE)
+
+
+def upload_status(session):
+    return {
+        'id': str(session.pk),
+        'chunk_size': session.chunk_size,
+        'chunks': session.chunk_count,
+        'received': sorted(session.chunks.values_list('index', flat=True)),
+        'status': session.status,
+        'error': session.error,
+        'complete': session.status == UploadSession.COMPLETE,
+    }
+
+
+def receive_chunk(session, index, stream, expected_sha256):
+    """Stream one chunk into chunk storage, verifying its size and checksum."""
+    if session.status != UploadSession.UPLOADING:
+        raise UploadError(f"Upload is {session.status}; no more chunks are accepted")
+    if not 0 <= index < session.chunk_count:
+        raise UploadError('Chunk index out of range')
+    expected_size = min(session.chunk_size, session.size - index * session.chunk_size)
+
+    storage = chunk_storage()
+    name = _chunk_name(session, index)
+    storage.delete(name)  # A retried chunk replaces the earlier attempt
+    reader = _HashingReader(stream, expected_size)
+    try:
+        saved = storage.save(name, File(reader, name=name))
+    except UploadError:
+        storage.delete(name)
+        raise
+    sha256 = reader.digest.hexdigest()
+    if reader.size != expected_size or sha256 != (expected_sha256 or '').lower():
+        storage.delete(saved)
+        raise UploadError('Chunk checksum or size mismatch; send it again')
+    UploadChunk.objects.update_or_create(session=session, index=index, defaults={'sha256': sha256, 'size': reader.size})
+    UploadSession.objects.filter(pk=session.pk).update(updated_at=timezone.now())  # Still active: not stale
+
+
+def _check_chunks(session):
+    missing = set(range(session.chunk_count)) - set(session.chunks.values_list('index', flat=True))
+    if missing:
+        raise UploadError(f"Missing chunks: {sorted(missing)[:10]}")
+
+
+def request_assembly(session):
+    """Queue assembly of a fully received upload. Returns the updated session."""
+    if session.status in (UploadSession.ASSEMBLING, UploadSession.COMPLETE):
+        return session
+    _check_chunks(session)
+    UploadSession.objects.filter(pk=session.pk).update(
+        status=UploadSession.ASSEMBLING, error='', updated_at=timezone.now(),
+    )
+    from .jobs import enqueue
+    enqueue('uploads', 0)
+    session.refresh_from_db()
+    return session
+
+
+def assemble_upload(session):
+    """Assemble the chunks into the stored PDF. Returns the updated session."""
+    if session.stored_name:
+        return session
+    _check_chunks(session)
+
+    storage = chunk_storage()
+    names = [_chunk_name(session, index) for index in range(session.chunk_count)]
+    digest = hashlib.sha256()
+    size = 0
+    reader = _ChainedChunks(storage, names)
+    for data in iter(reader.read, b''):
+        digest.update(data)
+        size += len(data)
+    if size != session.size:
+        raise UploadError('Assembled file size does not match')
+
+    pdf_sha256 = digest.hexdigest()
+    shared = find_shared_pdf(pdf_sha256)
+    if shared:
+        stored_name = shared[0]  # Identical PDF already stored: nothing to upload
+    else:
+        reader = _ChainedChunks(storage, names)
+        try:
+            stored_name = Volume._meta.get_field('pdf_file').storage.save(
+                content_pdf_name(pdf_sha256), File(reader, name=session.filename),
+            )
+        finally:
+            reader.close()
+
+    with transaction.atomic():
+        session.stored_name = stored_name
+        session.sha256 = pdf_sha256
+        session.status = UploadSession.COMPLETE
+        session.save(update_fields=['stored_name', 'sha256', 'status', 'updated_at'])
+        session.chunks.all().delete()
+    for name in names:
+        storage.delete(name)
+    return session
+
+
+def assemble_pending_uploads():
+    """Assemble every upload waiting for it. Bad uploads are marked failed; the others still run."""
+    unexpected = None
+    for session in UploadSession.objects.filter(status=UploadSession.ASSEMBLING).order_by('updated_at'):
+        try:
+            assemble_upload(session)
+        except UploadError as e:
+            UploadSession.objects.filter(pk=session.pk).update(status=UploadSession.FAILED, error=str(e))
+        except Exception as e:
+            # Storage trouble: leave it queued and fail the job, so it is retried with backoff
+            logger.exception("Assembling upload %s failed", session.pk)
+            unexpected = e
+    if unexpected is not None:
+        raise unexpected
+
+
+def purge_stale_uploads():
+    """Drop uploads nobody has touched for a day, and finished ones that were never attached to a volume."""
+    storage = chunk_storage()
+    stale = UploadSession.objects.filter(updated_at__lt=timezone.now() - STALE_AFTER)
+    for session in stale:
+        for index in session.chunks.values_list('index', flat=True):
+            storage.delete(_chunk_name(session, index))
+        if session.stored_name:
+            release(Volume._meta.get_field('pdf_file'), 'pdf_file', session.stored_name)
+    stale.delete()
+
+
+def attach_upload(volume, session):
+    """Point ``volume.pdf_file`` at an assembled upload (the caller saves the volume)."""
+    volume.pdf_file.name = session.stored_name
+    volume.pdf_sha256 = session.sha256
+    volume.pdf_size = session.size
+    shared = find_shared_pdf(session.sha256, exclude_pk=volume.pk)
+    volume.pdf_page_count = shared[1] if shared else 0
+    volume._pdf_sha256_verified = True  # Hashed during assembly; see hash_volume_pdf
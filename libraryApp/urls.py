@@ -11,11 +11,22 @@ urlpatterns = [
     # Book details & preview
     path('book/<int:pk>/', views.BookDetailView.as_view(), name='book_detail'),
     path('preview/<int:volume_id>/', views.preview_volume, name='preview_volume'),  # AJAX
+    path('preview/<int:volume_id>/page/<int:page_number>.webp', views.preview_page_image, name='preview_page_image'),
+    path('preview/<int:volume_id>/thumb/<int:page_number>.webp', views.preview_page_image, {'rendition': 'thumb'}, name='preview_thumb_image'),
+    path('media/volume/<int:volume_id>/full.pdf', views.volume_file, {'kind': 'pdf'}, name='volume_pdf'),  # Access-checked
+    path('media/volume/<int:volume_id>/preview.pdf', views.volume_file, {'kind': 'preview'}, name='volume_preview_pdf'),
 
     # Purchase & Access
     path('checkout/<int:book_id>/', views.checkout, name='checkout'),
     path('dashboard/', views.dashboard, name='dashboard'),
     path('download/<int:book_id>/', views.download_set, name='download_set'),
+    path('stripe/webhook/', views.stripe_webhook, name='stripe_webhook'),
+
+    # Chunked admin uploads
+    path('uploads/', views.upload_start, name='upload_start'),
+    path('uploads/<uuid:upload_id>/', views.upload_detail, name='upload_detail'),
+    path('uploads/<uuid:upload_id>/chunks/<int:index>/', views.upload_chunk, name='upload_chunk'),
+    path('uploads/<uuid:upload_id>/complete/', views.upload_complete, name='upload_complete'),
 
     # Auth (integrate with allauth)
     path('accounts/login/', auth_views.LoginView.as_view(template_name='accounts/login.html'), name='login'),
@@ -1,20 +1,42 @@
+import json
+import logging
 from django.utils import timezone
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse, Http404, HttpResponseForbidden
 from django.views import View
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.generic import ListView, DetailView
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST, require_http_methods
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
 from django.http import JsonResponse
 from django.urls import reverse
 from django.db.models import Q
 from django.conf import settings
-from .models import BookSet, Volume, Purchase, Category
+from django.utils.text import slugify
+from django.core.cache import cache
+from django.core.paginator import InvalidPage
+from .models import BookSet, Volume, Purchase, Category, BackgroundJob, UploadSession
 from .forms import SearchForm, CheckoutForm
+from .archives import cached_archive, stream_and_cache
+from .catalog import (
+    CACHE_TIMEOUT as CATALOG_CACHE_TIMEOUT, book_version, cached_categories, catalog_cache_key, facet_counts, filter_book_sets,
+    normalize_filters,
+)
+from .delivery import LocalFile, serve_file
+from .entitlements import get_entitlements
+from .jobs import enqueue, job_status
+from .payments import PaymentUnavailable, create_checkout_session
+from .pagination import MAX_PAGE_NUMBER, CappedPaginator, encode_cursor, keyset_page
+from .pageimages import RENDERER_INSTALLED, get_page_image
+from .search import search_pages
+from .uploads import UploadError, receive_chunk, request_assembly, start_upload, upload_status
+from .webhooks import receive_event, verify_event
 import stripe
-import zipfile
-from io import BytesIO
-from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
 
 
 class Home(View):
@@ -28,24 +50,110 @@ class LibraryListView(ListView):
     context_object_name = 'books'
     paginate_by = 12  # Modern pagination
 
+    def get_filters(self):
+        return normalize_filters(self.request.GET, BookSet.ACCESS_CHOICES)
+
     def get_queryset(self):
-        queryset = BookSet.objects.all()
-        query = self.request.GET.get('q')
-        category = self.request.GET.get('category')
-        access_type = self.request.GET.get('access')
-        if query:
-            queryset = queryset.filter(Q(title__icontains=query) | Q(description__icontains=query))
-        if category:
-            queryset = queryset.filter(categories__slug=category)
-        if access_type:
-            queryset = queryset.filter(access_type=access_type)
-        return queryset.distinct().order_by('-created_at')
+        filters = self.get_filters()
+        queryset = filter_book_sets(BookSet.objects.all(), *filters)
+        # id breaks ties so page numbers and cursors agree on one order
+        if filters[0]:
+            return queryset.order_by('-rank', '-created_at', '-id')
+        return queryset.order_by('-created_at', '-id')
+
+    def paginate_queryset(self, queryset, page_size):
+        # Cache only the ids and paging state; the queryset stays lazy on a hit
+        filters = self.get_filters()
+        params = self.request.GET
+        # Search results are ranked, not dated, so they only get the numbered pages
+        after, before = ('', '') if filters[0] else (params.get('after', ''), params.get('before', ''))
+        page_number = '' if after or before else str(params.get(self.page_kwarg) or 1)
+        key = catalog_cache_key('list', filters, after, before, page_number, page_size)
+        state = cache.get(key)
+        if state is None:
+            books, state = self.build_page(queryset, page_size, after, before, page_number)
+            cache.set(key, state, CATALOG_CACHE_TIMEOUT)
+        else:
+            by_id = BookSet.objects.in_bulk(state['ids'])
+            books = [by_id[pk] for pk in state['ids'] if pk in by_id]
+        self.page_state = state
+        return None, None, books, state['has_previous'] or state['has_next']
+
+    def build_page(self, queryset, page_size, after, before, page_number):
+        if after or before:
+            try:
+                books, has_previous, has_next = keyset_page(queryset, page_size, after, before)
+            except ValueError:
+                raise Http404('Invalid cursor')
+            number = count = None
+            count_is_exact = False
+        else:
+            paginator = CappedPaginator(queryset, page_size)
+            try:
+                page = paginator.page(page_number)
+            except InvalidPage:
+                raise Http404('Invalid page')
+            if page.number > MAX_PAGE_NUMBER:
+                raise Http404('Invalid page')
+            books = list(page.object_list)
+            number, has_previous, has_next = page.number, page.has_previous(), page.has_next()
+            count, count_is_exact = paginator.display_count, paginator.count_is_exact
+        return books, {
+            'ids': [book.pk for book in books],
+            'number': number,
+            'count': count,
+            'count_is_exact': count_is_exact,
+            'has_previous': has_previous,
+            'has_next': has_next,
+        }
+
+    def page_url(self, **param):
+        params = self.request.GET.copy()
+        for name in (self.page_kwarg, 'after', 'before'):
+            params.pop(name, None)
+        params.update(param)
+        return '?' + params.urlencode()
+
+    def get_page_links(self, books):
+        state = self.page_state
+        previous_url = next_url = None
+        number = state['number']
+        if number is not None:
+            if state['has_previous']:
+                previous_url = self.page_url(**{self.page_kwarg: number - 1})
+            if state['has_next'] and number < MAX_PAGE_NUMBER:
+                next_url = self.page_url(**{self.page_kwarg: number + 1})
+            elif state['has_next'] and not self.get_filters()[0]:
+                next_url = self.page_url(after=encode_cursor(books[-1]))  # Continue past the numbered pages
+        else:
+            if state['has_previous'] and books:
+                previous_url = self.page_url(before=encode_cursor(books[0]))
+            if state['has_next'] and books:
+                next_url = self.page_url(after=encode_cursor(books[-1]))
+        return previous_url, next_url
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = Category.objects.all()  # For filters
+        query, category, access_type = filters = self.get_filters()
+        counts = facet_counts(filters)
+        # Filter options with their match counts; empty ones are hidden unless selected
+        context['categories'] = [
+            (cat, counts['category'].get(cat.slug, 0)) for cat in cached_categories()
+            if cat.slug in counts['category'] or cat.slug == category
+        ]
         context['search_form'] = SearchForm(self.request.GET)
-        context['access_types'] = [('free', 'Free'), ('paid', 'Paid'), ('students', 'Students Only')]
+        context['access_types'] = [
+            (value, label, counts['access'].get(value, 0)) for value, label in BookSet.ACCESS_CHOICES
+            if value in counts['access'] or value == access_type
+        ]
+        entitlements = get_entitlements(self.request.user)
+        context['page_hits'] = search_pages(query, entitlements) if query else []  # Matches inside volume PDFs
+        # Owned/locked badges for the grid, resolved without a query per card
+        context['readable_ids'] = entitlements.readable_ids(context['books'])
+        context['page_number'] = self.page_state['number']
+        context['result_count'] = self.page_state['count']
+        context['count_is_exact'] = self.page_state['count_is_exact']
+        context['previous_url'], context['next_url'] = self.get_page_links(context['books'])
         return context
 
 class BookDetailView(DetailView):
@@ -56,9 +164,11 @@ class BookDetailView(DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         book = context['book']
+        # Lazy: only queried when the cached TOC fragment below is missing or stale
         context['volumes'] = book.volumes.all()  # TOC-like list
-        #context['is_purchased'] = self.request.user.is_authenticated and Purchase.objects.filter(user=self.user, book_set=book).exists()
-        context['preview_volumes'] = book.volumes.filter(preview_pdf__isnull=False)[:2]  # First 2 for teaser
+        context['toc_version'] = book_version(book.pk)
+        context['can_read'] = get_entitlements(self.request.user).can_read(book)
+        context['page_images'] = RENDERER_INSTALLED  # Otherwise only the preview PDF is offered
         #context['stripe_key'] = settings.STRIPE_PUBLISHABLE_KEY
         context['feedback_url'] = f"mailto:{book.author}@example.com"  # Like Leanpub email
         return context
@@ -66,7 +176,10 @@ class BookDetailView(DetailView):
 @login_required
 def dashboard(request):
     # Post-purchase access: List bought books, downloads
-    purchases = Purchase.objects.filter(user=request.user, access_expires__gte=timezone.now()).select_related('book_set')
+    # Lifetime purchases have no expiry date
+    purchases = Purchase.objects.filter(
+        Q(access_expires__isnull=True) | Q(access_expires__gte=timezone.now()), user=request.user,
+    ).select_related('book_set')
     context = {'purchases': purchases}
     return render(request, 'libraryApp/dashboard.html', context)
 
@@ -79,10 +192,13 @@ def checkout(request, book_id):
     if request.method == 'POST':
         form = CheckoutForm(request.POST)
         if form.is_valid():
+            if not request.session.session_key:
+                request.session.save()  # Anonymous buyers still need a stable idempotency key
+            buyer = request.user.pk if request.user.is_authenticated else request.session.session_key
             try:
-                session = stripe.checkout.Session.create(
-                    payment_method_types=['card'],
-                    line_items=[{
+                session = create_checkout_session({
+                    'payment_method_types': ['card'],
+                    'line_items': [{
                         'price_data': {
                             'currency': 'usd',
                             'product_data': {'name': book.title},
@@ -90,13 +206,16 @@ def checkout(request, book_id):
                         },
                         'quantity': 1,
                     }],
-                    mode='payment',
-                    success_url=request.build_absolute_uri(reverse('dashboard')),
-                    cancel_url=request.build_absolute_uri(reverse('book_detail', args=[book.id])),
-                    metadata={'book_id': book.id, 'user_email': request.user.email if request.user.is_authenticated else ''},
-                )
-                # Create pending purchase or handle in webhook
+                    'mode': 'payment',
+                    'success_url': request.build_absolute_uri(reverse('dashboard')),
+                    'cancel_url': request.build_absolute_uri(reverse('book_detail', args=[book.id])),
+                    'client_reference_id': str(request.user.pk) if request.user.is_authenticated else None,
+                    'metadata': {'book_id': book.id, 'user_email': request.user.email if request.user.is_authenticated else ''},
+                }, key_parts=(buyer, book.id, book.price))
+                # The Purchase is created by stripe_webhook once payment completes
                 return redirect(session.url, code=303)
+            except PaymentUnavailable:
+                messages.error(request, 'Payments are temporarily unavailable. Please try again in a few minutes.')
             except stripe.error.StripeError as e:
                 messages.error(request, f'Payment error: {str(e)}')
     else:
@@ -104,93 +223,143 @@ def checkout(request, book_id):
 
     return render(request, 'libraryApp/checkout.html', {'book': book, 'form': form})
 
+@csrf_exempt
+@require_POST
+def stripe_webhook(request):
+    # Verify and store only; the run_jobs worker applies events to Purchases in batches
+    try:
+        event = verify_event(request.body, request.headers.get('Stripe-Signature'))
+    except ValueError:
+        return HttpResponse(status=400)
+    if receive_event(event):
+        enqueue('stripe_events', 0)
+    return HttpResponse(status=200)
+
 @login_required
 def download_set(request, book_id):
     book = get_object_or_404(BookSet, id=book_id)
-    if not Purchase.objects.filter(user=request.user, book_set=book).exists():
+    if not get_entitlements(request.user).can_read(book):
         messages.error(request, 'Access denied.')
         return redirect('dashboard')
 
-    # Create ZIP of all volumes
-    buffer = BytesIO()
-    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for volume in book.volumes.all():
-            if volume.pdf_file:
-                zip_file.write(volume.pdf_file.path, f"{book.title}_Vol{volume.volume_number}.pdf")
+    # Popular sets are served from the prebuilt archive with no PDF I/O
+    archive = cached_archive(book)
+    if archive:
+        return serve_file(request, LocalFile(archive), 'application/zip',
+                          filename=f"{slugify(book.title)}.zip", as_attachment=True)
 
-    buffer.seek(0)
-    response = HttpResponse(buffer, content_type='application/zip')
-    response['Content-Disposition'] = f'attachment; filename={book.slug}.zip'
+    # Otherwise stream the ZIP (memory stays flat) and keep a copy for next time
+    response = StreamingHttpResponse(stream_and_cache(book), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{slugify(book.title)}.zip"'
     return response
 
 def preview_volume(request, volume_id):
     # AJAX for modal preview (like Leanpub reader)
-    print(f"Received preview request for volume_id: {volume_id}")  # Debug log
-    
-    volume = get_object_or_404(Volume, id=volume_id)
-    print(f"Found volume: {volume}")  # Debug log
-    
+    volume = get_object_or_404(Volume.objects.select_related('book_set'), id=volume_id)
+
     try:
-        if request.user.is_authenticated and Purchase.objects.filter(user=request.user, book_set=volume.book_set).exists():
+        if get_entitlements(request.user).can_read(volume.book_set):
             if not volume.pdf_file:
-                print("Full PDF file is missing")  # Debug log
+                logger.debug("Volume %s has no PDF file", volume.id)
                 return JsonResponse({'error': 'Full PDF file is missing.'}, status=404)
-            pdf_path = volume.pdf_file.url
-            print(f"Using full PDF: {pdf_path}")  # Debug log
+            pdf_path = reverse('volume_pdf', args=[volume.id])  # Access-checked, supports Range
         else:
             if not volume.preview_pdf:
-                print("No preview PDF, attempting to generate")  # Debug log
-                # Try to regenerate the preview
-                try:
-                    import PyPDF2
-                    from io import BytesIO
-                    
-                    # Read full PDF
-                    print(f"Opening PDF file: {volume.pdf_file.path}")  # Debug log
-                    full_pdf = PyPDF2.PdfReader(volume.pdf_file.open())
-                    preview_writer = PyPDF2.PdfWriter()
-                    num_pages = min(volume.book_set.preview_pages, len(full_pdf.pages))
-                    print(f"Generating preview with {num_pages} pages")  # Debug log
-                    
-                    # Add first N pages to preview
-                    for page_num in range(num_pages):
-                        preview_writer.add_page(full_pdf.pages[page_num])
-                    
-                    # Save to BytesIO and upload
-                    buffer = BytesIO()
-                    preview_writer.write(buffer)
-                    buffer.seek(0)
-                    
-                    preview_name = f"preview_{volume.pdf_file.name}"
-                    print(f"Saving preview as: {preview_name}")  # Debug log
-                    volume.preview_pdf.save(preview_name, buffer, save=True)
-                    print("Preview generated successfully")  # Debug log
-                except Exception as e:
-                    print(f"Error generating preview: {e}")  # Debug log
-                    return JsonResponse({'error': f'Error generating preview: {str(e)}'}, status=500)
-            
-            pdf_path = volume.preview_pdf.url if volume.preview_pdf else None
-            print(f"Using preview PDF: {pdf_path}")  # Debug log
-
-        if not pdf_path:
-            print("No PDF path available")  # Debug log
-            return JsonResponse({'error': 'No preview available.'}, status=404)
-
-        # Verify file exists on disk
-        import os
-        from django.conf import settings
-        
-        file_path = os.path.join(settings.MEDIA_ROOT, pdf_path.replace(settings.MEDIA_URL, '').lstrip('/'))
-        print(f"Checking file existence at: {file_path}")  # Debug log
-        
-        if not os.path.exists(file_path):
-            print(f"File not found on disk: {file_path}")  # Debug log
-            return JsonResponse({'error': 'PDF file not found on disk.'}, status=404)
-
-        print(f"Returning PDF URL: {pdf_path}")  # Debug log
+                if not volume.pdf_file:
+                    return JsonResponse({'error': 'No preview available.'}, status=404)
+                # Generated by the run_jobs worker; the client polls until it is ready
+                status = job_status('preview', volume.id)
+                if status == BackgroundJob.FAILED:
+                    return JsonResponse({'status': status, 'error': 'Preview generation failed.'}, status=500)
+                if status not in (BackgroundJob.PENDING, BackgroundJob.RUNNING):
+                    enqueue('preview', volume.id)
+                return JsonResponse({'status': 'pending'}, status=202)
+
+            pdf_path = reverse('volume_preview_pdf', args=[volume.id])
+
+        logger.debug("Serving volume %s from %s", volume.id, pdf_path)
         return JsonResponse({'pdf_url': pdf_path})
 
-    except Exception as e:
-        print(f"Unexpected error: {e}")  # Debug log
-        return JsonResponse({'error': f'Error accessing PDF: {str(e)}'}, status=500)
+    except Exception:
+        logger.exception("Preview of volume %s failed", volume.id)
+        return JsonResponse({'error': 'Error accessing PDF.'}, status=500)
+
+
 
+def preview_page_image(request, volume_id, page_number, rendition='page'):
+    # One rendered preview page (or thumbnail), so the reader only fetches what is shown
+    volume = get_object_or_404(Volume, id=volume_id)
+    if not volume.preview_pdf or not RENDERER_INSTALLED:
+        raise Http404('No preview available.')
+    try:
+        path = get_page_image(volume, page_number, rendition)
+    except IndexError:
+        raise Http404('Page is not part of the preview.')
+
+    if request.GET.get('v') == volume.preview_version:
+        cache_control = 'public, max-age=31536000, immutable'  # Versioned URL: the bytes never change
+    else:
+        cache_control = 'public, max-age=300'
+    return serve_file(request, LocalFile(path), 'image/webp', cache_control=cache_control)
+
+
+def volume_file(request, volume_id, kind):
+    # Protected PDF delivery: full volumes need an entitlement, previews are public
+    volume = get_object_or_404(Volume.objects.select_related('book_set'), id=volume_id)
+    if kind == 'pdf':
+        if not get_entitlements(request.user).can_read(volume.book_set):
+            if not request.user.is_authenticated:
+                return redirect_to_login(request.get_full_path())
+            return HttpResponseForbidden('Purchase this set to read the full volume.')
+        field_file, cache_control = volume.pdf_file, 'private, max-age=0'
+        etag = f'"{volume.pdf_sha256}"' if volume.pdf_sha256 else None
+    else:
+        field_file, cache_control = volume.preview_pdf, 'public, max-age=3600'
+        etag = f'"{volume.preview_version}"' if volume.preview_pdf else None
+    if not field_file:
+        raise Http404('File not available.')
+
+    filename = f"{slugify(volume.book_set.title)}-vol{volume.volume_number}.pdf"
+    return serve_file(request, field_file, 'application/pdf', filename=filename,
+                      etag=etag, cache_control=cache_control)
+
+
+# Chunked admin uploads (see uploads.py); the widget in admin.py drives these
+@staff_member_required
+@require_POST
+def upload_start(request):
+    try:
+        data = json.loads(request.body)
+        session = start_upload(request.user, str(data['filename']), int(data['size']))
+    except (ValueError, KeyError, TypeError, UploadError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(upload_status(session), status=201)
+
+
+@staff_member_required
+def upload_detail(request, upload_id):
+    session = get_object_or_404(UploadSession, pk=upload_id, user=request.user)
+    return JsonResponse(upload_status(session))
+
+
+@staff_member_required
+@require_http_methods(['PUT'])
+def upload_chunk(request, upload_id, index):
+    session = get_object_or_404(UploadSession, pk=upload_id, user=request.user)
+    try:
+        receive_chunk(session, index, request, request.headers.get('X-Chunk-SHA256'))
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return HttpResponse(status=204)
+
+
+@staff_member_required
+@require_POST
+def upload_complete(request, upload_id):
+    session = get_object_or_404(UploadSession, pk=upload_id, user=request.user)
+    try:
+        session = request_assembly(session)
+    except UploadError as e:
+        return JsonResponse({'error': str(e), **upload_status(session)}, status=400)
+    # Assembled by the run_jobs worker; the widget polls upload_detail until it is complete
+    return JsonResponse(upload_status(session), status=200 if session.status == UploadSession.COMPLETE else 202)
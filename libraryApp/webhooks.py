@@ -0,0 +1,131 @@
+"""Stripe webhook inbox.
+
+The endpoint only verifies the signature and inserts the event into
+StripeEvent. The unique event id makes Stripe's retries no-ops. A single
+``stripe_events`` background job then drains the inbox in batches,
+creating Purchases with a few set-based queries per batch instead of
+several ORM round trips per event.
+
+Signed payloads for local testing need no network::
+
+    header = stripe.WebhookSignature.generate_signature_header(body, settings.STRIPE_WEBHOOK_SECRET)
+    Client().post(reverse('stripe_webhook'), body, content_type='application/json',
+                  HTTP_STRIPE_SIGNATURE=header)
+"""
+import json
+import logging
+
+import stripe
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from .entitlements import invalidate_entitlements
+from .models import BookSet, Purchase, StripeEvent
+
+logger = logging.getLogger(__name__)
+
+# Events that grant access; everything else is acknowledged and dropped
+HANDLED_EVENTS = {
+    'checkout.session.completed',
+    'checkout.session.async_payment_succeeded',
+}
+BATCH_SIZE = 500
+
+
+def verify_event(payload, signature):
+    """Return the decoded event, or raise ValueError if the signature or body is invalid."""
+    try:
+        stripe.WebhookSignature.verify_header(
+            payload, signature, settings.STRIPE_WEBHOOK_SECRET, tolerance=settings.STRIPE_WEBHOOK_TOLERANCE,
+        )
+        event = json.loads(payload)
+        return {'id': event['id'], 'type': event['type'], 'data': event['data']}
+    except (stripe.SignatureVerificationError, ValueError, KeyError, TypeError) as e:
+        raise ValueError(str(e)) from e
+
+
+def receive_event(event):
+    """Store ``event`` in the inbox. Returns False for event types we ignore."""
+    if event['type'] not in HANDLED_EVENTS:
+        return False
+    # ON CONFLICT DO NOTHING: one statement, safe under concurrent retries
+    StripeEvent.objects.bulk_create(
+        [StripeEvent(event_id=event['id'], type=event['type'], payload=event['data'])],
+        ignore_conflicts=True,
+    )
+    return True
+
+
+def _session_grant(event):
+    """``(user_id, user_email, book_id)`` from a Checkout Session event, or None if unpaid."""
+    session = event.payload.get('object', {})
+    if session.get('payment_status') not in ('paid', 'no_payment_required'):
+        return None  # async payments are granted by async_payment_succeeded
+    metadata = session.get('metadata') or {}
+    user_id = metadata.get('user_id') or session.get('client_reference_id')
+    email = metadata.get('user_email') or (session.get('customer_details') or {}).get('email')
+    return (int(user_id) if user_id else None), (email or '').lower(), int(metadata['book_id'])
+
+
+def apply_pending_events(batch_size=BATCH_SIZE):
+    """Apply up to ``batch_size`` unprocessed inbox events. Returns how many were handled."""
+    with transaction.atomic():
+        events = list(
+            StripeEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True).order_by('received_at')[:batch_size]
+        )
+        if not events:
+            return 0
+
+        grants, errors = {}, {}
+        for event in events:
+            try:
+                grants[event.pk] = _session_grant(event)
+            except (KeyError, TypeError, ValueError) as e:
+                errors[event.pk] = f"Malformed session: {e!r}"
+        wanted = [grant for grant in grants.values() if grant]
+
+        # Resolve every user and book in the batch with one query each
+        user_ids = set(User.objects.filter(
+            pk__in={user_id for user_id, _, _ in wanted if user_id}).values_list('pk', flat=True))
+        by_email = dict(User.objects.annotate(email_lower=Lower('email')).filter(
+            email_lower__in={email for _, email, _ in wanted if email}).values_list('email_lower', 'pk'))
+        book_ids = set(BookSet.objects.filter(
+            pk__in={book_id for _, _, book_id in wanted}).values_list('pk', flat=True))
+
+        pairs = set()
+        for pk, grant in grants.items():
+            if grant is None:
+                continue
+            user_id, email, book_id = grant
+            user_id = user_id if user_id in user_ids else by_email.get(email)
+            if user_id is None or book_id not in book_ids:
+                errors[pk] = f"Unknown user {grant[0] or email!r} or book set {book_id}"
+            else:
+                pairs.add((user_id, book_id))
+
+        if pairs:
+            Purchase.objects.bulk_create(
+                [Purchase(user_id=user_id, book_set_id=book_id) for user_id, book_id in pairs],
+                ignore_conflicts=True,  # Already bought: unique (user, book_set)
+            )
+            # Buying again turns lapsed time-limited access into lifetime access
+            renew = Q()
+            for user_id, book_id in pairs:
+                renew |= Q(user_id=user_id, book_set_id=book_id)
+            Purchase.objects.filter(renew, access_expires__isnull=False).update(access_expires=None)
+            # bulk_create and update() send no signals
+            for user_id in {user_id for user_id, _ in pairs}:
+                invalidate_entitlements(user_id)
+
+        now = timezone.now()
+        StripeEvent.objects.filter(pk__in=[event.pk for event in events]).exclude(
+            pk__in=errors).update(processed_at=now)
+        for pk, error in errors.items():
+            logger.warning("Stripe event %s not applied: %s", pk, error)
+            StripeEvent.objects.filter(pk=pk).update(processed_at=now, error=error)
+    return len(events)
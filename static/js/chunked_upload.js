@@ -0,0 +1,147 @@
+/**
+ * chunked_upload.js
+ * Resumable chunked upload for large volume PDFs in the BookSet admin.
+ * Loaded via ChunkedUploadWidget.Media in libraryApp/forms.py.
+ *
+ * Each chunk is sent with its SHA-256 and retried on failure. The upload id is
+ * remembered per file in localStorage, so choosing the same file again after
+ * a dropped connection or a reload only sends the chunks the server is missing.
+ * Once every chunk is in, the server assembles the file in the background and
+ * the widget polls the upload until it is complete or has failed.
+ */
+(function () {
+    "use strict";
+
+    var MAX_ATTEMPTS = 4;
+    var POLL_INTERVAL = 3000;
+
+    function csrfToken() {
+        var input = document.querySelector('input[name="csrfmiddlewaretoken"]');
+        return input ? input.value : '';
+    }
+
+    function request(url, options) {
+        options = options || {};
+        options.credentials = 'same-origin';
+        options.headers = Object.assign({'X-CSRFToken': csrfToken()}, options.headers || {});
+        return fetch(url, options).then(function (response) {
+            if (response.status === 204) {
+                return null;
+            }
+            return response.json().then(function (data) {
+                if (!response.ok) {
+                    throw new Error(data.error || response.statusText);
+                }
+                return data;
+            });
+        });
+    }
+
+    function sha256Hex(buffer) {
+        return crypto.subtle.digest('SHA-256', buffer).then(function (digest) {
+            return Array.prototype.map.call(new Uint8Array(digest), function (b) {
+                return ('0' + b.toString(16)).slice(-2);
+            }).join('');
+        });
+    }
+
+    function sleep(ms) {
+        return new Promise(function (resolve) { setTimeout(resolve, ms); });
+    }
+
+    async function sendChunk(url, blob) {
+        var buffer = await blob.arrayBuffer();
+        var checksum = await sha256Hex(buffer);
+        for (var attempt = 1; ; attempt++) {
+            try {
+                return await request(url, {method: 'PUT', headers: {'X-Chunk-SHA256': checksum}, body: buffer});
+            } catch (error) {
+                if (attempt >= MAX_ATTEMPTS) {
+                    throw error;
+                }
+                await sleep(1000 * Math.pow(2, attempt));  // Back off, then resend the same bytes
+            }
+        }
+    }
+
+    async function openSession(baseUrl, file, storageKey) {
+        var saved = localStorage.getItem(storageKey);
+        if (saved) {
+            try {
+                var existing = await request(baseUrl + saved + '/');
+                if (existing.status !== 'failed') {
+                    return existing;
+                }
+            } catch (error) {
+                // Expired or finished elsewhere: start over
+            }
+            localStorage.removeItem(storageKey);
+        }
+        var session = await request(baseUrl, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({filename: file.name, size: file.size})
+        });
+        localStorage.setItem(storageKey, session.id);
+        return session;
+    }
+
+    async function waitForAssembly(url, status) {
+        for (;;) {
+            var session = await request(url);
+            if (session.status === 'complete') {
+                return session;
+            }
+            if (session.status === 'failed') {
+                throw new Error(session.error || 'Assembly failed');
+            }
+            status.textContent = 'Assembling…';
+            await sleep(POLL_INTERVAL);
+        }
+    }
+
+    async function upload(widget, file) {
+        var baseUrl = widget.dataset.url;
+        var hidden = widget.querySelector('input[type="hidden"]');
+        var status = widget.querySelector('.chunked-upload-status');
+        var storageKey = 'chunked-upload:' + [file.name, file.size, file.lastModified].join(':');
+
+        hidden.value = '';
+        var session = await openSession(baseUrl, file, storageKey);
+        var received = new Set(session.received);
+        var done = received.size;
+        for (var index = 0; index < session.chunks; index++) {
+            if (received.has(index)) {
+                continue;
+            }
+            var blob = file.slice(index * session.chunk_size, (index + 1) * session.chunk_size);
+            await sendChunk(baseUrl + session.id + '/chunks/' + index + '/', blob);
+            done++;
+            status.textContent = 'Uploading… ' + Math.floor(done / session.chunks * 100) + '%';
+        }
+        if (session.status === 'uploading') {
+            await request(baseUrl + session.id + '/complete/', {method: 'POST'});
+        }
+        try {
+            await waitForAssembly(baseUrl + session.id + '/', status);
+        } catch (error) {
+            localStorage.removeItem(storageKey);  // The chunks are no good; the next try starts afresh
+            throw error;
+        }
+        localStorage.removeItem(storageKey);
+        hidden.value = session.id;
+        status.textContent = 'Uploaded ' + file.name + '. Save to attach it.';
+    }
+
+    document.addEventListener('change', function (event) {
+        var input = event.target;
+        var widget = input.closest('.chunked-upload');
+        if (!widget || input.type !== 'file' || !input.files.length) {
+            return;
+        }
+        var status = widget.querySelector('.chunked-upload-status');
+        upload(widget, input.files[0]).catch(function (error) {
+            status.textContent = 'Upload paused: ' + error.message + '. Choose the same file again to resume.';
+        });
+    });
+}());